@@ -0,0 +1,152 @@
+import asyncio
+import json
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from pr_agent.log import get_logger
+
+logger = get_logger()
+
+# Weight of the newest sample in the moving average of how long an admitted call runs
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a tool call is turned away because the server is at capacity."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def to_response(self) -> str:
+        return json.dumps({"error": "busy", "message": str(self), "retry_after_seconds": self.retry_after})
+
+
+def parse_limits(value: str) -> Dict[str, int]:
+    """Parse `name=limit` pairs separated by commas, e.g. `review_pr=4,describe_pr=4`."""
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            tool, limit = item.split("=", 1)
+            limits[tool.strip()] = int(limit)
+    return limits
+
+
+class AdmissionController:
+    """
+    Bounds how many tool calls run at once, globally and per tool.
+
+    Calls over the limit wait in a queue of at most `queue_size` entries for up to
+    `queue_timeout` seconds. A call that finds the queue full, or times out in it, is
+    rejected with `AdmissionRejected`, carrying a retry-after estimate derived from the
+    queue length and the average time an admitted call runs.
+    """
+
+    def __init__(self, max_in_flight: int, tool_limits: Optional[Dict[str, int]] = None, queue_size: int = 32,
+                 queue_timeout: float = 30):
+        self.max_in_flight = max_in_flight
+        self.tool_limits = tool_limits or {}
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._condition = asyncio.Condition()
+        self._in_flight = 0
+        self._tool_in_flight: Dict[str, int] = {}
+        self._service_time = 0.0
+
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8")),
+            tool_limits=parse_limits(os.getenv("ADMISSION_TOOL_LIMITS", "")),
+            queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "32")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30")),
+        )
+
+    def _has_room(self, tool: str) -> bool:
+        limit = self.tool_limits.get(tool)
+        return (self._in_flight < self.max_in_flight
+                and (limit is None or self._tool_in_flight.get(tool, 0) < limit))
+
+    def retry_after(self) -> int:
+        """Seconds until the calls ahead in the queue are likely to have been admitted."""
+        rounds = (self.waiting + 1) / max(1, self.max_in_flight)
+        return max(1, math.ceil(rounds * (self._service_time or 1.0)))
+
+    def _reject(self, tool: str, reason: str) -> AdmissionRejected:
+        retry_after = self.retry_after()
+        logger.warning(f"Rejected {tool} call: {reason}, retry after {retry_after}s")
+        return AdmissionRejected(f"Server is busy ({reason}), retry after {retry_after} seconds", retry_after)
+
+    @asynccontextmanager
+    async def admit(self, tool: str, timeout: Optional[float] = None, queue: bool = True) -> AsyncIterator[None]:
+        """
+        Hold an admission slot for `tool` for the duration of the block.
+
+        Args:
+            tool: Name of the tool the call belongs to, for per-tool limits
+            timeout: Seconds to wait for a slot (defaults to `queue_timeout`); None waits indefinitely
+                when `queue` is False
+            queue: Whether the call counts against the bounded wait queue; background jobs, which are
+                queued by the job manager already, pass False
+        """
+        start = time.monotonic()
+        async with self._condition:
+            if not self._has_room(tool):
+                if queue and self.waiting >= self.queue_size:
+                    self.rejected_queue_full += 1
+                    raise self._reject(tool, f"{self.waiting} calls already waiting")
+                wait_timeout = timeout if timeout is not None else (self.queue_timeout if queue else None)
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(self._condition.wait_for(lambda: self._has_room(tool)), wait_timeout)
+                except asyncio.TimeoutError:
+                    self.rejected_timeout += 1
+                    raise self._reject(tool, f"no capacity within {wait_timeout:g}s")
+                finally:
+                    self.waiting -= 1
+            self._in_flight += 1
+            self._tool_in_flight[tool] = self._tool_in_flight.get(tool, 0) + 1
+            self.admitted += 1
+
+        admitted_at = time.monotonic()
+        waited = admitted_at - start
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - admitted_at
+            if self._service_time:
+                self._service_time += SERVICE_TIME_SMOOTHING * (elapsed - self._service_time)
+            else:
+                self._service_time = elapsed
+            async with self._condition:
+                self._in_flight -= 1
+                self._tool_in_flight[tool] -= 1
+                self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "tool_limits": self.tool_limits,
+            "in_flight": self._in_flight,
+            "in_flight_by_tool": {tool: count for tool, count in self._tool_in_flight.items() if count},
+            "queue_size": self.queue_size,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_seconds_avg": round(self.wait_seconds_total / self.admitted, 3) if self.admitted else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 3),
+            "service_seconds_avg": round(self._service_time, 3),
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Optional
+
+from pr_agent.log import get_logger
+
+if TYPE_CHECKING:
+    from pr_agent.agent.pr_agent import PRAgent
+
+logger = get_logger()
+
+DEFAULT_POOL_SIZE = int(os.getenv("PR_AGENT_POOL_SIZE", "4"))
+DEFAULT_ACQUIRE_TIMEOUT = float(os.getenv("PR_AGENT_POOL_ACQUIRE_TIMEOUT", "300"))
+DEFAULT_MAX_USES = int(os.getenv("PR_AGENT_POOL_MAX_USES", "0"))
+
+
+def _default_factory() -> "PRAgent":
+    # Imported on first use: PR-Agent pulls in every git provider and LiteLLM
+    from pr_agent.agent.pr_agent import PRAgent
+
+    from ai_handler import ServerAIHandler
+
+    return PRAgent(ai_handler=ServerAIHandler)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no agent becomes available within the acquire timeout."""
+
+
+class _PooledAgent:
+    def __init__(self, agent: "PRAgent"):
+        self.agent = agent
+        self.uses = 0
+        self.failed = False
+
+
+class AgentPool:
+    """
+    A bounded pool of `PRAgent` instances, which gates how many PR-Agent commands run at once.
+
+    Tool handlers check an agent out with `async with pool.agent() as agent:` and it is
+    returned to the pool when the block exits; callers beyond `size` wait up to
+    `acquire_timeout`. Constructing a `PRAgent` only stores its handler class, so the pool
+    saves little construction work; its purpose is the concurrency bound. Agents that
+    raised during their last request or reached `max_uses` are replaced instead of reused.
+    """
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+                 max_uses: int = DEFAULT_MAX_USES, factory: Callable[[], "PRAgent"] = _default_factory):
+        if size < 1:
+            raise ValueError(f"Agent pool size must be at least 1, got {size}")
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.max_uses = max_uses
+        self._factory = factory
+        self._idle: Optional[asyncio.Queue] = None
+        self._created = 0
+
+        self.checkouts = 0
+        self.replaced = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _queue(self) -> asyncio.Queue:
+        if self._idle is None:
+            self._idle = asyncio.Queue(maxsize=self.size)
+        return self._idle
+
+    def _new_agent(self) -> _PooledAgent:
+        self._created += 1
+        return _PooledAgent(self._factory())
+
+    def _reusable(self, pooled: _PooledAgent) -> bool:
+        return not pooled.failed and not (self.max_uses and pooled.uses >= self.max_uses)
+
+    async def fill(self) -> None:
+        """Construct agents up to the pool size, on a worker thread, so the first requests do not pay for it."""
+        queue = self._queue()
+        while self._created < self.size:
+            self._created += 1
+            try:
+                agent = await asyncio.to_thread(self._factory)
+            except BaseException:
+                self._created -= 1
+                raise
+            queue.put_nowait(_PooledAgent(agent))
+
+    async def _acquire(self) -> _PooledAgent:
+        queue = self._queue()
+        if queue.empty() and self._created < self.size:
+            return self._new_agent()
+        try:
+            return await asyncio.wait_for(queue.get(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeoutError(f"No PR-Agent instance available after {self.acquire_timeout:.0f}s")
+
+    def _release(self, pooled: _PooledAgent) -> None:
+        if not self._reusable(pooled):
+            self.replaced += 1
+            logger.debug(f"Replacing pooled PR-Agent after {pooled.uses} uses (failed={pooled.failed})")
+            pooled = _PooledAgent(self._factory())
+        self._queue().put_nowait(pooled)
+
+    @asynccontextmanager
+    async def agent(self) -> AsyncIterator["PRAgent"]:
+        """Check out an agent for the duration of the `async with` block."""
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            pooled = await self._acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.checkouts += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        pooled.uses += 1
+        try:
+            yield pooled.agent
+        except BaseException:
+            pooled.failed = True
+            raise
+        finally:
+            self._release(pooled)
+
+    def stats(self) -> Dict[str, float]:
+        idle = self._idle.qsize() if self._idle is not None else 0
+        return {
+            "size": self.size,
+            "created": self._created,
+            "idle": idle,
+            "in_use": self._created - idle,
+            "waiting": self.waiting,
+            "checkouts": self.checkouts,
+            "replaced": self.replaced,
+            "timeouts": self.timeouts,
+            "total_wait_seconds": round(self.total_wait_seconds, 6),
+            "avg_wait_seconds": round(self.total_wait_seconds / self.checkouts, 6) if self.checkouts else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 6),
+        }
@@ -0,0 +1,137 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+import openai
+from pr_agent.algo.ai_handlers.litellm_ai_handler import OPENAI_RETRIES, LiteLLMAIHandler
+from pr_agent.algo.token_handler import TokenEncoder
+from pr_agent.log import get_logger
+
+from executors import agent_loops
+from llm_cache import llm_cache
+from llm_limits import is_throttled, llm_limits, retry_after_seconds
+from metrics import llm_calls, llm_tokens
+from progress import current_tracker, stage
+
+logger = get_logger()
+
+# PR-Agent's completion without its tenacity decorator, which retries 429s back to back
+_chat_completion = getattr(LiteLLMAIHandler.chat_completion, "__wrapped__", LiteLLMAIHandler.chat_completion)
+
+_RETRYABLE_ERRORS = (openai.APIError, openai.APIConnectionError, openai.APITimeoutError)
+
+
+@dataclass
+class LLMUsage:
+    """Model calls made on behalf of one tool call; token counts are tokenizer estimates."""
+    calls: int = 0
+    cached_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+_current_usage: ContextVar[Optional[LLMUsage]] = ContextVar("llm_usage", default=None)
+
+
+@contextmanager
+def usage_scope() -> Iterator[LLMUsage]:
+    """Collect the LLM usage of everything run inside the block."""
+    usage = LLMUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    return len(TokenEncoder.get_token_encoder().encode(text))
+
+
+class ServerAIHandler(LiteLLMAIHandler):
+    """
+    LiteLLM handler used by the server's agents.
+
+    Completions are served from `llm_cache` when an identical prompt was already answered
+    by the same model and deployment. Calls are accounted to the current `usage_scope()` and
+    reported as the "llm" stage of the current progress tracker. Concurrency per deployment
+    is limited by `llm_limits`, which backs off on throttling responses, and each prompt's
+    estimated token cost is reserved from the deployment's tokens-per-minute budget, if set.
+    """
+
+    async def _completion(self, model: str, system: str, user: str, temperature: float, img_path: str,
+                          prompt_tokens: int):
+        """Send the prompt within the deployment's concurrency and TPM limits; returns the tokens reserved."""
+        name = self.deployment_id or model
+        limiter = llm_limits.limiter(name)
+        bucket = llm_limits.bucket(name)
+        attempt = 0
+        while True:
+            attempt += 1
+            reserved = 0
+            if bucket is not None:
+                reserved = bucket.estimate(prompt_tokens)
+                await bucket.reserve(reserved)
+            try:
+                async with limiter.slot():
+                    resp, finish_reason = await _chat_completion(self, model=model, system=system, user=user,
+                                                                 temperature=temperature, img_path=img_path)
+                limiter.on_success()
+                return resp, finish_reason, reserved
+            except BaseException as e:
+                # Failed and cancelled calls give their reservation back before any retry reserves again
+                if bucket is not None:
+                    bucket.refund(reserved)
+                if is_throttled(e):
+                    if bucket is not None:
+                        bucket.drain()
+                    if attempt > llm_limits.max_retries:
+                        raise
+                    await limiter.on_throttle(retry_after_seconds(e))
+                elif not isinstance(e, _RETRYABLE_ERRORS) or attempt >= OPENAI_RETRIES:
+                    raise
+
+    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2,
+                              img_path: str = None):
+        key = llm_cache.make_key(model, self.deployment_id, temperature, system, user, img_path)
+        usage = _current_usage.get()
+        tracker = current_tracker()
+        if tracker is not None:
+            tracker.start_unit("llm")
+        with stage("llm"):
+            cached = await asyncio.to_thread(llm_cache.get, key)
+            if cached is None:
+                # Counted here, on the agent thread, as the tokenizer blocks; the estimate is
+                # reserved against the deployment's TPM budget before the prompt is sent
+                prompt_tokens = count_tokens(system) + count_tokens(user)
+                # The request itself does not block, so it goes out from the server loop
+                resp, finish_reason, reserved = await agent_loops.on_server_loop(
+                    self._completion(model, system, user, temperature, img_path, prompt_tokens))
+        if tracker is not None:
+            tracker.advance("llm")
+        if cached is not None:
+            logger.debug(f"LLM cache hit for {model} ({key[:12]})")
+            llm_calls.inc(deployment=self.deployment_id or model, source="cache")
+            if usage is not None:
+                usage.cached_calls += 1
+            return cached
+
+        completion_tokens = count_tokens(resp)
+        name = self.deployment_id or model
+        llm_calls.inc(deployment=name, source="model")
+        llm_tokens.inc(prompt_tokens, deployment=name, direction="in")
+        llm_tokens.inc(completion_tokens, deployment=name, direction="out")
+        bucket = llm_limits.bucket(name)
+        if bucket is not None:
+            bucket.settle(reserved, prompt_tokens, completion_tokens)
+        if usage is not None:
+            usage.calls += 1
+            usage.prompt_tokens += prompt_tokens
+            usage.completion_tokens += completion_tokens
+        if finish_reason != "error":
+            await asyncio.to_thread(llm_cache.put, key, resp, finish_reason)
+        return resp, finish_reason
@@ -0,0 +1,194 @@
+"""
+Load driver for the PR-Agent MCP server.
+
+Opens one SSE session per concurrent client and calls the given tools on synthetic PRs
+served by `fake_github.py`, at each concurrency level in turn. Reports throughput and
+p50/p95/p99 latency per level and tool, and optionally writes them as JSON so runs of two
+versions can be compared.
+
+    python bench/driver.py --concurrency 1,4,16 --requests 32 --tools review_pr,describe_pr
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional, Tuple
+
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+
+@dataclass
+class Call:
+    tool: str
+    pr_url: str
+    seconds: float = 0.0
+    status: str = "ok"
+    detail: str = ""
+
+
+@dataclass
+class LevelResult:
+    concurrency: int
+    tool: str
+    calls: int
+    ok: int
+    errors: int
+    busy: int
+    seconds: float
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+    max: float
+    error_samples: List[str] = field(default_factory=list)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of `values`, 0.0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(p / 100 * len(ordered)))) - 1]
+
+
+def classify(text: str, is_error: bool) -> str:
+    if text.startswith('{"error": "busy"'):
+        return "busy"
+    if is_error or text.startswith("Error "):
+        return "error"
+    return "ok"
+
+
+async def client(server: str, queue: "asyncio.Queue[Call]", done: List[Call], timeout: float) -> None:
+    async with sse_client(server, sse_read_timeout=timeout) as streams:
+        async with ClientSession(*streams) as session:
+            await session.initialize()
+            while True:
+                try:
+                    call = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.monotonic()
+                try:
+                    result = await asyncio.wait_for(session.call_tool(call.tool, {"pr_url": call.pr_url}), timeout)
+                    text = "".join(getattr(item, "text", "") for item in result.content)
+                    call.status = classify(text, result.isError)
+                    if call.status != "ok":
+                        call.detail = text[:200]
+                except Exception as e:
+                    call.status = "error"
+                    call.detail = f"{type(e).__name__}: {e}"[:200]
+                call.seconds = time.monotonic() - start
+                done.append(call)
+
+
+async def run_level(server: str, concurrency: int, calls: List[Call], timeout: float) -> Tuple[List[Call], float,
+                                                                                             List[str]]:
+    queue: asyncio.Queue = asyncio.Queue()
+    for call in calls:
+        queue.put_nowait(call)
+    done: List[Call] = []
+    start = time.monotonic()
+    results = await asyncio.gather(*(client(server, queue, done, timeout) for _ in range(concurrency)),
+                                   return_exceptions=True)
+    session_errors = [f"session failed: {type(result).__name__}: {result}"[:200]
+                      for result in results if isinstance(result, BaseException)]
+    return done, time.monotonic() - start, session_errors
+
+
+def summarize(concurrency: int, done: List[Call], elapsed: float) -> List[LevelResult]:
+    results = []
+    for tool in sorted({call.tool for call in done}):
+        calls = [call for call in done if call.tool == tool]
+        latencies = [call.seconds for call in calls if call.status == "ok"]
+        results.append(LevelResult(
+            concurrency=concurrency,
+            tool=tool,
+            calls=len(calls),
+            ok=len(latencies),
+            errors=sum(1 for call in calls if call.status == "error"),
+            busy=sum(1 for call in calls if call.status == "busy"),
+            seconds=round(elapsed, 3),
+            throughput=round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+            p50=round(percentile(latencies, 50), 3),
+            p95=round(percentile(latencies, 95), 3),
+            p99=round(percentile(latencies, 99), 3),
+            max=round(max(latencies), 3) if latencies else 0.0,
+            error_samples=[call.detail for call in calls if call.status != "ok"][:3],
+        ))
+    return results
+
+
+def print_table(results: List[LevelResult]) -> None:
+    header = f"{'conc':>5} {'tool':<24} {'calls':>6} {'ok':>5} {'err':>5} {'busy':>5} {'req/s':>8} " \
+             f"{'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'max s':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r.concurrency:>5} {r.tool:<24} {r.calls:>6} {r.ok:>5} {r.errors:>5} {r.busy:>5} "
+              f"{r.throughput:>8.3f} {r.p50:>8.2f} {r.p95:>8.2f} {r.p99:>8.2f} {r.max:>8.2f}")
+    for r in results:
+        for sample in r.error_samples:
+            print(f"  [{r.concurrency} {r.tool}] {sample}")
+
+
+async def main_async(args: argparse.Namespace) -> List[LevelResult]:
+    tools = [tool.strip() for tool in args.tools.split(",") if tool.strip()]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    numbers = itertools.count(args.first_pr)
+    pool: Optional[List[int]] = list(range(args.first_pr, args.first_pr + args.pr_pool)) if args.pr_pool else None
+
+    results: List[LevelResult] = []
+    for level in levels:
+        calls = []
+        for index in range(args.requests):
+            # Fresh PR numbers measure uncached work; a fixed pool measures the caches and coalescing
+            number = pool[index % len(pool)] if pool else next(numbers)
+            pr_url = f"{args.github.rstrip('/')}/{args.repo}/pull/{number}"
+            calls.append(Call(tool=tools[index % len(tools)], pr_url=pr_url))
+        done, elapsed, session_errors = await run_level(args.server, level, calls, args.timeout)
+        level_results = summarize(level, done, elapsed)
+        print_table(level_results)
+        for error in session_errors[:3]:
+            print(f"  [{level}] {error}")
+        print()
+        results.extend(level_results)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default="http://127.0.0.1:8000/sse", help="SSE endpoint of the MCP server")
+    parser.add_argument("--github", default="http://127.0.0.1:8401", help="Base URL of the fake GitHub server")
+    parser.add_argument("--repo", default="bench/synthetic")
+    parser.add_argument("--tools", default="review_pr,describe_pr", help="Tools to call, round robin")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated numbers of concurrent sessions")
+    parser.add_argument("--requests", type=int, default=32, help="Tool calls per concurrency level")
+    parser.add_argument("--first-pr", type=int, default=int(time.time()) % 100000 * 1000,
+                        help="First synthetic PR number (defaults to a fresh range per run)")
+    parser.add_argument("--pr-pool", type=int, default=0,
+                        help="Reuse this many PRs instead of a fresh PR per call")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds before a call counts as failed")
+    parser.add_argument("--json", dest="json_path", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": vars(args), "results": [asdict(r) for r in results]}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    # Numbers without a single successful call measure a broken setup, not the server
+    failed = sorted({f"{r.tool} at concurrency {r.concurrency}" for r in results if not r.ok})
+    if failed:
+        print(f"No successful calls for {', '.join(failed)}; see the error samples above")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Local stand-in for the GitHub REST API, serving synthetic pull requests.
+
+Any `owner/repo` and PR number is accepted; the PR's files, patches and file contents are
+generated deterministically from the number, so repeated runs review the same code.
+Comments, description edits and labels are accepted and discarded. Point the server at
+it with `GITHUB__BASE_URL=http://127.0.0.1:8401/api/v3` and use PR URLs of the form
+`http://127.0.0.1:8401/<owner>/<repo>/pull/<number>`.
+
+    python bench/fake_github.py --port 8401 --files 20 --lines 120
+"""
+import argparse
+import base64
+import difflib
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = "/api/v3"
+
+_WORDS = ("value", "count", "items", "result", "config", "client", "buffer", "offset", "request", "payload")
+
+
+def _sha(*parts: Any) -> str:
+    return hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+class SyntheticPR:
+    """Files of one synthetic PR: base and head contents and the patch between them."""
+
+    def __init__(self, repo: str, number: int, files: int, lines: int):
+        self.repo = repo
+        self.number = number
+        self.base_sha = _sha(repo, number, "base")
+        self.head_sha = _sha(repo, number, "head")
+        rng = random.Random(f"{repo}#{number}")
+        self.files: List[Dict[str, Any]] = []
+        for index in range(files):
+            filename = f"src/pkg_{number}/module_{index}.py"
+            base = self._module(rng, index, lines)
+            head = self._change(rng, base)
+            diff = list(difflib.unified_diff(base.splitlines(), head.splitlines(), lineterm="", n=3))[2:]
+            self.files.append({
+                "filename": filename,
+                "base": base,
+                "head": head,
+                "patch": "\n".join(diff),
+                "additions": sum(1 for line in diff if line.startswith("+")),
+                "deletions": sum(1 for line in diff if line.startswith("-")),
+            })
+
+    @staticmethod
+    def _module(rng: random.Random, index: int, lines: int) -> str:
+        body = [f'"""Synthetic module {index}."""', "", "import os", ""]
+        function = 0
+        while len(body) < lines:
+            name = f"{rng.choice(_WORDS)}_{function}"
+            body += [f"def {name}({rng.choice(_WORDS)}, {rng.choice(_WORDS)}=None):",
+                     f'    """Compute the {name} of the input."""']
+            for _ in range(rng.randint(3, 8)):
+                body.append(f"    {rng.choice(_WORDS)} = {rng.choice(_WORDS)} + {rng.randint(1, 100)}")
+            body += [f"    return {rng.choice(_WORDS)}", ""]
+            function += 1
+        return "\n".join(body) + "\n"
+
+    @staticmethod
+    def _change(rng: random.Random, base: str) -> str:
+        lines = base.splitlines()
+        for _ in range(max(1, len(lines) // 20)):
+            position = rng.randrange(4, len(lines))
+            if rng.random() < 0.7:
+                lines.insert(position, f"    {rng.choice(_WORDS)} = {rng.choice(_WORDS)} * {rng.randint(2, 9)}")
+            elif lines[position].startswith("    "):
+                lines[position] = lines[position].replace("+", "-", 1)
+        return "\n".join(lines) + "\n"
+
+
+class FakeGitHub:
+    def __init__(self, host: str, port: int, files: int, lines: int, latency: float):
+        self.base = f"http://{host}:{port}"
+        self.api = self.base + API_PREFIX
+        self.files = files
+        self.lines = lines
+        self.latency = latency
+        self._prs: Dict[Tuple[str, int], SyntheticPR] = {}
+        self._lock = threading.Lock()
+        self._comment_ids = iter(range(1, 1 << 62))
+        self.requests = 0
+
+    def pr(self, repo: str, number: int) -> SyntheticPR:
+        with self._lock:
+            key = (repo, number)
+            if key not in self._prs:
+                self._prs[key] = SyntheticPR(repo, number, self.files, self.lines)
+            return self._prs[key]
+
+    def _user(self) -> Dict[str, Any]:
+        return {"login": "bench", "id": 1, "type": "User", "url": f"{self.api}/users/bench"}
+
+    def _repo(self, repo: str) -> Dict[str, Any]:
+        return {"id": 1, "name": repo.split("/")[1], "full_name": repo, "private": False,
+                "owner": {**self._user(), "login": repo.split("/")[0]}, "default_branch": "main",
+                "url": f"{self.api}/repos/{repo}", "html_url": f"{self.base}/{repo}"}
+
+    def _ref(self, repo: str, ref: str, sha: str) -> Dict[str, Any]:
+        return {"ref": ref, "sha": sha, "label": f"{repo.split('/')[0]}:{ref}", "repo": self._repo(repo),
+                "user": self._user()}
+
+    def _pull(self, pr: SyntheticPR) -> Dict[str, Any]:
+        url = f"{self.api}/repos/{pr.repo}/pulls/{pr.number}"
+        return {
+            "id": pr.number, "number": pr.number, "state": "open", "title": f"Synthetic change #{pr.number}",
+            "body": f"Benchmark PR touching {len(pr.files)} files.", "user": self._user(), "labels": [],
+            "url": url, "html_url": f"{self.base}/{pr.repo}/pull/{pr.number}",
+            "issue_url": f"{self.api}/repos/{pr.repo}/issues/{pr.number}",
+            "head": self._ref(pr.repo, f"bench-{pr.number}", pr.head_sha),
+            "base": self._ref(pr.repo, "main", pr.base_sha),
+            "commits": 1, "changed_files": len(pr.files),
+            "additions": sum(f["additions"] for f in pr.files), "deletions": sum(f["deletions"] for f in pr.files),
+            "created_at": "2024-01-01T00:00:00Z", "updated_at": "2024-01-01T00:00:00Z",
+        }
+
+    def _commit(self, pr: SyntheticPR) -> Dict[str, Any]:
+        return {"sha": pr.head_sha, "url": f"{self.api}/repos/{pr.repo}/commits/{pr.head_sha}",
+                "html_url": f"{self.base}/{pr.repo}/commit/{pr.head_sha}",
+                "commit": {"message": f"Synthetic change #{pr.number}",
+                           "author": {"name": "bench", "date": "2024-01-01T00:00:00Z"},
+                           "committer": {"name": "bench", "date": "2024-01-01T00:00:00Z"}},
+                "author": self._user(), "committer": self._user(), "parents": [{"sha": pr.base_sha}]}
+
+    def _file(self, pr: SyntheticPR, file: Dict[str, Any]) -> Dict[str, Any]:
+        return {"sha": _sha(file["filename"], pr.head_sha), "filename": file["filename"], "status": "modified",
+                "additions": file["additions"], "deletions": file["deletions"],
+                "changes": file["additions"] + file["deletions"], "patch": file["patch"],
+                "blob_url": f"{self.base}/{pr.repo}/blob/{pr.head_sha}/{file['filename']}",
+                "raw_url": f"{self.base}/{pr.repo}/raw/{pr.head_sha}/{file['filename']}",
+                "contents_url": f"{self.api}/repos/{pr.repo}/contents/{file['filename']}?ref={pr.head_sha}"}
+
+    def _comment(self, repo: str, number: int, body: str) -> Dict[str, Any]:
+        comment_id = next(self._comment_ids)
+        return {"id": comment_id, "body": body, "user": self._user(),
+                "url": f"{self.api}/repos/{repo}/issues/comments/{comment_id}",
+                "html_url": f"{self.base}/{repo}/pull/{number}#issuecomment-{comment_id}",
+                "issue_url": f"{self.api}/repos/{repo}/issues/{number}",
+                "created_at": "2024-01-01T00:00:00Z", "updated_at": "2024-01-01T00:00:00Z"}
+
+    def _contents(self, repo: str, path: str, ref: Optional[str]) -> Optional[Dict[str, Any]]:
+        match = re.match(r"src/pkg_(\d+)/", path)
+        if not match:
+            return None
+        pr = self.pr(repo, int(match.group(1)))
+        file = next((f for f in pr.files if f["filename"] == path), None)
+        if file is None:
+            return None
+        content = (file["head"] if ref == pr.head_sha else file["base"]).encode()
+        return {"type": "file", "encoding": "base64", "content": base64.b64encode(content).decode(),
+                "size": len(content), "name": path.rsplit("/", 1)[-1], "path": path,
+                "sha": _sha(path, ref), "url": f"{self.api}/repos/{repo}/contents/{path}"}
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]],
+               body: Dict[str, Any]) -> Tuple[int, Any]:
+        """Answer one API request; returns the status code and the JSON body."""
+        parts = [part for part in path.split("/") if part]
+        if parts == ["user"]:
+            return 200, self._user()
+        if parts == ["rate_limit"]:
+            return 200, {"resources": {"core": {"limit": 5000, "remaining": 5000, "reset": 0}}}
+        if len(parts) < 3 or parts[0] != "repos":
+            return 404, {"message": "Not Found"}
+
+        repo, rest = f"{parts[1]}/{parts[2]}", parts[3:]
+        if not rest:
+            return 200, self._repo(repo)
+        if rest == ["languages"]:
+            return 200, {"Python": 100000}
+        if rest[0] == "contents":
+            contents = self._contents(repo, "/".join(rest[1:]), query.get("ref", [None])[0])
+            return (200, contents) if contents else (404, {"message": "Not Found"})
+        if rest[0] == "compare" and len(rest) == 2:
+            base_sha, _, _ = rest[1].partition("...")
+            commit = {"sha": base_sha, "url": f"{self.api}/repos/{repo}/commits/{base_sha}",
+                      "commit": {"message": "base"}, "parents": []}
+            return 200, {"status": "ahead", "ahead_by": 1, "behind_by": 0, "total_commits": 0,
+                         "base_commit": commit, "merge_base_commit": commit, "commits": [], "files": []}
+        if rest[0] == "pulls" and len(rest) >= 2 and rest[1].isdigit():
+            pr = self.pr(repo, int(rest[1]))
+            if len(rest) == 2:
+                if method == "PATCH":
+                    return 200, {**self._pull(pr), **{k: v for k, v in body.items() if k in ("title", "body")}}
+                return 200, self._pull(pr)
+            if rest[2] == "files":
+                return 200, [self._file(pr, file) for file in pr.files]
+            if rest[2] == "commits":
+                return 200, [self._commit(pr)]
+            if rest[2] == "comments":
+                return (201, self._comment(repo, pr.number, body.get("body", ""))) if method == "POST" else (200, [])
+            if rest[2] == "reviews":
+                return (200, {"id": 1, "body": body.get("body", "")}) if method == "POST" else (200, [])
+        if rest[0] == "issues" and len(rest) >= 2:
+            if rest[1] == "comments":
+                if method == "DELETE":
+                    return 204, None
+                comment_id = int(rest[2]) if len(rest) > 2 and rest[2].isdigit() else 0
+                return 200, {**self._comment(repo, 0, body.get("body", "")), "id": comment_id}
+            if rest[1].isdigit() and len(rest) == 3 and rest[2] == "comments":
+                return (201, self._comment(repo, int(rest[1]), body.get("body", ""))) if method == "POST" else (200, [])
+            if rest[1].isdigit() and len(rest) == 3 and rest[2] == "labels":
+                return 200, [{"name": label.get("name", label) if isinstance(label, dict) else label}
+                             for label in (body if isinstance(body, list) else [])]
+            if rest[1].isdigit() and len(rest) == 3 and rest[2] == "reactions":
+                return 201, {"id": 1, "content": body.get("content", "")}
+        return 404, {"message": "Not Found"}
+
+
+def make_handler(github: FakeGitHub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _serve(self) -> None:
+            github.requests += 1
+            if github.latency:
+                time.sleep(github.latency)
+            parsed = urlparse(self.path)
+            path = parsed.path[len(API_PREFIX):] if parsed.path.startswith(API_PREFIX) else parsed.path
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                body = {}
+            status, payload = github.handle(self.command, path, parse_qs(parsed.query), body)
+            if status == 404:
+                print(f"fake_github: no route for {self.command} {parsed.path}", file=sys.stderr)
+
+            data = b"" if payload is None else json.dumps(payload).encode()
+            etag = f'"{hashlib.md5(data).hexdigest()}"'
+            if self.command == "GET" and status == 200 and self.headers.get("If-None-Match") == etag:
+                status, data = 304, b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("ETag", etag)
+            self.send_header("X-RateLimit-Limit", "5000")
+            self.send_header("X-RateLimit-Remaining", str(max(0, 5000 - github.requests % 5000)))
+            self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+            self.send_header("X-RateLimit-Resource", "core")
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _serve
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8401)
+    parser.add_argument("--files", type=int, default=20, help="Changed files per PR")
+    parser.add_argument("--lines", type=int, default=120, help="Lines per file")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+
+    github = FakeGitHub(args.host, args.port, args.files, args.lines, args.latency)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(github))
+    print(f"Fake GitHub API on {github.api} ({args.files} files x {args.lines} lines per PR)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions endpoint.
+
+Answers `/review` prompts with a review YAML and `/describe` prompts with a description
+YAML that reference the files found in the prompt, so PR-Agent parses and renders them like
+real answers. Latency is modelled as a time to first token plus a token generation rate;
+streamed (`"stream": true`) and plain requests are both supported, under `/v1/chat/completions`
+and Azure's `/openai/deployments/<name>/chat/completions`. A share of requests can be
+throttled with HTTP 429 to exercise the server's back-off.
+
+    python bench/fake_llm.py --port 8402 --ttft 0.8 --tokens-per-second 60
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List
+
+_FILE_HEADER = re.compile(r"^## File: '([^']+)'", re.MULTILINE)
+
+
+def review_yaml(files: List[str], rng: random.Random) -> str:
+    issues = []
+    for filename in files[:3]:
+        start = rng.randint(3, 30)
+        issues.append(f"""  - relevant_file: |
+      {filename}
+    issue_header: |
+      Possible Bug
+    issue_content: |
+      The new assignment in {filename} overwrites a value that is used later in the function.
+    start_line: {start}
+    end_line: {start + 2}""")
+    return f"""```yaml
+review:
+  estimated_effort_to_review_[1-5]: |
+    {rng.randint(1, 5)}
+  relevant_tests: |
+    No
+  key_issues_to_review:
+{chr(10).join(issues) if issues else "  []"}
+  security_concerns: |
+    No
+```"""
+
+
+def describe_yaml(files: List[str], rng: random.Random) -> str:
+    entries = []
+    for filename in files[:20]:
+        entries.append(f"""- filename: |
+    {filename}
+  changes_summary: |
+    Adds intermediate computations to the helper functions of the module.
+  changes_title: |
+    Extend helper computations
+  label: |
+    enhancement""")
+    return f"""```yaml
+type:
+- Enhancement
+description: |
+  - Extends the helper functions of {len(files)} modules
+  - Adds intermediate values to several computations
+title: |
+  Extend helper computations across modules
+pr_files:
+{chr(10).join(entries)}
+```"""
+
+
+def answer(messages: List[Dict[str, Any]], seed: str) -> str:
+    prompt = "\n".join(str(message.get("content", "")) for message in messages)
+    files = list(dict.fromkeys(_FILE_HEADER.findall(prompt)))
+    rng = random.Random(seed)
+    if "PRDescription" in prompt or "pr_files" in prompt:
+        return describe_yaml(files, rng)
+    return review_yaml(files, rng)
+
+
+def _tokens(text: str) -> Iterator[str]:
+    """Split text into pieces of about one token (four characters)."""
+    for start in range(0, len(text), 4):
+        yield text[start:start + 4]
+
+
+class FakeLLM:
+    def __init__(self, ttft: float, tokens_per_second: float, throttle_rate: float, retry_after: float):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+    def should_throttle(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            if random.random() < self.throttle_rate:
+                self.throttled += 1
+                return True
+        return False
+
+
+def make_handler(llm: FakeLLM):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _json(self, status: int, payload: Any, headers: Dict[str, str] = None) -> None:
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+            if llm.should_throttle():
+                self._json(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit_exceeded"}},
+                           {"Retry-After": str(llm.retry_after)})
+                return
+
+            messages = request.get("messages", [])
+            model = request.get("model", "fake")
+            content = answer(messages, seed=json.dumps(messages)[:2000])
+            pieces = list(_tokens(content))
+            prompt_tokens = len(json.dumps(messages)) // 4
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            created = int(time.time())
+            time.sleep(llm.ttft)
+
+            if not request.get("stream"):
+                time.sleep(len(pieces) / llm.tokens_per_second)
+                self._json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                              "total_tokens": prompt_tokens + len(pieces)},
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def send(delta: Dict[str, Any], finish_reason: Any = None) -> None:
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+
+            send({"role": "assistant", "content": ""})
+            for piece in pieces:
+                time.sleep(1 / llm.tokens_per_second)
+                send({"content": piece})
+            send({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def do_GET(self) -> None:
+            # The server's warm-up lists models to check the key
+            if self.path.split("?", 1)[0].rstrip("/").endswith("/models"):
+                self._json(200, {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "bench"}]})
+                return
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8402)
+    parser.add_argument("--ttft", type=float, default=0.8, help="Seconds until the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="Generation rate after the first token")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of throttled requests, seconds")
+    args = parser.parse_args()
+
+    llm = FakeLLM(args.ttft, args.tokens_per_second, args.throttle_rate, args.retry_after)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(llm))
+    print(f"Fake LLM endpoint on http://{args.host}:{args.port}/v1 "
+          f"(first token after {args.ttft}s, {args.tokens_per_second} tokens/s)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Coroutine, Deque, Dict, List, Optional, TypeVar
+
+from pr_agent.log import get_logger
+
+from metrics import loop_lag_seconds
+
+logger = get_logger()
+
+T = TypeVar("T")
+
+# Event loop lag above this is counted as a stall
+STALL_THRESHOLD = 0.1
+
+
+class AgentLoops:
+    """
+    A fixed set of threads, each running its own event loop, for PR-Agent runs.
+
+    PR-Agent's tools are coroutines, but the git provider and tokenizer calls inside them
+    block. `run()` executes a coroutine on an idle agent loop and waits for it from the
+    server loop, so a review fetching files stalls only its own thread. At most `size`
+    runs execute at once; further runs wait for a free loop. Context variables (settings,
+    PR session, progress) are carried over to the agent loop. Coroutines that do not
+    block, such as LLM calls, can be sent back to the server loop with `on_server_loop()`.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.server_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._idle: Optional[asyncio.Queue] = None
+        self._loops: List[asyncio.AbstractEventLoop] = []
+        self._start_lock = threading.Lock()
+
+        self.runs = 0
+        self.busy = 0
+        self.waiting = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @classmethod
+    def from_env(cls) -> "AgentLoops":
+        return cls(size=int(os.getenv("AGENT_LOOP_THREADS", os.getenv("PR_AGENT_POOL_SIZE", "4"))))
+
+    def start(self) -> None:
+        """Start the agent threads; must be called on the server loop (done lazily by `run`)."""
+        with self._start_lock:
+            if self._idle is not None:
+                return
+            self.server_loop = asyncio.get_running_loop()
+            self._idle = asyncio.Queue()
+            for index in range(self.size):
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=self._serve, args=(loop,), name=f"agent-loop-{index}", daemon=True).start()
+                self._loops.append(loop)
+                self._idle.put_nowait(loop)
+
+    @staticmethod
+    def _serve(loop: asyncio.AbstractEventLoop) -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run the coroutine returned by `fn` on an agent loop and return its result."""
+        self.start()
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            loop = await self._idle.get()
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+        self.runs += 1
+        self.busy += 1
+        try:
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(fn(), loop))
+        finally:
+            self.busy -= 1
+            self._idle.put_nowait(loop)
+
+    async def on_server_loop(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Await `coro` on the server loop, wherever the caller runs."""
+        loop = self.server_loop
+        if loop is None or loop is asyncio.get_running_loop():
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threads": self.size,
+            "busy": self.busy,
+            "waiting": self.waiting,
+            "runs": self.runs,
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+            "wait_seconds_avg": round(self.wait_seconds_total / self.runs, 3) if self.runs else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 3),
+        }
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the server loop wakes up from a sleep of `interval` seconds.
+
+    Lag is time the loop spent running something else, typically blocking code; the
+    most recent `window` samples are kept for percentiles.
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 1000):
+        self.interval = interval
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    @classmethod
+    def from_env(cls) -> "LoopLagMonitor":
+        return cls(interval=float(os.getenv("LOOP_LAG_INTERVAL", "0.5")))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._measure())
+
+    async def _measure(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - start - self.interval)
+            self._samples.append(lag)
+            loop_lag_seconds.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= STALL_THRESHOLD:
+                self.stalls += 1
+                logger.debug(f"Event loop stalled for {lag:.3f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        samples = sorted(self._samples)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {
+            "interval_seconds": self.interval,
+            "samples": len(samples),
+            "last_ms": round(self._samples[-1] * 1000, 2) if self._samples else 0.0,
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_lag * 1000, 2),
+            "stalls": self.stalls,
+        }
+
+
+def install_blocking_executor(loop: asyncio.AbstractEventLoop) -> ThreadPoolExecutor:
+    """Give the server loop a bounded default executor for `asyncio.to_thread` calls."""
+    executor = ThreadPoolExecutor(max_workers=int(os.getenv("BLOCKING_IO_THREADS", "16")),
+                                  thread_name_prefix="blocking-io")
+    loop.set_default_executor(executor)
+    return executor
+
+
+agent_loops = AgentLoops.from_env()
+loop_lag = LoopLagMonitor.from_env()
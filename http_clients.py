@@ -0,0 +1,177 @@
+import importlib.util
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import requests
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester
+from pr_agent.log import get_logger
+from requests.adapters import HTTPAdapter
+
+logger = get_logger()
+
+
+class SharedHTTPClients:
+    """
+    Process-wide HTTP connection pools for the git provider and the LLM endpoint.
+
+    PyGithub and the OpenAI SDK otherwise build a new client, and so a new TLS connection,
+    for every provider and handler instance. Here all GitHub calls (PyGithub and the
+    server's own) share one `requests` session whose pool keeps up to `max_per_host`
+    connections alive per host, and LiteLLM's Azure/OpenAI calls share one `httpx`
+    async client, which speaks HTTP/2 when the `h2` package is installed. The async
+    client is used on the server event loop only; see `AgentLoops.on_server_loop`.
+    PyGithub clients given a `retry` policy get a session of their own per policy, with the
+    same pool sizes, so the policy applies to their calls only.
+    """
+
+    def __init__(self, max_per_host: int = 20, max_hosts: int = 10, keepalive_expiry: float = 60,
+                 http2: bool = True):
+        self.max_per_host = max_per_host
+        self.max_hosts = max_hosts
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self._lock = threading.Lock()
+        self._async_requests: Dict[str, int] = {}
+        self._async_versions: Dict[str, int] = {}
+        self._rate_limits: Dict[str, Dict[str, int]] = {}
+        # Retry policy (repr) -> (adapter, session) for PyGithub clients configured with one
+        self._retry_sessions: Dict[str, Tuple[HTTPAdapter, requests.Session]] = {}
+
+        self.adapter, self.session = self._new_session()
+        self.async_client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(max_connections=max_per_host * max_hosts,
+                                max_keepalive_connections=max_per_host,
+                                keepalive_expiry=keepalive_expiry),
+            timeout=httpx.Timeout(600, connect=10),
+            event_hooks={"response": [self._count_async_response]},
+        )
+
+    def _new_session(self, retry: Any = 0) -> Tuple[HTTPAdapter, requests.Session]:
+        adapter = HTTPAdapter(pool_connections=self.max_hosts, pool_maxsize=self.max_per_host, pool_block=True,
+                              max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.hooks["response"].append(self._track_rate_limit)
+        return adapter, session
+
+    def session_for(self, retry: Any = None) -> requests.Session:
+        """The shared session, or the pooled session applying PyGithub's `retry` policy (an int or urllib3 `Retry`)."""
+        if retry is None:
+            return self.session
+        # Equal policies share a session even though each PyGithub client builds its own object
+        key = repr(retry) if isinstance(retry, int) else repr(sorted(vars(retry).items()))
+        with self._lock:
+            if key not in self._retry_sessions:
+                self._retry_sessions[key] = self._new_session(retry)
+            return self._retry_sessions[key][1]
+
+    @classmethod
+    def from_env(cls) -> "SharedHTTPClients":
+        return cls(
+            max_per_host=int(os.getenv("HTTP_POOL_MAX_PER_HOST", "20")),
+            max_hosts=int(os.getenv("HTTP_POOL_MAX_HOSTS", "10")),
+            keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")),
+            http2=os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes"),
+        )
+
+    async def _count_async_response(self, response: httpx.Response) -> None:
+        with self._lock:
+            host = response.request.url.host
+            self._async_requests[host] = self._async_requests.get(host, 0) + 1
+            self._async_versions[response.http_version] = self._async_versions.get(response.http_version, 0) + 1
+
+    def _track_rate_limit(self, response: requests.Response, *args: Any, **kwargs: Any) -> None:
+        headers = response.headers
+        if "X-RateLimit-Remaining" not in headers:
+            return
+        try:
+            limit = {
+                "limit": int(headers.get("X-RateLimit-Limit", 0)),
+                "remaining": int(headers["X-RateLimit-Remaining"]),
+                "reset": int(headers.get("X-RateLimit-Reset", 0)),
+            }
+        except ValueError:
+            return
+        with self._lock:
+            self._rate_limits[headers.get("X-RateLimit-Resource", "core")] = limit
+
+    def rate_limits(self) -> Dict[str, Dict[str, int]]:
+        """GitHub's rate limit per resource (core, search, ...) as of the latest response."""
+        with self._lock:
+            return {resource: dict(limit) for resource, limit in self._rate_limits.items()}
+
+    def install(self) -> None:
+        """
+        Route PyGithub's connections and LiteLLM's async OpenAI clients through the shared pools.
+
+        PyGithub's `retry` is honoured through `session_for()`; its `pool_size` is not, the
+        shared pools are sized by `max_per_host` instead.
+        """
+        clients = self
+
+        class PooledHTTPSConnection(HTTPSRequestsConnectionClass):
+            def __init__(self, host, port: Optional[int] = None, strict: bool = False, timeout: Optional[int] = None,
+                         retry=None, pool_size: Optional[int] = None, **kwargs: Any):
+                self.port = port if port else 443
+                self.host = host
+                self.protocol = "https"
+                self.timeout = timeout
+                self.verify = kwargs.get("verify", True)
+                self.retry = retry
+                self.session = clients.session_for(retry)
+
+        class PooledHTTPConnection(HTTPRequestsConnectionClass):
+            def __init__(self, host, port: Optional[int] = None, strict: bool = False, timeout: Optional[int] = None,
+                         retry=None, pool_size: Optional[int] = None, **kwargs: Any):
+                self.port = port if port else 80
+                self.host = host
+                self.protocol = "http"
+                self.timeout = timeout
+                self.verify = kwargs.get("verify", True)
+                self.retry = retry
+                self.session = clients.session_for(retry)
+
+        Requester.injectConnectionClasses(PooledHTTPConnection, PooledHTTPSConnection)
+        import litellm
+
+        litellm.aclient_session = self.async_client
+        logger.info(f"Shared HTTP pools installed ({self.max_per_host} connections per host, "
+                    f"HTTP/2 {'on' if self.http2 else 'off'})")
+
+    async def aclose(self) -> None:
+        await self.async_client.aclose()
+        self.session.close()
+        with self._lock:
+            for _, session in self._retry_sessions.values():
+                session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        hosts: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            adapters = [self.adapter] + [adapter for adapter, _ in self._retry_sessions.values()]
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    host = hosts.setdefault(pool.host, {"connections_opened": 0, "requests": 0})
+                    host["connections_opened"] += pool.num_connections
+                    host["requests"] += pool.num_requests
+        with self._lock:
+            async_requests = dict(self._async_requests)
+            async_versions = dict(self._async_versions)
+        return {
+            "max_per_host": self.max_per_host,
+            "http2": self.http2,
+            "sync_hosts": hosts,
+            "async_requests_by_host": async_requests,
+            "async_requests_by_http_version": async_versions,
+            "github_rate_limit": self.rate_limits(),
+        }
+
+
+http_clients = SharedHTTPClients.from_env()
@@ -0,0 +1,75 @@
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.log import get_logger
+
+logger = get_logger()
+
+_EDIT_TYPES = {
+    "added": EDIT_TYPE.ADDED,
+    "removed": EDIT_TYPE.DELETED,
+    "renamed": EDIT_TYPE.RENAMED,
+    "modified": EDIT_TYPE.MODIFIED,
+}
+
+
+def _patch_info(file) -> FilePatchInfo:
+    """The compare API's hunks for one file; file contents are not fetched."""
+    return FilePatchInfo(
+        base_file="",
+        head_file="",
+        patch=file.patch,
+        filename=file.filename,
+        edit_type=_EDIT_TYPES.get(file.status, EDIT_TYPE.UNKNOWN),
+        old_filename=getattr(file, "previous_filename", None),
+        num_plus_lines=file.additions,
+        num_minus_lines=file.deletions,
+    )
+
+
+def use_compare_range(provider, since_sha: str) -> None:
+    """
+    Make `/review -i` on `provider` cover the commits pushed after `since_sha`.
+
+    PR-Agent finds the base of an incremental review by looking for its own earlier review
+    comment and comparing commit dates. Here the base is the head SHA the server last
+    reviewed, and the changed files and their hunks come from one compare call between it
+    and the PR head. Only those hunks are sent to the model. If `since_sha` is no longer an
+    ancestor of the head (force push or rebase), the review falls back to the whole PR.
+    """
+    if not hasattr(provider, "get_incremental_commits") or not hasattr(provider, "_get_repo"):
+        return
+    # Importing any git provider module loads all of them, so only once there is a provider
+    from pr_agent.git_providers.git_provider import IncrementalPR
+
+    def get_incremental_commits(incremental: IncrementalPR = IncrementalPR(False)):
+        provider.incremental = incremental
+        if not incremental.is_incremental:
+            return
+        provider.unreviewed_files_set = {}
+        try:
+            compare = provider._get_repo().compare(since_sha, provider.pr.head.sha)
+        except Exception as e:
+            logger.warning(f"Failed to compare {since_sha} with the PR head, reviewing the whole PR: {e}")
+            incremental.is_incremental = False
+            return
+        if compare.status != "ahead":
+            logger.info(f"Commit {since_sha} is {compare.status} of the PR head, reviewing the whole PR")
+            incremental.is_incremental = False
+            return
+
+        commits = list(compare.commits)
+        files = list(compare.files)
+        incremental.commits_range = commits
+        incremental.first_new_commit = commits[0] if commits else None
+        incremental.last_seen_commit = compare.base_commit
+        provider.unreviewed_files_set = {file.filename: file for file in files}
+        provider.diff_files = [_patch_info(file) for file in files if file.patch]
+        logger.info(f"Incremental review since {since_sha}: {len(commits)} commits, {len(files)} files")
+
+    provider.get_incremental_commits = get_incremental_commits
+
+
+def merge_reviews(new_review: str, earlier_review: str, since_sha: str) -> str:
+    """Put the review of the new commits in front of the stored review it builds on."""
+    return (f"{new_review}\n\n"
+            f"## Earlier review (up to commit {since_sha[:7]})\n\n"
+            f"{earlier_review}")
@@ -0,0 +1,220 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from pr_agent.log import get_logger
+
+logger = get_logger()
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its configured depth."""
+
+
+class JobNotFoundError(Exception):
+    """Raised for job IDs that were never issued or have been forgotten."""
+
+
+@dataclass
+class Job:
+    id: str
+    command: str
+    pr_url: str
+    run: Callable[[], Awaitable[Any]] = field(repr=False)
+    status: str = QUEUED
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    # Identify the stored result once the job knows which head commit and settings it ran with
+    head_sha: Optional[str] = None
+    settings_hash: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "command": self.command,
+            "pr_url": self.pr_url,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Runs submitted PR-Agent commands in the background on a fixed set of asyncio workers.
+
+    The queue is bounded: submitting while `queue_depth` jobs are waiting raises
+    `JobQueueFullError`. Cancelling a queued job removes it from the queue; cancelling a
+    running job cancels its task. Finished jobs are kept for polling until `history_size`
+    newer jobs have finished. `on_change`, if set, is called with the job after every state
+    change so it can be persisted.
+    """
+
+    def __init__(self, workers: int, queue_depth: int, history_size: int = 1000,
+                 on_change: Optional[Callable[[Job], None]] = None):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.history_size = history_size
+        self.on_change = on_change
+        self._queue: Deque[Job] = deque()
+        # Counts jobs put in the queue; a job cancelled while queued leaves one extra permit, which a worker skips
+        self._available: Optional[asyncio.Semaphore] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._jobs: Dict[str, Job] = {}
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    @classmethod
+    def from_env(cls) -> "JobManager":
+        return cls(
+            workers=int(os.getenv("JOB_WORKERS", "2")),
+            queue_depth=int(os.getenv("JOB_QUEUE_DEPTH", "100")),
+            history_size=int(os.getenv("JOB_HISTORY_SIZE", "1000")),
+        )
+
+    def _notify(self, job: Job) -> None:
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(job)
+        except Exception as e:
+            logger.error(f"Failed to record state of job {job.id}: {e}")
+
+    def start(self) -> None:
+        """Start the workers; called lazily by `submit` if not done at startup."""
+        self._ensure_started()
+
+    def _ensure_started(self) -> asyncio.Semaphore:
+        if self._available is None:
+            self._available = asyncio.Semaphore(0)
+        if not self._worker_tasks:
+            self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        return self._available
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            await self._available.acquire()
+            if not self._queue:
+                continue
+            job = self._queue.popleft()
+            try:
+                await self._execute(job)
+            except Exception as e:
+                logger.exception(f"Job worker {index} failed on job {job.id}: {e}")
+
+    async def _execute(self, job: Job) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._notify(job)
+        job.task = asyncio.create_task(job.run())
+        try:
+            job.result = await job.task
+            job.status = SUCCEEDED
+            self.completed += 1
+        except asyncio.CancelledError:
+            if not job.task.cancelled():
+                raise
+            job.status = CANCELLED
+            self.cancelled += 1
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.command} {job.pr_url}) failed: {e}")
+            job.status = FAILED
+            job.error = str(e)
+            self.failed += 1
+        finally:
+            job.task = None
+            self._finish(job)
+
+    def _finish(self, job: Job) -> None:
+        job.finished_at = time.time()
+        self._notify(job)
+        self._finished[job.id] = None
+        while len(self._finished) > self.history_size:
+            old_id, _ = self._finished.popitem(last=False)
+            self._jobs.pop(old_id, None)
+
+    def submit(self, command: str, pr_url: str, run: Callable[[], Awaitable[Any]],
+               job_id: Optional[str] = None, created_at: Optional[float] = None) -> Job:
+        """
+        Queue `run` for execution and return its job without waiting for it.
+
+        `job_id` and `created_at` are given when resuming a job persisted by a previous process.
+        """
+        available = self._ensure_started()
+        if len(self._queue) >= self.queue_depth:
+            self.rejected += 1
+            raise JobQueueFullError(f"Job queue is full ({self.queue_depth} jobs waiting), try again later")
+        job = Job(id=job_id or uuid.uuid4().hex, command=command, pr_url=pr_url, run=run)
+        if created_at is not None:
+            job.created_at = created_at
+        self._queue.append(job)
+        available.release()
+        self._jobs[job.id] = job
+        self.submitted += 1
+        self._notify(job)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise JobNotFoundError(f"Unknown job ID: {job_id}")
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        """Cancel a queued or running job; finished jobs are left as they are."""
+        job = self.get(job_id)
+        if job.status == QUEUED:
+            self._queue.remove(job)
+            job.status = CANCELLED
+            self.cancelled += 1
+            self._finish(job)
+        elif job.status == RUNNING and job.task is not None:
+            job.task.cancel()
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> Job:
+        """Wait up to `timeout` seconds for a job to finish and return it either way."""
+        job = self.get(job_id)
+        deadline = time.monotonic() + timeout
+        while job.status not in FINISHED_STATES and time.monotonic() < deadline:
+            await asyncio.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        states: Dict[str, int] = {}
+        for job in self._jobs.values():
+            states[job.status] = states.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "queued": len(self._queue),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "jobs_by_status": states,
+        }
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from importlib import metadata
+from typing import Dict, Optional, Tuple
+
+from pr_agent.log import get_logger
+
+logger = get_logger()
+
+# Bump when the cache entry format changes
+CACHE_SCHEMA = 1
+
+CachedResponse = Tuple[str, str]
+
+
+def _pr_agent_version() -> str:
+    try:
+        return metadata.version("pr-agent")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _canonical_text(text: Optional[str]) -> str:
+    if not text:
+        return ""
+    return text.replace("\r\n", "\n").strip()
+
+
+class LLMCache:
+    """
+    Content-addressed cache of chat completions.
+
+    Entries are keyed by a SHA-256 over the model, deployment, temperature, the canonicalized
+    prompts and a version salt, so upgrading `pr-agent` (or the entry schema) invalidates
+    everything cached before. The in-memory tier is an LRU bounded by the size of the cached
+    responses; the optional disk tier keeps one JSON file per entry under `disk_dir`.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, enabled: bool = True,
+                 salt: Optional[str] = None):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.salt = salt or f"{CACHE_SCHEMA}:{_pr_agent_version()}"
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.disk_errors = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "LLMCache":
+        return cls(
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            disk_dir=os.getenv("LLM_CACHE_DIR") or None,
+            enabled=os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+        )
+
+    def make_key(self, model: str, deployment_id: Optional[str], temperature: float,
+                 system: str, user: str, img_path: Optional[str] = None) -> str:
+        payload = {
+            "salt": self.salt,
+            "model": model,
+            "deployment_id": deployment_id or "",
+            "temperature": round(float(temperature), 4),
+            "system": _canonical_text(system),
+            "user": _canonical_text(user),
+            "img_path": img_path or "",
+        }
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, value: CachedResponse) -> None:
+        size = len(value[0].encode("utf-8")) + len(value[1] or "") + len(key)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes[key]
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Look the key up in memory, then on disk. Blocking; disk reads touch the filesystem."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return value
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), encoding="utf-8") as f:
+                    entry = json.load(f)
+                if entry.get("salt") == self.salt:
+                    value = (entry["response"], entry["finish_reason"])
+                    self._remember(key, value)
+                    self.disk_hits += 1
+                    return value
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                self.disk_errors += 1
+                logger.warning(f"Failed to read LLM cache entry {key}: {e}")
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, response: str, finish_reason: str) -> None:
+        """Store a completion in memory and, if configured, on disk."""
+        if not self.enabled or response is None:
+            return
+        value = (response, finish_reason)
+        self._remember(key, value)
+        self.stores += 1
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"salt": self.salt, "response": response, "finish_reason": finish_reason}, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                self.disk_errors += 1
+                logger.warning(f"Failed to write LLM cache entry {key}: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "disk_errors": self.disk_errors,
+        }
+
+
+llm_cache = LLMCache.from_env()
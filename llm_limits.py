@@ -0,0 +1,324 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from pr_agent.log import get_logger
+
+from admission import parse_limits
+
+logger = get_logger()
+
+# Default wait after a throttling response that carries no Retry-After header
+DEFAULT_RETRY_AFTER = 5.0
+
+# Weight of the newest response in the moving average of completion sizes
+COMPLETION_SMOOTHING = 0.2
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Read the server's requested wait from a throttling error's response headers, if it sent one."""
+    for candidate in (error, error.__cause__):
+        if candidate is None:
+            continue
+        headers = getattr(getattr(candidate, "response", None), "headers", None) or \
+            getattr(candidate, "litellm_response_headers", None)
+        if not headers:
+            continue
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def is_throttled(error: BaseException) -> bool:
+    """Whether an LLM error is the provider asking us to slow down (HTTP 429 or equivalent)."""
+    for candidate in (error, error.__cause__):
+        if candidate is None:
+            continue
+        if type(candidate).__name__ == "RateLimitError" or getattr(candidate, "status_code", None) == 429:
+            return True
+        if "throttl" in str(candidate).lower():
+            return True
+    return False
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit for one LLM deployment, learned with additive increase /
+    multiplicative decrease.
+
+    Each successful call raises the limit by `increase / limit`, i.e. by `increase` per
+    full window of calls; a throttling response multiplies it by `decrease` (at most once
+    per `retry_after` window, so a burst of 429s counts as one congestion event) and
+    pauses new calls until the server's Retry-After has passed.
+    """
+
+    def __init__(self, name: str, initial: float = 4, min_limit: float = 1, max_limit: float = 32,
+                 increase: float = 1, decrease: float = 0.5):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self._condition = asyncio.Condition()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+        self.calls = 0
+        self.successes = 0
+        self.throttled = 0
+        self.decreases = 0
+        self.retry_after_waits = 0
+        self.retry_after_seconds_total = 0.0
+
+    def _has_room(self) -> bool:
+        return self._in_flight < max(self.min_limit, int(self.limit))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one of the deployment's concurrent call slots for the duration of the block."""
+        async with self._condition:
+            await self._condition.wait_for(self._has_room)
+            self._in_flight += 1
+            self.calls += 1
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            yield
+        finally:
+            async with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self) -> None:
+        self.successes += 1
+        self.limit = min(self.max_limit, self.limit + self.increase / max(1.0, self.limit))
+
+    async def on_throttle(self, retry_after: Optional[float]) -> float:
+        """Cut the limit, pause new calls and wait out the Retry-After; returns the wait."""
+        wait = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+        now = time.monotonic()
+        self.throttled += 1
+        if now - self._last_decrease >= wait:
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            self._last_decrease = now
+            self.decreases += 1
+            logger.warning(f"LLM deployment {self.name} throttled, concurrency limit now {self.limit:.1f}")
+        self._paused_until = max(self._paused_until, now + wait)
+        self.retry_after_waits += 1
+        self.retry_after_seconds_total += wait
+        await asyncio.sleep(wait)
+        return wait
+
+    def configure(self, limit: Optional[float] = None, max_limit: Optional[float] = None) -> None:
+        if max_limit:
+            self.max_limit = max(self.min_limit, float(max_limit))
+        if limit:
+            self.limit = float(limit)
+        self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self._in_flight,
+            "paused_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            "calls": self.calls,
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "decreases": self.decreases,
+            "retry_after_waits": self.retry_after_waits,
+            "retry_after_seconds_total": round(self.retry_after_seconds_total, 2),
+        }
+
+
+class TokenBucket:
+    """
+    Tokens-per-minute budget of one LLM deployment.
+
+    The bucket holds up to one minute of tokens and refills continuously. A call reserves
+    its estimated cost (prompt tokens plus the average completion seen so far) before it is
+    sent; callers that would overdraw the bucket wait, first come first served. Once the
+    response is in, `settle()` corrects the reservation to the actual completion size; a
+    call that fails gets its reservation back with `refund()`.
+    """
+
+    def __init__(self, name: str, tokens_per_minute: int, completion_estimate: int = 1000):
+        self.name = name
+        self.capacity = float(tokens_per_minute)
+        self.tokens = self.capacity
+        self.completion_estimate = float(completion_estimate)
+        self._updated = time.monotonic()
+        self._queue = asyncio.Lock()
+        self._state = threading.Lock()
+
+        self.reservations = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.tokens_reserved = 0
+        self.tokens_used = 0
+        self.refunds = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    def estimate(self, prompt_tokens: int) -> int:
+        return prompt_tokens + int(self.completion_estimate)
+
+    async def reserve(self, cost: int) -> float:
+        """Take `cost` tokens from the bucket, waiting for them if needed; returns the wait."""
+        cost = min(cost, self.capacity)
+        start = time.monotonic()
+        async with self._queue:
+            while True:
+                with self._state:
+                    self._refill()
+                    missing = cost - self.tokens
+                    if missing <= 0:
+                        self.tokens -= cost
+                        break
+                await asyncio.sleep(missing * 60 / self.capacity)
+        waited = time.monotonic() - start
+        self.reservations += 1
+        self.tokens_reserved += int(cost)
+        if waited > 0.01:
+            self.waits += 1
+            self.wait_seconds_total += waited
+        return waited
+
+    def settle(self, reserved: int, prompt_tokens: int, completion_tokens: int) -> None:
+        """Return or charge the difference between a reservation and the call's actual size."""
+        with self._state:
+            self._refill()
+            used = prompt_tokens + completion_tokens
+            self.tokens = min(self.capacity, self.tokens + min(reserved, self.capacity) - used)
+            self.tokens_used += used
+            self.completion_estimate += COMPLETION_SMOOTHING * (completion_tokens - self.completion_estimate)
+
+    def refund(self, reserved: int) -> None:
+        """Give back the reservation of a call that failed or was cancelled."""
+        with self._state:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + min(reserved, self.capacity))
+            self.refunds += 1
+
+    def drain(self) -> None:
+        """The deployment throttled us: assume the minute's budget is spent."""
+        with self._state:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+    def configure(self, tokens_per_minute: int) -> None:
+        with self._state:
+            self._refill()
+            self.capacity = float(tokens_per_minute)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._state:
+            self._refill()
+            available = self.tokens
+        return {
+            "tokens_per_minute": int(self.capacity),
+            "available": int(available),
+            "completion_estimate": int(self.completion_estimate),
+            "reservations": self.reservations,
+            "waits": self.waits,
+            "wait_seconds_total": round(self.wait_seconds_total, 2),
+            "tokens_reserved": self.tokens_reserved,
+            "tokens_used": self.tokens_used,
+            "refunds": self.refunds,
+        }
+
+
+class LLMLimits:
+    """
+    One `AIMDLimiter`, and one `TokenBucket` when a TPM quota is configured, per LLM
+    deployment (or model, when no deployment is configured).
+    """
+
+    def __init__(self, initial: float, min_limit: float, max_limit: float, max_retries: int,
+                 tokens_per_minute: int = 0, deployment_tpm: Optional[Dict[str, int]] = None,
+                 completion_estimate: int = 1000):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_retries = max_retries
+        self.tokens_per_minute = tokens_per_minute
+        self.deployment_tpm = deployment_tpm or {}
+        self.completion_estimate = completion_estimate
+        self._limiters: Dict[str, AIMDLimiter] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    @classmethod
+    def from_env(cls) -> "LLMLimits":
+        return cls(
+            initial=float(os.getenv("LLM_CONCURRENCY_INITIAL", "4")),
+            min_limit=float(os.getenv("LLM_CONCURRENCY_MIN", "1")),
+            max_limit=float(os.getenv("LLM_CONCURRENCY_MAX", "32")),
+            max_retries=int(os.getenv("LLM_THROTTLE_RETRIES", "5")),
+            tokens_per_minute=int(os.getenv("LLM_TPM_LIMIT", "0")),
+            deployment_tpm=parse_limits(os.getenv("LLM_TPM_LIMITS", "")),
+            completion_estimate=int(os.getenv("LLM_TPM_COMPLETION_ESTIMATE", "1000")),
+        )
+
+    def limiter(self, name: str) -> AIMDLimiter:
+        if name not in self._limiters:
+            self._limiters[name] = AIMDLimiter(name, self.initial, self.min_limit, self.max_limit)
+        return self._limiters[name]
+
+    def bucket(self, name: str) -> Optional[TokenBucket]:
+        """The deployment's TPM bucket, or None when it has no TPM quota configured."""
+        if name not in self._buckets:
+            tokens_per_minute = self.deployment_tpm.get(name, self.tokens_per_minute)
+            if tokens_per_minute <= 0:
+                return None
+            self._buckets[name] = TokenBucket(name, tokens_per_minute, self.completion_estimate)
+        return self._buckets[name]
+
+    def set_tokens_per_minute(self, name: str, tokens_per_minute: int) -> None:
+        self.deployment_tpm[name] = tokens_per_minute
+        bucket = self._buckets.get(name)
+        if bucket is not None:
+            bucket.configure(tokens_per_minute)
+
+    def configure(self, name: str, limit: float = 0, max_limit: float = 0, tokens_per_minute: int = 0) -> None:
+        """Override a deployment's concurrency limit, its upper bound or its TPM quota; 0 keeps the value."""
+        if limit > 0 or max_limit > 0:
+            self.limiter(name).configure(limit=limit, max_limit=max_limit)
+            logger.info(f"LLM concurrency for {name} set to limit={limit or 'unchanged'}, "
+                        f"max_limit={max_limit or 'unchanged'}")
+        if tokens_per_minute > 0:
+            self.set_tokens_per_minute(name, tokens_per_minute)
+            logger.info(f"LLM token budget for {name} set to {tokens_per_minute} tokens per minute")
+
+    def split_budget(self, parts: int) -> None:
+        """Keep 1/`parts` of each token budget, for one of `parts` processes sharing the deployments' quotas."""
+        if parts <= 1:
+            return
+        self.tokens_per_minute //= parts
+        self.deployment_tpm = {name: tpm // parts for name, tpm in self.deployment_tpm.items()}
+        for name, bucket in self._buckets.items():
+            bucket.configure(self.deployment_tpm.get(name, self.tokens_per_minute))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {name: limiter.stats() for name, limiter in self._limiters.items()}
+        for name, bucket in self._buckets.items():
+            stats.setdefault(name, {})["tpm"] = bucket.stats()
+        return stats
+
+
+llm_limits = LLMLimits.from_env()
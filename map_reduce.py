@@ -0,0 +1,304 @@
+import asyncio
+import copy
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+from jinja2 import Environment, StrictUndefined
+from pr_agent.algo.file_filter import filter_ignored
+from pr_agent.algo.language_handler import sort_files_by_main_languages
+from pr_agent.algo.pr_processing import (OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD, cap_and_log_extra_lines,
+                                         pr_generate_extended_diff)
+from pr_agent.algo.utils import clip_tokens, get_max_tokens, load_yaml
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+from progress import current_tracker, stage
+
+logger = get_logger()
+
+# Same YAML repairs PR-Agent applies when it parses a review
+_REVIEW_YAML_KEYS = ["ticket_compliance_check", "estimated_effort_to_review_[1-5]:", "security_concerns:",
+                     "key_issues_to_review:", "relevant_file:", "relevant_line:", "suggestion:"]
+
+_EFFORT_KEY = "estimated_effort_to_review_[1-5]"
+
+
+def partition_patches(sizes: List[int], budget: int, max_chunks: int) -> Tuple[List[List[int]], List[int]]:
+    """
+    Split patches into token-balanced groups of at most `budget` tokens each.
+
+    Patches are placed largest first into the lightest group they fit in, opening groups
+    as needed up to `max_chunks`. Returns the groups, as patch indices in their original
+    order, and the indices of patches that fit in no group.
+    """
+    count = min(max_chunks, max(1, math.ceil(sum(sizes) / budget)))
+    loads = [0] * count
+    groups: List[List[int]] = [[] for _ in range(count)]
+    skipped = []
+    for index in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True):
+        fitting = [g for g in range(len(loads)) if loads[g] + sizes[index] <= budget]
+        if fitting:
+            target = min(fitting, key=lambda g: loads[g])
+        elif len(loads) < max_chunks:
+            loads.append(0)
+            groups.append([])
+            target = len(loads) - 1
+        else:
+            skipped.append(index)
+            continue
+        loads[target] += sizes[index]
+        groups[target].append(index)
+    return [sorted(group) for group in groups if group], sorted(skipped)
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(str(value).strip().split()[0].rstrip(","))
+    except (ValueError, IndexError):
+        return None
+
+
+def merge_chunk_reviews(reviews: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    """
+    Reduce the reviews of the diff's chunks to one review of the whole PR.
+
+    Key issues and split suggestions are concatenated and deduplicated; the effort is the
+    highest estimate and the score the lowest; tests count as relevant if any chunk found
+    them; security concerns are collected from every chunk that reported one. Returns the
+    merged review and the number of duplicate findings dropped.
+    """
+    merged: Dict[str, Any] = {}
+    issues, seen_issues = [], set()
+    splits, seen_splits = [], set()
+    concerns = []
+    duplicates = 0
+    for review in reviews:
+        for key, value in review.items():
+            if key == "key_issues_to_review":
+                for issue in value or []:
+                    if not isinstance(issue, dict):
+                        continue
+                    marker = (str(issue.get("relevant_file", "")).strip(),
+                              str(issue.get("issue_header", "")).strip().lower(),
+                              _as_int(issue.get("start_line")))
+                    if marker in seen_issues:
+                        duplicates += 1
+                        continue
+                    seen_issues.add(marker)
+                    issues.append(issue)
+            elif key == "can_be_split":
+                for split in value or []:
+                    marker = str(split.get("title", split) if isinstance(split, dict) else split).strip().lower()
+                    if marker not in seen_splits:
+                        seen_splits.add(marker)
+                        splits.append(split)
+            elif key == "security_concerns":
+                text = str(value).strip()
+                if text and not text.lower().startswith("no") and text not in concerns:
+                    concerns.append(text)
+            elif key == _EFFORT_KEY:
+                effort = _as_int(value)
+                if effort is not None and effort > (_as_int(merged.get(key)) or 0):
+                    merged[key] = effort
+            elif key == "score":
+                score = _as_int(value)
+                if score is not None and (key not in merged or score < (_as_int(merged[key]) or 0)):
+                    merged[key] = str(score)
+            elif key == "relevant_tests":
+                if key not in merged or str(value).strip().lower().startswith("yes"):
+                    merged[key] = value
+            elif key not in merged:
+                merged[key] = value
+
+    if any("key_issues_to_review" in review for review in reviews):
+        merged["key_issues_to_review"] = issues
+    if any("security_concerns" in review for review in reviews):
+        merged["security_concerns"] = "\n\n".join(concerns) if concerns else "No"
+    if any("can_be_split" in review for review in reviews):
+        merged["can_be_split"] = splits
+    return merged, duplicates
+
+
+class ChunkedReview:
+    """
+    Map-reduce mode for `/review` of PRs whose diff does not fit one prompt.
+
+    PR-Agent's reviewer prunes such a diff down to what fits the model. With this mode the
+    extended diff is split into token-balanced groups of files of at most `chunk_tokens`
+    tokens, each group is reviewed by its own LLM call (up to `concurrency` at a time), and
+    the per-group reviews are merged into one review, which PR-Agent then renders and
+    publishes as usual. It applies automatically to diffs over the model's context when
+    `auto` is set, and to every review run with the `pr_reviewer.chunked_review` setting.
+    """
+
+    def __init__(self, chunk_tokens: int = 16000, concurrency: int = 4, max_chunks: int = 16, auto: bool = True):
+        self.chunk_tokens = chunk_tokens
+        self.concurrency = concurrency
+        self.max_chunks = max_chunks
+        self.auto = auto
+        self._lock = threading.Lock()
+
+        self.reviews = 0
+        self.chunks = 0
+        self.chunk_failures = 0
+        self.files_skipped = 0
+        self.duplicate_findings = 0
+        self.chunk_seconds_total = 0.0
+        self.chunk_seconds_max = 0.0
+        self.last_review: Dict[str, Any] = {}
+
+    @classmethod
+    def from_env(cls) -> "ChunkedReview":
+        return cls(
+            chunk_tokens=int(os.getenv("REVIEW_CHUNK_TOKENS", "16000")),
+            concurrency=int(os.getenv("REVIEW_CHUNK_CONCURRENCY", "4")),
+            max_chunks=int(os.getenv("REVIEW_CHUNK_MAX", "16")),
+            auto=os.getenv("REVIEW_CHUNK_AUTO", "true").lower() in ("1", "true", "yes"),
+        )
+
+    def install(self) -> None:
+        """Route PR-Agent's review prompt through the chunked mode when it applies."""
+        from pr_agent.tools.pr_reviewer import PRReviewer
+
+        if getattr(PRReviewer, "_chunked_review_installed", False):
+            return
+        prepare_prediction = PRReviewer._prepare_prediction
+        chunked = self
+
+        async def _prepare_prediction(reviewer, model: str) -> None:
+            forced = bool(get_settings().pr_reviewer.get("chunked_review", False))
+            if not (forced or chunked.auto):
+                return await prepare_prediction(reviewer, model)
+            await chunked.prepare_prediction(reviewer, model, forced, prepare_prediction)
+
+        PRReviewer._prepare_prediction = _prepare_prediction
+        PRReviewer._chunked_review_installed = True
+
+    def _extended_patches(self, reviewer) -> Tuple[List[str], List[int]]:
+        with stage("build_prompt"):
+            diff_files = filter_ignored(reviewer.git_provider.get_diff_files())
+            languages = sort_files_by_main_languages(reviewer.git_provider.get_languages(), diff_files)
+            patches, _, sizes = pr_generate_extended_diff(
+                languages, reviewer.token_handler, True,
+                patch_extra_lines_before=cap_and_log_extra_lines(get_settings().config.patch_extra_lines_before,
+                                                                 "before"),
+                patch_extra_lines_after=cap_and_log_extra_lines(get_settings().config.patch_extra_lines_after,
+                                                                "after"))
+        return patches, sizes
+
+    async def prepare_prediction(self, reviewer, model: str, forced: bool, prepare_prediction) -> None:
+        patches, sizes = self._extended_patches(reviewer)
+        prompt_tokens = reviewer.token_handler.prompt_tokens
+        budget = min(self.chunk_tokens, get_max_tokens(model) - prompt_tokens - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD)
+        fits_model = prompt_tokens + sum(sizes) + OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD < get_max_tokens(model)
+        if not patches:
+            return await prepare_prediction(reviewer, model)
+        if fits_model and (not forced or sum(sizes) <= budget):
+            # The whole diff fits one prompt: the same prediction PR-Agent makes, without building the diff twice
+            reviewer.patches_diff = "\n".join(patches)
+            reviewer.prediction = await reviewer._get_prediction(model)
+            return
+
+        for index, size in enumerate(sizes):
+            if size > budget:
+                patches[index] = clip_tokens(patches[index], budget)
+                sizes[index] = budget
+        groups, skipped = partition_patches(sizes, budget, self.max_chunks)
+        if skipped:
+            logger.warning(f"Chunked review of {reviewer.pr_url}: {len(skipped)} files did not fit "
+                           f"{self.max_chunks} chunks of {budget} tokens and are not reviewed")
+        logger.info(f"Chunked review of {reviewer.pr_url}: {len(patches)} files, {sum(sizes)} tokens "
+                    f"in {len(groups)} chunks")
+        tracker = current_tracker()
+        if tracker is not None:
+            # One LLM call per chunk instead of the single review call already expected
+            tracker.add_total("llm", len(groups) - 1)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def review_chunk(number: int, group: List[int]) -> Tuple[Optional[Dict[str, Any]], float]:
+            async with semaphore:
+                start = time.monotonic()
+                try:
+                    prediction = await self._review_chunk(reviewer, model, [patches[i] for i in group],
+                                                          number, len(groups))
+                    data = load_yaml(prediction.strip(), keys_fix_yaml=_REVIEW_YAML_KEYS,
+                                     first_key="review", last_key="security_concerns")
+                    review = data.get("review") if isinstance(data, dict) else None
+                    if not isinstance(review, dict):
+                        raise ValueError("response has no review section")
+                    return review, time.monotonic() - start
+                except Exception as e:
+                    logger.warning(f"Chunk {number}/{len(groups)} of {reviewer.pr_url} failed: {e}")
+                    return None, time.monotonic() - start
+
+        results = await asyncio.gather(*(review_chunk(number, group)
+                                         for number, group in enumerate(groups, start=1)))
+        reviews = [review for review, _ in results if review is not None]
+        if not reviews:
+            raise RuntimeError(f"All {len(groups)} review chunks failed")
+
+        start = time.monotonic()
+        merged, duplicates = merge_chunk_reviews(reviews)
+        reviewer.patches_diff = "\n".join(patches[i] for group in groups for i in group)
+        reviewer.prediction = yaml.safe_dump({"review": merged}, sort_keys=False, allow_unicode=True, width=1000)
+        self._record(groups, sizes, skipped, results, duplicates, time.monotonic() - start)
+
+    async def _review_chunk(self, reviewer, model: str, patches: List[str], number: int, total: int) -> str:
+        variables = copy.deepcopy(reviewer.vars)
+        variables["diff"] = "\n".join(patches)
+        note = (f"This diff is part {number} of {total} of the PR; the other parts are reviewed separately. "
+                f"Review only the files shown here.")
+        extra = variables.get("extra_instructions") or ""
+        variables["extra_instructions"] = f"{extra}\n{note}".strip()
+
+        environment = Environment(undefined=StrictUndefined)
+        system_prompt = environment.from_string(get_settings().pr_review_prompt.system).render(variables)
+        user_prompt = environment.from_string(get_settings().pr_review_prompt.user).render(variables)
+        response, _ = await reviewer.ai_handler.chat_completion(
+            model=model, temperature=get_settings().config.temperature, system=system_prompt, user=user_prompt)
+        return response
+
+    def _record(self, groups: List[List[int]], sizes: List[int], skipped: List[int],
+                results: List[Tuple[Optional[Dict[str, Any]], float]], duplicates: int,
+                reduce_seconds: float) -> None:
+        chunks = [{"files": len(group), "tokens": sum(sizes[i] for i in group), "seconds": round(seconds, 3),
+                   "ok": review is not None}
+                  for group, (review, seconds) in zip(groups, results)]
+        with self._lock:
+            self.reviews += 1
+            self.chunks += len(groups)
+            self.chunk_failures += sum(1 for review, _ in results if review is None)
+            self.files_skipped += len(skipped)
+            self.duplicate_findings += duplicates
+            for _, seconds in results:
+                self.chunk_seconds_total += seconds
+                self.chunk_seconds_max = max(self.chunk_seconds_max, seconds)
+            self.last_review = {"chunks": chunks, "files_skipped": len(skipped),
+                                "duplicate_findings": duplicates, "reduce_seconds": round(reduce_seconds, 3)}
+        logger.info(f"Chunked review finished: {len(groups)} chunks, slowest "
+                    f"{max(seconds for _, seconds in results):.1f}s, {duplicates} duplicate findings dropped")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "chunk_tokens": self.chunk_tokens,
+                "concurrency": self.concurrency,
+                "max_chunks": self.max_chunks,
+                "auto": self.auto,
+                "reviews": self.reviews,
+                "chunks": self.chunks,
+                "chunk_failures": self.chunk_failures,
+                "files_skipped": self.files_skipped,
+                "duplicate_findings": self.duplicate_findings,
+                "chunk_seconds_avg": round(self.chunk_seconds_total / self.chunks, 3) if self.chunks else 0.0,
+                "chunk_seconds_max": round(self.chunk_seconds_max, 3),
+                "last_review": self.last_review,
+            }
+
+
+chunked_review = ChunkedReview.from_env()
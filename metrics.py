@@ -0,0 +1,192 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Histogram buckets, in seconds, for tool calls and pipeline stages (which range from cache hits to long LLM calls)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+# Buckets for event loop lag, in seconds
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(dict(zip(self.label_names, key)))} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Distribution of observed values per label combination, in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            counts = {key: list(values) for key, values in self._counts.items()}
+            sums = dict(self._sums)
+        lines = []
+        for key in sorted(counts):
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[key]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {round(sums[key], 6)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Values read from a component when metrics are scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, collect: Callable[[], Iterable[Sample]]):
+        self.name = name
+        self.help = help_text
+        self._collect = collect
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+                for labels, value in self._collect() if value is not None]
+
+
+class MetricsRegistry:
+    """The server's metrics, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _add(self, metric: Any) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, label_names, buckets))
+
+    def gauge(self, name: str, help_text: str, collect: Callable[[], Iterable[Sample]]) -> Gauge:
+        return self._add(Gauge(name, help_text, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.render()
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+tool_calls = registry.counter("pr_agent_tool_calls_total", "MCP tool calls by tool and outcome (ok, error, busy)",
+                              ("tool", "status"))
+tool_seconds = registry.histogram("pr_agent_tool_duration_seconds", "MCP tool call latency", ("tool",))
+stage_seconds = registry.histogram("pr_agent_stage_duration_seconds",
+                                   "Time per pipeline stage of a tool call", ("stage",))
+llm_calls = registry.counter("pr_agent_llm_calls_total", "LLM completions by deployment, answered from the cache "
+                             "or the model", ("deployment", "source"))
+llm_tokens = registry.counter("pr_agent_llm_tokens_total", "LLM tokens sent (in) and generated (out), "
+                              "tokenizer estimates", ("deployment", "direction"))
+loop_lag_seconds = registry.histogram("pr_agent_event_loop_lag_seconds",
+                                      "How late the server event loop woke up from its probe sleep",
+                                      buckets=LAG_BUCKETS)
+
+worker_recycles = registry.counter("pr_agent_worker_recycles_total", "Worker processes replaced, by reason "
+                                   "(max_jobs, rss, crashed)", ("reason",))
+
+
+_tool_status: ContextVar[Optional[Dict[str, str]]] = ContextVar("tool_status", default=None)
+
+
+def set_tool_status(status: str) -> None:
+    """Record the outcome of the current tool call when it is not "ok" (e.g. "error" or "busy")."""
+    holder = _tool_status.get()
+    if holder is not None:
+        holder["status"] = status
+
+
+def instrumented(func: Callable) -> Callable:
+    """Count and time each call of an MCP tool; goes below `@mcp.tool()`."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        holder = {"status": "ok"}
+        token = _tool_status.set(holder)
+        start = time.monotonic()
+        try:
+            return await func(*args, **kwargs)
+        except BaseException:
+            holder["status"] = "error"
+            raise
+        finally:
+            _tool_status.reset(token)
+            tool_calls.inc(tool=func.__name__, status=holder["status"])
+            tool_seconds.observe(time.monotonic() - start, tool=func.__name__)
+
+    return wrapper
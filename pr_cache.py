@@ -0,0 +1,121 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from pr_agent.log import get_logger
+
+logger = get_logger()
+
+CacheKey = Tuple[str, str]
+
+
+def estimate_provider_bytes(provider) -> int:
+    """Approximate memory held by a provider's fetched files and patches."""
+    size = 0
+    for patch_info in getattr(provider, "diff_files", None) or []:
+        for field in ("base_file", "head_file", "patch"):
+            value = getattr(patch_info, field, None)
+            if isinstance(value, str):
+                size += len(value)
+    for git_file in getattr(provider, "git_files", None) or []:
+        patch = getattr(git_file, "_patch", None)
+        value = getattr(patch, "value", None)
+        if isinstance(value, str):
+            size += len(value)
+    return size
+
+
+class PRDataCache:
+    """
+    Git provider instances for PRs whose data was already fetched, keyed by PR and head SHA.
+
+    A cached provider carries the PR metadata, file list and patches PR-Agent loaded the
+    first time, so a later tool call on the same head commit can reuse it without asking the
+    git provider again. Entries are checked out exclusively: `take()` removes the entry and
+    `put()` returns it once the tool call is done. Memory is bounded by the estimated size
+    of the cached files and patches.
+    """
+
+    def __init__(self, max_bytes: int, enabled: bool = True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries: "OrderedDict[CacheKey, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> "PRDataCache":
+        return cls(
+            max_bytes=int(os.getenv("PR_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            enabled=os.getenv("PR_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+        )
+
+    def _drop(self, key: CacheKey) -> int:
+        _, size = self._entries.pop(key)
+        self._bytes -= size
+        return size
+
+    def take(self, pr_key: str, head_sha: Optional[str]):
+        """Remove and return the cached provider for this PR at `head_sha`, if there is one."""
+        if not self.enabled or not head_sha:
+            return None
+        with self._lock:
+            entry = self._entries.pop((pr_key, head_sha), None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._bytes -= entry[1]
+            self.hits += 1
+            return entry[0]
+
+    def put(self, pr_key: str, head_sha: Optional[str], provider) -> None:
+        if not self.enabled or not head_sha or provider is None:
+            return
+        size = estimate_provider_bytes(provider)
+        if size > self.max_bytes:
+            logger.debug(f"Not caching provider data for {pr_key}: {size} bytes exceeds the cache size")
+            return
+        with self._lock:
+            # Older head commits of the same PR will not be asked for again
+            for key in [key for key in self._entries if key[0] == pr_key]:
+                self._drop(key)
+                self.invalidations += 1
+            self._entries[(pr_key, head_sha)] = (provider, size)
+            self._bytes += size
+            self.stores += 1
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self.evicted_bytes += self._drop(oldest)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+            "invalidations": self.invalidations,
+        }
+
+
+pr_data_cache = PRDataCache.from_env()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional, Tuple
+from urllib.parse import urlparse
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+from http_clients import http_clients
+
+logger = get_logger()
+
+HEAD_SHA_TIMEOUT = 10
+
+# Most PRs whose last head SHA answer is kept for conditional requests; least recently used go first
+HEAD_SHA_ETAG_CACHE_SIZE = int(os.getenv("HEAD_SHA_ETAG_CACHE_SIZE", "10000"))
+
+# PR API URL -> (ETag, head SHA) of the last answer, for conditional requests
+_head_sha_etags: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+_head_sha_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class PRRef:
+    """A pull request identified independently of how its URL was spelled."""
+    host: str
+    repo: str
+    number: int
+
+    @property
+    def url(self) -> str:
+        return f"https://{self.host}/{self.repo}/pull/{self.number}"
+
+
+def parse_pr_url(pr_url: str) -> Optional[PRRef]:
+    """
+    Parse a GitHub pull request URL (web or REST API form) into a `PRRef`.
+
+    Returns:
+        The reference, or None if the URL is not a recognizable GitHub PR URL
+    """
+    parsed = urlparse(pr_url.strip())
+    host = parsed.netloc.lower()
+    parts = [part for part in parsed.path.split("/") if part]
+    if parts[:2] == ["api", "v3"]:
+        parts = parts[2:]
+
+    if host == "api.github.com" or parsed.path.startswith("/api/v3"):
+        if len(parts) < 5 or parts[0] != "repos" or parts[3] != "pulls":
+            return None
+        owner, repo, number = parts[1], parts[2], parts[4]
+        host = "github.com" if host == "api.github.com" else host
+    else:
+        if len(parts) < 4 or parts[2] != "pull":
+            return None
+        owner, repo, number = parts[0], parts[1], parts[3]
+
+    try:
+        return PRRef(host=host, repo=f"{owner}/{repo}".lower(), number=int(number))
+    except ValueError:
+        return None
+
+
+def canonical_pr_url(pr_url: str) -> str:
+    """Normalize a PR URL so that equivalent spellings compare equal."""
+    ref = parse_pr_url(pr_url)
+    if ref:
+        return ref.url
+    parsed = urlparse(pr_url.strip())
+    return f"{parsed.scheme}://{parsed.netloc.lower()}{parsed.path.rstrip('/')}"
+
+
+def _github_api_base() -> str:
+    return get_settings().get("GITHUB.BASE_URL", "https://api.github.com").rstrip("/")
+
+
+def get_head_sha(pr_url: str) -> Optional[str]:
+    """
+    Fetch the current head commit SHA of a GitHub pull request.
+
+    The request is conditional on the ETag of the previous answer for the same PR, so an
+    unchanged PR costs a `304 Not Modified`, which GitHub does not count against the rate
+    limit. This is a blocking call; run it off the event loop. Returns None for non-GitHub
+    providers or when the lookup fails.
+    """
+    if get_settings().get("CONFIG.GIT_PROVIDER", "github") != "github":
+        return None
+    ref = parse_pr_url(pr_url)
+    if ref is None:
+        return None
+
+    headers = {"Accept": "application/vnd.github+json"}
+    token = get_settings().get("GITHUB.USER_TOKEN", None)
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    api_url = f"{_github_api_base()}/repos/{ref.repo}/pulls/{ref.number}"
+    with _head_sha_lock:
+        previous = _head_sha_etags.get(api_url)
+        if previous:
+            _head_sha_etags.move_to_end(api_url)
+    if previous:
+        headers["If-None-Match"] = previous[0]
+    try:
+        response = http_clients.session.get(api_url, headers=headers, timeout=HEAD_SHA_TIMEOUT)
+        if response.status_code == 304 and previous:
+            return previous[1]
+        response.raise_for_status()
+        head_sha = response.json()["head"]["sha"]
+        etag = response.headers.get("ETag")
+        if etag:
+            with _head_sha_lock:
+                _head_sha_etags[api_url] = (etag, head_sha)
+                _head_sha_etags.move_to_end(api_url)
+                while len(_head_sha_etags) > HEAD_SHA_ETAG_CACHE_SIZE:
+                    _head_sha_etags.popitem(last=False)
+        return head_sha
+    except Exception as e:
+        logger.warning(f"Failed to fetch head SHA for {pr_url}: {e}")
+        return None
+
+
+def settings_fingerprint(overrides: Optional[Mapping[str, Any]]) -> str:
+    """Stable short hash of per-request setting overrides."""
+    canonical = json.dumps(dict(overrides or {}), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,279 @@
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from pr_agent.log import get_logger
+
+from metrics import stage_seconds
+
+logger = get_logger()
+
+# Pipeline stages of a PR-Agent command, in order
+STAGES = ("fetch_pr", "fetch_files", "build_prompt", "llm", "render", "publish")
+
+# Share of the overall progress each stage accounts for; the LLM calls dominate a typical run
+STAGE_WEIGHTS = {
+    "fetch_pr": 0.05,
+    "fetch_files": 0.20,
+    "build_prompt": 0.05,
+    "llm": 0.55,
+    "render": 0.05,
+    "publish": 0.10,
+}
+
+# Progress is reported to the client in steps of at least this much
+REPORT_STEP = 0.01
+
+ProgressReporter = Callable[[float, Optional[float]], Awaitable[Any]]
+
+
+@dataclass
+class _StageState:
+    started: int = 0
+    done: int = 0
+    total: int = 0
+    complete: bool = False
+    seconds: float = 0.0
+    spans: int = 0
+
+
+class _Span:
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.monotonic()
+        self.children = 0.0
+
+
+_current_tracker: ContextVar[Optional["ProgressTracker"]] = ContextVar("progress_tracker", default=None)
+_current_span: ContextVar[Optional[_Span]] = ContextVar("progress_span", default=None)
+
+
+class ProgressTracker:
+    """
+    Progress and per-stage latency of one tool call.
+
+    Hooks in the provider, the AI handler and PR-Agent's tools move the tracker through
+    `STAGES`. A stage counts done/total units where they are known (files fetched, LLM
+    calls completed, outputs published); once a later stage has started units or was
+    completed, every earlier stage counts as complete. Stage time is exclusive: time spent
+    in a nested stage (fetching files while building the prompt) is booked to the nested
+    stage only, while concurrent commands add up their time. Progress changes are sent to
+    `report` on the event loop that created the tracker.
+    """
+
+    def __init__(self, report: Optional[ProgressReporter] = None, outputs: int = 1):
+        self._report = report
+        self._loop = asyncio.get_running_loop() if report is not None else None
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _StageState] = {name: _StageState() for name in STAGES}
+        self._stages["llm"].total = outputs
+        self._stages["publish"].total = outputs
+        self._reported = 0.0
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            state = self._stages[name]
+            state.seconds += seconds
+            state.spans += 1
+
+    def set_total(self, name: str, total: int) -> None:
+        with self._lock:
+            state = self._stages[name]
+            state.total = max(total, state.done)
+        self._changed()
+
+    def add_total(self, name: str, count: int) -> None:
+        with self._lock:
+            self._stages[name].total += count
+        self._changed()
+
+    def start_unit(self, name: str) -> None:
+        """Note that one more unit of `name` has started, growing its total if it was underestimated."""
+        with self._lock:
+            state = self._stages[name]
+            state.started += 1
+            state.total = max(state.total, state.started)
+        self._changed()
+
+    def advance(self, name: str, count: int = 1) -> None:
+        with self._lock:
+            state = self._stages[name]
+            state.done += count
+            state.total = max(state.total, state.done)
+        self._changed()
+
+    def complete(self, name: str) -> None:
+        with self._lock:
+            self._stages[name].complete = True
+        self._changed()
+
+    def fraction(self) -> float:
+        with self._lock:
+            total = 0.0
+            later_started = False
+            for name in reversed(STAGES):
+                state = self._stages[name]
+                if state.complete or later_started:
+                    share = 1.0
+                elif state.total:
+                    share = min(state.done / state.total, 1.0)
+                else:
+                    share = 0.0
+                total += STAGE_WEIGHTS[name] * share
+                later_started = later_started or state.complete or state.started > 0 or state.done > 0
+        return min(total, 1.0)
+
+    def timings(self) -> Dict[str, float]:
+        with self._lock:
+            return {name: round(state.seconds, 3) for name, state in self._stages.items() if state.spans}
+
+    def _changed(self) -> None:
+        if self._report is None:
+            return
+        fraction = self.fraction()
+        with self._lock:
+            if fraction < 1.0 and fraction - self._reported < REPORT_STEP:
+                return
+            self._reported = fraction
+        try:
+            self._loop.call_soon_threadsafe(self._loop.create_task, self._send(fraction))
+        except RuntimeError:
+            pass
+
+    async def _send(self, fraction: float) -> None:
+        try:
+            await self._report(round(fraction * 100, 1), 100)
+        except Exception as e:
+            logger.debug(f"Failed to report progress: {e}")
+
+
+class StageStats:
+    """Latency of each pipeline stage, aggregated over all tracked tool calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self._count = {name: 0 for name in STAGES}
+        self._total = {name: 0.0 for name in STAGES}
+        self._max = {name: 0.0 for name in STAGES}
+
+    def record(self, timings: Dict[str, float]) -> None:
+        with self._lock:
+            self.runs += 1
+            for name, seconds in timings.items():
+                self._count[name] += 1
+                self._total[name] += seconds
+                self._max[name] = max(self._max[name], seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                name: {
+                    "count": self._count[name],
+                    "total_seconds": round(self._total[name], 3),
+                    "avg_seconds": round(self._total[name] / self._count[name], 3) if self._count[name] else 0.0,
+                    "max_seconds": round(self._max[name], 3),
+                }
+                for name in STAGES
+            }
+            return {"runs": self.runs, "stages": stages}
+
+
+stage_stats = StageStats()
+
+
+@contextmanager
+def progress_scope(report: Optional[ProgressReporter] = None, outputs: int = 1) -> Iterator[ProgressTracker]:
+    """
+    Track the progress of everything run inside the block.
+
+    Args:
+        report: Coroutine function called with (progress, total), e.g. `ctx.report_progress`
+        outputs: Number of PR-Agent commands the block runs
+    """
+    tracker = ProgressTracker(report, outputs)
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+        timings = tracker.timings()
+        if timings:
+            stage_stats.record(timings)
+            for name, seconds in timings.items():
+                stage_seconds.observe(seconds, stage=name)
+            logger.info(f"Stage timings: {timings}")
+
+
+def current_tracker() -> Optional[ProgressTracker]:
+    return _current_tracker.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Optional[ProgressTracker]]:
+    """Enter pipeline stage `name` for the duration of the block and book its exclusive time."""
+    tracker = _current_tracker.get()
+    if tracker is None:
+        yield None
+        return
+    parent = _current_span.get()
+    span = _Span(name)
+    token = _current_span.set(span)
+    try:
+        yield tracker
+    finally:
+        _current_span.reset(token)
+        elapsed = time.monotonic() - span.start
+        tracker.add_time(name, elapsed - span.children)
+        if parent is not None:
+            parent.children += elapsed
+
+
+def in_stage(name: str, func: Callable) -> Callable:
+    """Wrap a sync or async callable so that each call runs in pipeline stage `name`."""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with stage(name):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _count_patches(func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        tracker = _current_tracker.get()
+        if tracker is not None and isinstance(result, tuple) and result and isinstance(result[0], list):
+            # One LLM call per patch, on top of the final description call already expected
+            tracker.add_total("llm", len([patches for patches in result[0] if patches]))
+        return result
+    return wrapper
+
+
+def install_progress_hooks() -> None:
+    """Wrap the prompt-building and rendering steps of PR-Agent's review and describe tools."""
+    from pr_agent.tools import pr_description, pr_reviewer
+
+    if getattr(pr_reviewer, "_progress_hooks_installed", False):
+        return
+    pr_reviewer.get_pr_diff = in_stage("build_prompt", pr_reviewer.get_pr_diff)
+    pr_description.get_pr_diff = in_stage("build_prompt", pr_description.get_pr_diff)
+    pr_description.get_pr_diff_multiple_patchs = in_stage(
+        "build_prompt", _count_patches(pr_description.get_pr_diff_multiple_patchs))
+
+    pr_reviewer.PRReviewer._prepare_pr_review = in_stage("render", pr_reviewer.PRReviewer._prepare_pr_review)
+    for name in ("_prepare_data", "_prepare_pr_answer", "_prepare_pr_answer_with_markers"):
+        setattr(pr_description.PRDescription, name, in_stage("render", getattr(pr_description.PRDescription, name)))
+    pr_reviewer._progress_hooks_installed = True
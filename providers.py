@@ -0,0 +1,274 @@
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from pr_agent.git_providers import _GIT_PROVIDERS, get_git_provider_with_context
+from pr_agent.git_providers.git_provider import IncrementalPR
+from pr_agent.git_providers.utils import apply_repo_settings
+from pr_agent.log import get_logger
+from starlette_context import context
+
+from incremental import use_compare_range
+from pr_cache import pr_data_cache
+from pr_refs import canonical_pr_url
+from progress import current_tracker, stage
+
+logger = get_logger()
+
+# Read-only provider calls that hit the git provider API and are safe to answer once per session
+MEMOIZED_METHODS = ("get_languages", "get_commit_messages", "get_repo_settings", "get_repo_labels")
+
+# Memoized calls whose answer does not depend on the PR head, forgotten when a cached provider is reused
+REPO_LEVEL_METHODS = ("get_repo_settings", "get_repo_labels")
+
+_current_session: ContextVar[Optional["PRSession"]] = ContextVar("pr_session", default=None)
+_current_command: ContextVar[str] = ContextVar("pr_command", default="")
+
+
+class PRSession:
+    """
+    Provider state shared by every PR-Agent command run for one PR within a tool call.
+
+    All commands in the session get the same git provider instance, so PR metadata, files
+    and patches are fetched from the provider once. When the PR's head SHA is known, the
+    provider is taken from (and afterwards returned to) `pr_data_cache`, so an unchanged PR
+    is not fetched again by later tool calls. The session also records what each command
+    publishes, which is what the tools hand back to the client.
+
+    With `since_sha`, incremental reviews in the session cover the commits after it; the
+    provider then holds only that range and bypasses the cache.
+    """
+
+    def __init__(self, pr_url: str, head_sha: Optional[str] = None, since_sha: Optional[str] = None):
+        self.pr_url = pr_url
+        self.key = canonical_pr_url(pr_url)
+        self.head_sha = head_sha
+        self.since_sha = since_sha
+        self.provider = None
+        self.reused_provider = False
+        self.outputs: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def provider_for(self, provider_cls, pr_url: str):
+        with self._lock:
+            if self.provider is None:
+                provider = pr_data_cache.take(self.key, self.head_sha) if self.since_sha is None else None
+                if provider is not None:
+                    _prepare_for_reuse(provider)
+                    self.reused_provider = True
+                else:
+                    with stage("fetch_pr"):
+                        provider = provider_cls(pr_url)
+                    _instrument(provider)
+                    if self.since_sha is not None:
+                        use_compare_range(provider, self.since_sha)
+                self.provider = provider
+            return self.provider
+
+    @property
+    def incremental(self) -> bool:
+        """Whether the session's review covered only the commits after `since_sha`."""
+        incremental = getattr(self.provider, "incremental", None)
+        return self.since_sha is not None and bool(incremental and incremental.is_incremental)
+
+    def record(self, text: str) -> None:
+        self.outputs.setdefault(_current_command.get(), []).append(text)
+
+    def output(self, command: str) -> Optional[str]:
+        """Everything `command` published during the session, or None if it published nothing."""
+        parts = self.outputs.get(command)
+        return "\n\n".join(parts) if parts else None
+
+
+def _memoize(provider, name: str):
+    method = getattr(provider, name)
+    results: Dict[Any, Any] = provider._pr_session_memo.setdefault(name, {})
+    lock = threading.Lock()
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        with lock:
+            if key not in results:
+                results[key] = method(*args, **kwargs)
+            return results[key]
+
+    return wrapper
+
+
+def _record(text: str) -> None:
+    session = _current_session.get()
+    if session is not None:
+        session.record(text)
+
+
+def _published() -> None:
+    tracker = current_tracker()
+    if tracker is not None:
+        tracker.advance("publish")
+
+
+def _track_files(provider) -> None:
+    """Report file fetching progress: files whose content was loaded out of the PR's files."""
+    get_files = provider.get_files
+    get_diff_files = provider.get_diff_files
+    get_file_content = getattr(provider, "_get_pr_file_content", None)
+
+    def tracked_get_files(*args, **kwargs):
+        with stage("fetch_files") as tracker:
+            files = get_files(*args, **kwargs)
+            if tracker is not None and files is not None:
+                tracker.set_total("fetch_files", len(files))
+            return files
+
+    def tracked_get_diff_files(*args, **kwargs):
+        with stage("fetch_files") as tracker:
+            diff_files = get_diff_files(*args, **kwargs)
+            if tracker is not None:
+                tracker.complete("fetch_files")
+            return diff_files
+
+    def tracked_get_file_content(*args, **kwargs):
+        with stage("fetch_files") as tracker:
+            content = get_file_content(*args, **kwargs)
+            if tracker is not None:
+                tracker.advance("fetch_files")
+            return content
+
+    provider.get_files = tracked_get_files
+    provider.get_diff_files = tracked_get_diff_files
+    if get_file_content is not None:
+        provider._get_pr_file_content = tracked_get_file_content
+
+
+def _instrument(provider) -> None:
+    """Shadow provider methods on the instance; the class (and isinstance checks) stay untouched."""
+    provider._pr_session_memo = {}
+    for name in MEMOIZED_METHODS:
+        if getattr(provider, name, None) is not None:
+            setattr(provider, name, _memoize(provider, name))
+
+    publish_comment = provider.publish_comment
+    publish_persistent_comment = provider.publish_persistent_comment
+    publish_description = provider.publish_description
+
+    def capture_comment(pr_comment: str, is_temporary: bool = False):
+        if is_temporary:
+            return publish_comment(pr_comment, is_temporary=is_temporary)
+        _record(pr_comment)
+        with stage("publish"):
+            result = publish_comment(pr_comment, is_temporary=is_temporary)
+        _published()
+        return result
+
+    def capture_persistent_comment(pr_comment: str, *args, **kwargs):
+        _record(pr_comment)
+        with stage("publish"):
+            result = publish_persistent_comment(pr_comment, *args, **kwargs)
+        _published()
+        return result
+
+    def capture_description(pr_title: str, pr_body: str):
+        _record(f"# {pr_title}\n\n{pr_body}")
+        with stage("publish"):
+            result = publish_description(pr_title, pr_body)
+        _published()
+        return result
+
+    provider.publish_comment = capture_comment
+    provider.publish_persistent_comment = capture_persistent_comment
+    provider.publish_description = capture_description
+    _track_files(provider)
+
+
+def _prepare_for_reuse(provider) -> None:
+    """Reset the per-request state a cached provider picked up, keeping the fetched PR data."""
+    for name in REPO_LEVEL_METHODS:
+        provider._pr_session_memo.get(name, {}).clear()
+    provider.incremental = IncrementalPR(False)
+    for attr in ("comments", "unreviewed_files_set", "previous_review"):
+        if attr in vars(provider):
+            delattr(provider, attr)
+    pr = getattr(provider, "pr", None)
+    if pr is not None and hasattr(pr, "comments_list"):
+        pr.comments_list = []
+
+    # PR-Agent looks for fetched files in the request context before asking the provider
+    try:
+        if getattr(provider, "git_files", None):
+            context["git_files"] = provider.git_files
+        if getattr(provider, "diff_files", None):
+            context["diff_files"] = provider.diff_files
+    except Exception:
+        pass
+
+
+class _ProviderFactory:
+    """Stands in for a provider class in PR-Agent's registry and routes construction through the session."""
+
+    def __init__(self, provider_cls):
+        self.provider_cls = provider_cls
+
+    def __call__(self, pr_url: Optional[str] = None, *args, **kwargs):
+        session = _current_session.get()
+        if session is None or not pr_url or args or kwargs or canonical_pr_url(pr_url) != session.key:
+            if pr_url is None:
+                return self.provider_cls(*args, **kwargs)
+            return self.provider_cls(pr_url, *args, **kwargs)
+        return session.provider_for(self.provider_cls, pr_url)
+
+    def __getattr__(self, item):
+        return getattr(self.provider_cls, item)
+
+
+def install_provider_hooks() -> None:
+    """Wrap every registered PR-Agent git provider so it takes part in `PRSession`s."""
+    for name, provider_cls in list(_GIT_PROVIDERS.items()):
+        if not isinstance(provider_cls, _ProviderFactory):
+            _GIT_PROVIDERS[name] = _ProviderFactory(provider_cls)
+
+
+@contextmanager
+def pr_session(pr_url: str, head_sha: Optional[str] = None, since_sha: Optional[str] = None) -> Iterator[PRSession]:
+    """
+    Share one provider between all PR-Agent commands run for `pr_url` inside the block.
+
+    Args:
+        pr_url: The URL of the pull request
+        head_sha: The PR's current head commit; enables reuse of provider data across tool calls
+        since_sha: The last reviewed head commit, for incremental reviews
+    """
+    session = PRSession(pr_url, head_sha, since_sha)
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
+    if since_sha is None:
+        pr_data_cache.put(session.key, head_sha, session.provider)
+
+
+@contextmanager
+def command_scope(command: str) -> Iterator[None]:
+    """Attribute output published inside the block to `command`."""
+    token = _current_command.set(command)
+    try:
+        yield
+    finally:
+        _current_command.reset(token)
+
+
+def prefetch_pr_data(pr_url: str) -> None:
+    """
+    Fetch repo settings, metadata, files and patches for the current session up front.
+
+    Blocking; run it in a worker thread inside `settings_scope()` and `pr_session()` so the
+    results land in the shared request context and provider.
+    """
+    apply_repo_settings(pr_url)
+    provider = get_git_provider_with_context(pr_url)
+    provider.get_languages()
+    provider.get_commit_messages()
+    provider.get_diff_files()
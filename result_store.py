@@ -0,0 +1,205 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from pr_agent.log import get_logger
+
+from pr_refs import parse_pr_url
+
+logger = get_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pr_url TEXT NOT NULL,
+    repo TEXT,
+    pr_number INTEGER,
+    command TEXT NOT NULL,
+    head_sha TEXT NOT NULL,
+    settings_hash TEXT NOT NULL,
+    output TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    duration_seconds REAL,
+    llm_calls INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_results_lookup ON results (pr_url, command, head_sha, settings_hash);
+CREATE INDEX IF NOT EXISTS idx_results_repo_pr ON results (repo, pr_number);
+CREATE INDEX IF NOT EXISTS idx_results_created_at ON results (created_at);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    command TEXT NOT NULL,
+    pr_url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    head_sha TEXT,
+    settings_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at);
+"""
+
+# Run compaction after this many result writes
+COMPACT_EVERY = 200
+
+
+class ResultStore:
+    """
+    SQLite (WAL) store of PR-Agent outputs and background jobs.
+
+    Results are looked up by canonical PR URL, command, head SHA and settings hash, so a
+    repeated request for an unchanged PR is answered from disk, including after a restart.
+    Jobs are persisted so queued work can be resumed on startup. `compact()` enforces the
+    retention policy: rows older than `retention_days` go, and at most `max_results` results
+    are kept.
+    """
+
+    def __init__(self, path: str, retention_days: float = 30, max_results: int = 10000):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        self._writes_since_compact = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("head_sha", "settings_hash"):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+
+    @classmethod
+    def from_env(cls) -> Optional["ResultStore"]:
+        path = os.getenv("RESULT_STORE_PATH", "pr_agent_store.db")
+        if not path:
+            return None
+        return cls(
+            path=path,
+            retention_days=float(os.getenv("RESULT_STORE_RETENTION_DAYS", "30")),
+            max_results=int(os.getenv("RESULT_STORE_MAX_RESULTS", "10000")),
+        )
+
+    def lookup(self, pr_url: str, command: str, head_sha: str, settings_hash: str) -> Optional[str]:
+        """Return the newest stored output for this exact request, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM results WHERE pr_url = ? AND command = ? AND head_sha = ? AND settings_hash = ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (pr_url, command, head_sha, settings_hash),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row["output"]
+
+    def latest(self, pr_url: str, command: str, settings_hash: str) -> Optional[Dict[str, Any]]:
+        """Return the newest stored result for a PR, command and settings regardless of head SHA."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM results WHERE pr_url = ? AND command = ? AND settings_hash = ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (pr_url, command, settings_hash),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def save_result(self, pr_url: str, command: str, head_sha: str, settings_hash: str, output: str,
+                    duration_seconds: float, llm_calls: int = 0, prompt_tokens: int = 0,
+                    completion_tokens: int = 0) -> None:
+        ref = parse_pr_url(pr_url)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO results (pr_url, repo, pr_number, command, head_sha, settings_hash, output, created_at, "
+                "duration_seconds, llm_calls, prompt_tokens, completion_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (pr_url, ref.repo if ref else None, ref.number if ref else None, command, head_sha, settings_hash,
+                 output, time.time(), duration_seconds, llm_calls, prompt_tokens, completion_tokens),
+            )
+            self.writes += 1
+            self._writes_since_compact += 1
+            compact = self._writes_since_compact >= COMPACT_EVERY
+        if compact:
+            self.compact()
+
+    def save_job(self, job) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, command, pr_url, status, error, created_at, started_at, finished_at, head_sha, "
+                "settings_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                "status = excluded.status, error = excluded.error, started_at = excluded.started_at, "
+                "finished_at = excluded.finished_at, head_sha = excluded.head_sha, "
+                "settings_hash = excluded.settings_hash",
+                (job.id, job.command, job.pr_url, job.status, job.error, job.created_at, job.started_at,
+                 job.finished_at, job.head_sha, job.settings_hash),
+            )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def pending_jobs(self) -> List[Dict[str, Any]]:
+        """Jobs that were queued or running when the server last stopped, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def compact(self) -> Dict[str, int]:
+        """Apply the retention policy and give freed pages back to the filesystem."""
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock:
+            self._writes_since_compact = 0
+            expired = self._conn.execute("DELETE FROM results WHERE created_at < ?", (cutoff,)).rowcount
+            overflow = self._conn.execute(
+                "DELETE FROM results WHERE id NOT IN (SELECT id FROM results ORDER BY created_at DESC LIMIT ?)",
+                (self.max_results,),
+            ).rowcount
+            jobs = self._conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND created_at < ?", (cutoff,)
+            ).rowcount
+            self._conn.execute("PRAGMA incremental_vacuum")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if expired or overflow or jobs:
+            logger.info(f"Result store compacted: removed {expired + overflow} results and {jobs} jobs")
+        return {"expired_results": expired, "overflow_results": overflow, "jobs": jobs}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            results = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            jobs = self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "results": results,
+            "jobs": jobs,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+result_store = ResultStore.from_env()
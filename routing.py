@@ -0,0 +1,123 @@
+import bisect
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pr_agent.log import get_logger
+
+from pr_refs import canonical_pr_url, parse_pr_url
+
+logger = get_logger()
+
+
+def _point(value: str) -> int:
+    return int.from_bytes(hashlib.sha256(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring over replica names.
+
+    Each replica is placed at `vnodes` points of the ring and a key belongs to the first
+    replica point at or after the key's own point. When a replica joins or leaves, only the
+    keys next to its points change owner; the others keep theirs.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 160):
+        self.vnodes = vnodes
+        self.nodes: Tuple[str, ...] = ()
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.set_nodes(nodes)
+
+    def set_nodes(self, nodes: Iterable[str]) -> bool:
+        """Replace the members of the ring; returns whether they changed."""
+        nodes = tuple(sorted(set(nodes)))
+        if nodes == self.nodes:
+            return False
+        ring = sorted((_point(f"{node}#{i}"), node) for node in nodes for i in range(self.vnodes))
+        self._points = [point for point, _ in ring]
+        self._owners = [node for _, node in ring]
+        self.nodes = nodes
+        return True
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect_left(self._points, _point(key)) % len(self._points)
+        return self._owners[index]
+
+
+class Router:
+    """
+    Assigns each PR command in the shared work queue to an owning replica.
+
+    Commands for the same repository (or, with `scope="pr"`, the same PR) hash to the same
+    replica, so its PR data, repository settings and LLM response caches are warm when the
+    next command for that repository arrives. The ring holds the replicas taking work from
+    the queue and is refreshed from the queue's membership list, so replicas that join or
+    leave take over or hand off only their share of the keys.
+    """
+
+    def __init__(self, enabled: bool = True, scope: str = "repo", vnodes: int = 160, steal_after: float = 10):
+        self.enabled = enabled
+        self.scope = scope
+        self.steal_after = steal_after
+        self._ring = HashRing(vnodes=vnodes)
+        self._lock = threading.Lock()
+        self._routed: Dict[str, int] = {}
+        self.rebalances = 0
+
+    @classmethod
+    def from_env(cls) -> "Router":
+        scope = os.getenv("ROUTING_KEY", "repo").lower()
+        if scope not in ("repo", "pr"):
+            logger.warning(f"Unknown ROUTING_KEY {scope!r}, routing by repository")
+            scope = "repo"
+        return cls(
+            enabled=os.getenv("ROUTING_ENABLED", "true").lower() in ("1", "true", "yes"),
+            scope=scope,
+            vnodes=int(os.getenv("ROUTING_VNODES", "160")),
+            steal_after=float(os.getenv("ROUTING_STEAL_AFTER", "10")),
+        )
+
+    def key(self, pr_url: str) -> str:
+        """The part of a PR URL that decides its owner."""
+        ref = parse_pr_url(pr_url)
+        if ref is None:
+            return canonical_pr_url(pr_url)
+        return f"{ref.host}/{ref.repo}" if self.scope == "repo" else ref.url
+
+    def refresh(self, replicas: Iterable[str]) -> None:
+        """Rebuild the ring from the replicas currently taking work."""
+        with self._lock:
+            previous = self._ring.nodes
+            if self._ring.set_nodes(replicas):
+                self.rebalances += 1
+                joined = sorted(set(self._ring.nodes) - set(previous))
+                left = sorted(set(previous) - set(self._ring.nodes))
+                logger.info(f"Routing ring now has {len(self._ring.nodes)} replicas"
+                            + (f", joined: {', '.join(joined)}" if joined else "")
+                            + (f", left: {', '.join(left)}" if left else ""))
+
+    def route(self, pr_url: str) -> Optional[str]:
+        """The replica that should run commands for this PR, or None if any replica may."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            owner = self._ring.owner(self.key(pr_url))
+            if owner is not None:
+                self._routed[owner] = self._routed.get(owner, 0) + 1
+        return owner
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "key": self.scope,
+                "steal_after": self.steal_after,
+                "replicas": list(self._ring.nodes),
+                "rebalances": self.rebalances,
+                "routed": dict(self._routed),
+            }
@@ -0,0 +1,115 @@
+import asyncio
+import importlib
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+from pr_agent.log import get_logger
+
+from agent_pool import AgentPool
+from executors import agent_loops
+from http_clients import http_clients
+from progress import install_progress_hooks
+from settings_overlay import settings_scope
+from streaming import install_streaming_hook
+
+if TYPE_CHECKING:
+    from providers import PRSession
+
+logger = get_logger()
+
+
+class CommandError(Exception):
+    """A PR-Agent command failed; carries the original error message."""
+
+
+@dataclass
+class CommandRun:
+    """Outcome of one PR-Agent command, in a form that can be sent between processes."""
+    command: str
+    output: Optional[str] = None
+    result: Any = None
+    seconds: float = 0.0
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    incremental: bool = False
+    error: Optional[str] = None
+
+    def value(self) -> Any:
+        """What the tool returns: the captured output, else PR-Agent's own result; raises if the command failed."""
+        if self.error is not None:
+            raise CommandError(self.error)
+        return self.output or self.result
+
+
+def load() -> None:
+    """
+    Import PR-Agent's agent, git providers and LLM handler, and hook the server into them.
+
+    This is most of a process's import time, so the modules that depend on them (`ai_handler`,
+    `map_reduce`, `providers`) are imported here and in the functions below rather than at
+    the top of this module.
+    """
+    importlib.import_module("pr_agent.agent.pr_agent")
+    importlib.import_module("ai_handler")
+    from map_reduce import chunked_review
+    from providers import install_provider_hooks
+
+    # Let tool calls share git provider instances and capture what PR-Agent publishes
+    install_provider_hooks()
+    install_progress_hooks()
+    chunked_review.install()
+    install_streaming_hook()
+    http_clients.install()
+
+
+async def _run_command(session: "PRSession", command: str, pool: AgentPool) -> CommandRun:
+    from ai_handler import usage_scope
+    from providers import command_scope
+
+    start = time.monotonic()
+    result, error = None, None
+    with command_scope(command), usage_scope() as usage:
+        try:
+            async with pool.agent() as agent:
+                result = await agent_loops.run(lambda: agent.handle_request(session.pr_url, command))
+        except Exception as e:
+            logger.error(f"{command} failed for {session.pr_url}: {e}")
+            error = str(e) or type(e).__name__
+    return CommandRun(
+        command=command,
+        output=session.output(command),
+        result=result if isinstance(result, (str, bool, int, float, type(None))) else str(result),
+        seconds=time.monotonic() - start,
+        calls=usage.calls,
+        prompt_tokens=usage.prompt_tokens,
+        completion_tokens=usage.completion_tokens,
+        incremental=session.incremental,
+        error=error,
+    )
+
+
+async def run_commands(pool: AgentPool, pr_url: str, commands: Sequence[str],
+                       overrides: Optional[Dict[str, Any]] = None, head_sha: Optional[str] = None,
+                       since_sha: Optional[str] = None) -> List[CommandRun]:
+    """
+    Run PR-Agent commands on one PR concurrently, sharing the PR's provider data.
+
+    Args:
+        pool: Agents to run the commands with
+        pr_url: The pull request
+        commands: PR-Agent commands, e.g. `["/describe", "/review"]`
+        overrides: Setting overrides for these commands
+        head_sha: The PR's head commit, which lets the commands reuse cached PR data
+        since_sha: For incremental reviews, the head commit of the last review
+
+    Returns:
+        One `CommandRun` per command, in order; failed commands carry their error instead of raising
+    """
+    from providers import pr_session, prefetch_pr_data
+
+    with settings_scope(overrides), pr_session(pr_url, head_sha, since_sha=since_sha) as session:
+        if len(commands) > 1:
+            await asyncio.to_thread(prefetch_pr_data, pr_url)
+        return list(await asyncio.gather(*(_run_command(session, command, pool) for command in commands)))
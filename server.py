@@ -1,49 +1,394 @@
 import asyncio
+import json
 import os
 import sys
+import uuid
+from functools import partial
 from typing import Dict, List, Any, Optional, Tuple
 
+import uvicorn
+from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP, Context, Image
-from pr_agent.agent.pr_agent import PRAgent
-from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger, setup_logger
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+# Read .env before the modules below build their settings from the environment
+load_dotenv()
+
+from admission import AdmissionController, AdmissionRejected
+from agent_pool import AgentPool, PoolTimeoutError
+from executors import agent_loops, install_blocking_executor, loop_lag
+from http_clients import http_clients
+from incremental import merge_reviews
+from jobs import FAILED, FINISHED_STATES, SUCCEEDED, JobManager, JobNotFoundError, JobQueueFullError
+from llm_cache import llm_cache
+from llm_limits import llm_limits
+from metrics import instrumented, registry, set_tool_status
+from pr_cache import pr_data_cache
+from pr_refs import canonical_pr_url, get_head_sha, settings_fingerprint
+from progress import ProgressReporter, progress_scope, stage, stage_stats
+from result_store import result_store
+from routing import Router
+from runner import CommandRun, load as load_pr_agent, run_commands
+from settings_overlay import apply_env_settings
+from single_flight import SingleFlight
+from startup import LazyImport, startup
+from streaming import stream_scope, stream_stats
+from warmup import WarmUp, check_github, check_llm, load_prompts, load_tokenizer
+from work_queue import QueueConsumers, WorkItem, WorkItemError, WorkQueue
+from workers import WorkerError, WorkerPool
 
 # Set up logging
 setup_logger()
 logger = get_logger()
 
+
+pr_agent_stack = LazyImport("pr_agent", load_pr_agent, startup)
+
+
 # Create an MCP server named "PR-Agent"
 mcp = FastMCP("PR-Agent", dependencies=["pr_agent"])
 
+# PRAgent instances shared by the tool handlers; the pool size bounds concurrent PR-Agent commands
+agent_pool = AgentPool()
+
+# With WORKER_PROCESSES set, PR-Agent commands run in worker processes instead of this one
+worker_pool = WorkerPool.from_env()
+
+# Default number of PRs `review_prs` reviews at the same time
+REVIEW_BATCH_CONCURRENCY = int(os.getenv("REVIEW_BATCH_CONCURRENCY", "4"))
+
+# Identical concurrent tool calls share one PR-Agent run
+inflight = SingleFlight()
+
+# Bounds concurrent tool calls; excess calls queue briefly, then get a "busy, retry after" answer
+admission = AdmissionController.from_env()
+
+# Background workers for the submit_* tools, persisted so queued jobs survive restarts
+job_manager = JobManager.from_env()
+if result_store is not None:
+    job_manager.on_change = result_store.save_job
+
+# With WORK_QUEUE_URL set, commands go through a queue shared by all replicas and run wherever a consumer is free
+work_queue = WorkQueue.from_env()
+
+# Seconds a tool call waits for its command in the shared work queue before answering with the job ID to poll
+WORK_QUEUE_WAIT_TIMEOUT = float(os.getenv("WORK_QUEUE_WAIT_TIMEOUT", "1800"))
+
+# Routes each queued command to the replica that owns its repository, so that replica's caches are warm
+router = Router.from_env()
+# Commands that fail because this replica has no free agent or worker go back to the queue for another replica
+queue_consumers = (QueueConsumers.from_env(work_queue, router, retry_on=(PoolTimeoutError, WorkerError))
+                   if work_queue is not None else None)
+
+# Loads PR-Agent and opens connections once the server listens; the readiness route reports when it is done
+warm_up = WarmUp.from_env()
+if worker_pool is None:
+    warm_up.add("pr_agent", pr_agent_stack.ready)
+    warm_up.add("agent_pool", agent_pool.fill)
+    warm_up.add("tokenizer", load_tokenizer)
+else:
+    warm_up.add("workers", worker_pool.start)
+warm_up.add("prompts", load_prompts)
+warm_up.add("github", check_github)
+warm_up.add("llm", check_llm)
+if work_queue is not None:
+    warm_up.add("work_queue", work_queue.stats)
+
+# Path of the Prometheus metrics route served next to the SSE endpoint; empty disables it
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+
+# Path of the readiness route, which answers 503 until warm-up has finished; empty disables it
+READY_PATH = os.getenv("READY_PATH", "/ready")
+
+registry.gauge("pr_agent_cache_hit_ratio", "Share of lookups answered from the LLM response and PR data caches",
+               lambda: [({"cache": "llm"}, llm_cache.stats()["hit_ratio"]),
+                        ({"cache": "pr"}, pr_data_cache.stats()["hit_ratio"])])
+registry.gauge("pr_agent_in_flight", "Admitted tool calls and PR-Agent runs executing now",
+               lambda: [({"kind": "tool_calls"}, admission.stats()["in_flight"]),
+                        ({"kind": "agent_runs"}, agent_loops.stats()["busy"])])
+registry.gauge("pr_agent_queued", "Tool calls waiting for admission, queued background jobs and runs waiting "
+               "for an agent thread",
+               lambda: [({"kind": "tool_calls"}, admission.stats()["waiting"]),
+                        ({"kind": "jobs"}, job_manager.stats()["queued"]),
+                        ({"kind": "agent_runs"}, agent_loops.stats()["waiting"])])
+registry.gauge("pr_agent_github_rate_limit_remaining", "GitHub API requests left in the current rate limit window",
+               lambda: [({"resource": resource}, limit["remaining"])
+                        for resource, limit in http_clients.rate_limits().items()])
+registry.gauge("pr_agent_github_rate_limit", "GitHub API requests allowed per rate limit window",
+               lambda: [({"resource": resource}, limit["limit"])
+                        for resource, limit in http_clients.rate_limits().items()])
+if worker_pool is not None:
+    registry.gauge("pr_agent_worker_queue_depth", "Jobs waiting for a free worker process slot",
+                   lambda: [({}, worker_pool.stats()["waiting"])])
+    registry.gauge("pr_agent_worker_in_flight", "Jobs running per worker process",
+                   lambda: [({"worker": worker["index"]}, worker["in_flight"])
+                            for worker in worker_pool.stats()["workers"]])
+    registry.gauge("pr_agent_worker_rss_bytes", "Resident memory per worker process, as of its last finished job",
+                   lambda: [({"worker": worker["index"]}, worker["rss_mb"] * 2 ** 20)
+                            for worker in worker_pool.stats()["workers"]])
+if queue_consumers is not None:
+    registry.gauge("pr_agent_work_queue_items", "Items queued and running in the shared work queue, as of this "
+                   "replica's last check",
+                   lambda: [({"status": status}, count) for status, count in queue_consumers.depth.items()])
+    registry.gauge("pr_agent_work_queue_running", "Work items from the shared queue running in this replica",
+                   lambda: [({}, queue_consumers.running)])
+registry.gauge("pr_agent_ready", "1 once warm-up has finished and the server takes tool calls",
+               lambda: [({}, 1 if warm_up.ready else 0)])
+registry.gauge("pr_agent_llm_concurrency_limit", "Learned concurrent LLM call limit per deployment",
+               lambda: [({"deployment": name}, limits["limit"])
+                        for name, limits in llm_limits.stats().items() if "limit" in limits])
+
+# Force `enable_review_labels_security` and `enable_review_labels_effort` to be False to avoid the labels issue (under development)
+REVIEW_SETTINGS = {
+    "pr_reviewer.enable_review_labels_security": False,
+    "pr_reviewer.enable_review_labels_effort": False,
+}
+
+# Review settings that split the diff into chunks reviewed in parallel, see `ChunkedReview`
+CHUNKED_REVIEW_SETTINGS = {**REVIEW_SETTINGS, "pr_reviewer.chunked_review": True}
+
+
+def _command_overrides(command: str) -> Optional[Dict[str, Any]]:
+    return REVIEW_SETTINGS if command == "/review" else None
+
+
+async def _execute(pr_url: str, commands: List[str], overrides: Optional[Dict[str, Any]] = None,
+                   head_sha: Optional[str] = None, since_sha: Optional[str] = None) -> List[CommandRun]:
+    """Run PR-Agent commands on a PR, in a worker process in worker mode and on the agent threads otherwise."""
+    if worker_pool is not None:
+        return await worker_pool.run(pr_url, commands, overrides, head_sha, since_sha)
+    await pr_agent_stack.ready()
+    return await run_commands(agent_pool, pr_url, commands, overrides, head_sha, since_sha)
+
+
+async def _save_run(pr_url: str, run: CommandRun, head_sha: Optional[str], settings_hash: str) -> None:
+    if run.output and head_sha and result_store is not None:
+        await asyncio.to_thread(
+            result_store.save_result, canonical_pr_url(pr_url), run.command, head_sha, settings_hash, run.output,
+            run.seconds, run.calls, run.prompt_tokens, run.completion_tokens,
+        )
+
+
+async def _run_agent(pr_url: str, command: str, overrides: Optional[Dict[str, Any]] = None,
+                     head_sha: Optional[str] = None) -> Any:
+    [run] = await _execute(pr_url, [command], overrides, head_sha)
+    await _save_run(pr_url, run, head_sha, settings_fingerprint(overrides))
+    return run.value()
+
+
+async def _run_review_and_describe(pr_url: str, head_sha: Optional[str] = None) -> Tuple[Any, Any]:
+    settings_hash = settings_fingerprint(REVIEW_SETTINGS)
+    runs = await _execute(pr_url, ["/review", "/describe"], REVIEW_SETTINGS, head_sha)
+    outcomes = []
+    for run in runs:
+        await _save_run(pr_url, run, head_sha, settings_hash)
+        try:
+            outcomes.append(run.value())
+        except Exception as e:
+            outcomes.append(e)
+    review, description = outcomes
+    return review, description
+
+
+async def _stored_output(pr_url: str, command: str, head_sha: Optional[str], settings_hash: str) -> Optional[str]:
+    if not head_sha or result_store is None:
+        return None
+    return await asyncio.to_thread(result_store.lookup, canonical_pr_url(pr_url), command, head_sha, settings_hash)
+
+
+async def _run_command(pr_url: str, command: str, overrides: Optional[Dict[str, Any]] = None,
+                       report: Optional[ProgressReporter] = None, head_sha: Optional[str] = None) -> Any:
+    """
+    Run a PR-Agent command, reusing a stored result or joining an identical call in flight.
+
+    Calls are identical when they target the same PR (however its URL is spelled) at the
+    same head commit, with the same command and setting overrides. Stage progress goes to
+    `report` when this call runs the command itself. The head SHA is looked up unless the
+    caller already did.
+    """
+    with progress_scope(report):
+        if head_sha is None:
+            with stage("fetch_pr"):
+                head_sha = await asyncio.to_thread(get_head_sha, pr_url)
+        settings_hash = settings_fingerprint(overrides)
+        stored = await _stored_output(pr_url, command, head_sha, settings_hash)
+        if stored is not None:
+            logger.info(f"Answering {command} for {pr_url} from the result store")
+            return stored
+        key = (canonical_pr_url(pr_url), command, head_sha, settings_hash)
+        if work_queue is not None:
+            return await inflight.do(key, lambda: _run_shared(pr_url, command, overrides, head_sha))
+        return await inflight.do(key, lambda: _run_agent(pr_url, command, overrides, head_sha))
+
+
+async def _enqueue(pr_url: str, command: str, overrides: Optional[Dict[str, Any]],
+                   head_sha: Optional[str]) -> WorkItem:
+    key = "|".join((canonical_pr_url(pr_url), command, head_sha or "", settings_fingerprint(overrides)))
+    item, queued = await asyncio.to_thread(work_queue.enqueue, key, command, pr_url, overrides, head_sha,
+                                           router.route(pr_url))
+    if not queued:
+        logger.info(f"Joining work item {item.id} ({command} {pr_url}), which is already {item.status}")
+    return item
+
+
+async def _run_shared(pr_url: str, command: str, overrides: Optional[Dict[str, Any]] = None,
+                      head_sha: Optional[str] = None) -> Optional[str]:
+    """Queue a command in the shared work queue, or join the same command queued by any replica, and wait for it."""
+    item = await _enqueue(pr_url, command, overrides, head_sha)
+    finished = await work_queue.wait(item.id, WORK_QUEUE_WAIT_TIMEOUT)
+    if finished is None:
+        raise WorkItemError(f"Work item {item.id} is no longer in the work queue")
+    if finished.status not in FINISHED_STATES:
+        # No replica took it, or it is still running; it stays queued and can be polled as a job
+        raise WorkItemError(f"{command} for {pr_url} is still {finished.status} after {WORK_QUEUE_WAIT_TIMEOUT:g}s; "
+                            f"poll it with get_job_result using job ID {item.id}")
+    return finished.value()
+
+
+async def _run_work_item(item: WorkItem) -> Any:
+    """Run a command taken from the shared work queue, unless a replica has stored its output meanwhile."""
+    stored = await _stored_output(item.pr_url, item.command, item.head_sha, settings_fingerprint(item.overrides))
+    if stored is not None:
+        return stored
+    return await _run_agent(item.pr_url, item.command, item.overrides, item.head_sha)
+
+
+async def _review_since(pr_url: str, head_sha: str, earlier: Dict[str, Any]) -> Any:
+    since_sha = earlier["head_sha"]
+    settings_hash = settings_fingerprint({**REVIEW_SETTINGS, "incremental_since": since_sha})
+    [run] = await _execute(pr_url, ["/review -i"], REVIEW_SETTINGS, head_sha, since_sha=since_sha)
+    output = run.output
+    if not output:
+        return run.value()
+    if run.incremental:
+        output = merge_reviews(output, earlier["output"], since_sha)
+    else:
+        settings_hash = settings_fingerprint(REVIEW_SETTINGS)
+    if result_store is not None:
+        await asyncio.to_thread(result_store.save_result, canonical_pr_url(pr_url), "/review", head_sha,
+                                settings_hash, output, run.seconds, run.calls, run.prompt_tokens,
+                                run.completion_tokens)
+    return output
+
+
+async def _run_incremental_review(pr_url: str, report: Optional[ProgressReporter] = None) -> Any:
+    """
+    Review only the commits pushed since the last stored full review of the PR and merge the
+    findings into that review. Without an earlier review this is a regular review.
+
+    Merged reviews are stored under their own settings hash, so the base is always a full
+    review and each push replaces the findings merged into it instead of nesting them.
+    """
+    head_sha = await asyncio.to_thread(get_head_sha, pr_url)
+    earlier = None
+    if head_sha and result_store is not None:
+        earlier = await asyncio.to_thread(result_store.latest, canonical_pr_url(pr_url), "/review",
+                                          settings_fingerprint(REVIEW_SETTINGS))
+    if earlier is None:
+        return await _run_command(pr_url, "/review", REVIEW_SETTINGS, report)
+    if earlier["head_sha"] == head_sha:
+        return earlier["output"]
+
+    settings_hash = settings_fingerprint({**REVIEW_SETTINGS, "incremental_since": earlier["head_sha"]})
+    stored = await _stored_output(pr_url, "/review", head_sha, settings_hash)
+    if stored is not None:
+        return stored
+    with progress_scope(report):
+        key = (canonical_pr_url(pr_url), "/review -i", head_sha, settings_hash)
+        return await inflight.do(key, lambda: _review_since(pr_url, head_sha, earlier))
+
 
 @mcp.tool()
-async def review_pr(pr_url: str, ctx: Context) -> str:
+@instrumented
+async def review_pr(pr_url: str, ctx: Context, incremental: bool = False, chunked: bool = False) -> str:
     """
     Review a pull request and provide feedback.
 
     Args:
         pr_url: The URL of the pull request to review
+        incremental: Review only the commits pushed since the server last reviewed this PR,
+            merged with that earlier review
+        chunked: Split the diff into groups of files reviewed in parallel and merge the findings,
+            which is faster for large PRs (PRs too large for one prompt are always chunked)
 
     Returns:
         A comprehensive review of the pull request
     """
     await ctx.info(f"Reviewing PR: {pr_url}")
-    await ctx.report_progress(0, 1)
+    await ctx.report_progress(0, 100)
 
     try:
-        agent = PRAgent()
-        # Force `enable_review_labels_security` and `enable_review_labels_effort` to be False to avoid the labels issue (under development)
-        get_settings().set("pr_reviewer.enable_review_labels_security", False)
-        get_settings().set("pr_reviewer.enable_review_labels_effort", False)
-        result = await agent.handle_request(pr_url, "/review")
-        await ctx.report_progress(1, 1)
+        async with admission.admit("review_pr"):
+            with stream_scope(ctx.info):
+                if incremental:
+                    result = await _run_incremental_review(pr_url, ctx.report_progress)
+                else:
+                    overrides = CHUNKED_REVIEW_SETTINGS if chunked else REVIEW_SETTINGS
+                    result = await _run_command(pr_url, "/review", overrides, ctx.report_progress)
+        await ctx.report_progress(100, 100)
         return result or "Review completed, but no results were returned."
+    except AdmissionRejected as e:
+        set_tool_status("busy")
+        return e.to_response()
     except Exception as e:
+        set_tool_status("error")
         logger.error(f"Error reviewing PR: {e}")
         return f"Error reviewing PR: {str(e)}"
 
 
 @mcp.tool()
+@instrumented
+async def review_prs(pr_urls: List[str], ctx: Context, max_concurrency: int = 0) -> str:
+    """
+    Review several pull requests concurrently.
+
+    Args:
+        pr_urls: The URLs of the pull requests to review
+        max_concurrency: How many PRs to review at the same time (defaults to the server setting)
+
+    Returns:
+        The review of each pull request, in the order they finished
+    """
+    total = len(pr_urls)
+    limit = max_concurrency if max_concurrency > 0 else REVIEW_BATCH_CONCURRENCY
+    await ctx.info(f"Reviewing {total} PRs, {limit} at a time")
+    await ctx.report_progress(0, total)
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def review_one(pr_url: str) -> Tuple[str, str]:
+        async with semaphore:
+            try:
+                async with admission.admit("review_prs"):
+                    result = await _run_command(pr_url, "/review", REVIEW_SETTINGS)
+                return pr_url, str(result or "Review completed, but no results were returned.")
+            except AdmissionRejected as e:
+                return pr_url, e.to_response()
+            except Exception as e:
+                logger.error(f"Error reviewing PR {pr_url}: {e}")
+                return pr_url, f"Error reviewing PR: {str(e)}"
+
+    sections = []
+    tasks = [asyncio.create_task(review_one(pr_url)) for pr_url in pr_urls]
+    try:
+        for done, next_result in enumerate(asyncio.as_completed(tasks), start=1):
+            pr_url, output = await next_result
+            sections.append(f"## {pr_url}\n\n{output}")
+            await ctx.info(f"[{done}/{total}] Finished {pr_url}:\n{output}")
+            await ctx.report_progress(done, total)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return "\n\n".join(sections) or "No pull requests were given."
+
+
+@mcp.tool()
+@instrumented
 async def describe_pr(pr_url: str, ctx: Context) -> str:
     """
     Generate a description for a pull request based on its changes.
@@ -55,18 +400,307 @@ async def describe_pr(pr_url: str, ctx: Context) -> str:
         A detailed description suitable for the PR
     """
     await ctx.info(f"Generating description for PR: {pr_url}")
-    await ctx.report_progress(0, 1)
+    await ctx.report_progress(0, 100)
 
     try:
-        agent = PRAgent()
-        result = await agent.handle_request(pr_url, "/describe")
-        await ctx.report_progress(1, 1)
+        async with admission.admit("describe_pr"):
+            with stream_scope(ctx.info):
+                result = await _run_command(pr_url, "/describe", report=ctx.report_progress)
+        await ctx.report_progress(100, 100)
         return result or "Description generated, but no results were returned."
+    except AdmissionRejected as e:
+        set_tool_status("busy")
+        return e.to_response()
     except Exception as e:
+        set_tool_status("error")
         logger.error(f"Error describing PR: {e}")
         return f"Error describing PR: {str(e)}"
 
 
+@mcp.tool()
+@instrumented
+async def review_and_describe_pr(pr_url: str, ctx: Context) -> str:
+    """
+    Generate a description and a review of a pull request in one pass.
+
+    The PR is fetched from the git provider once and both the description and the review
+    are produced concurrently from that data.
+
+    Args:
+        pr_url: The URL of the pull request
+
+    Returns:
+        The PR description followed by the review
+    """
+    await ctx.info(f"Describing and reviewing PR: {pr_url}")
+    await ctx.report_progress(0, 100)
+
+    try:
+        async with admission.admit("review_and_describe_pr"):
+            with progress_scope(ctx.report_progress, outputs=2), stream_scope(ctx.info):
+                with stage("fetch_pr"):
+                    head_sha = await asyncio.to_thread(get_head_sha, pr_url)
+                settings_hash = settings_fingerprint(REVIEW_SETTINGS)
+                review = await _stored_output(pr_url, "/review", head_sha, settings_hash)
+                description = await _stored_output(pr_url, "/describe", head_sha, settings_hash)
+                if review is None or description is None:
+                    key = (canonical_pr_url(pr_url), "/describe+/review", head_sha, settings_hash)
+                    review, description = await inflight.do(key, lambda: _run_review_and_describe(pr_url, head_sha))
+    except AdmissionRejected as e:
+        set_tool_status("busy")
+        return e.to_response()
+    except Exception as e:
+        set_tool_status("error")
+        logger.error(f"Error describing and reviewing PR: {e}")
+        return f"Error describing and reviewing PR: {str(e)}"
+
+    if isinstance(description, Exception) or isinstance(review, Exception):
+        set_tool_status("error")
+    if isinstance(description, Exception):
+        logger.error(f"Error describing PR: {description}")
+        description = f"Error describing PR: {str(description)}"
+    if isinstance(review, Exception):
+        logger.error(f"Error reviewing PR: {review}")
+        review = f"Error reviewing PR: {str(review)}"
+    await ctx.report_progress(100, 100)
+    return (f"## Description\n\n{description or 'Description generated, but no results were returned.'}\n\n"
+            f"## Review\n\n{review or 'Review completed, but no results were returned.'}")
+
+
+async def _run_job(job_id: str) -> Any:
+    job = job_manager.get(job_id)
+    overrides = _command_overrides(job.command)
+    # Recorded on the job so its result can be found in the store after a restart
+    job.head_sha = await asyncio.to_thread(get_head_sha, job.pr_url)
+    job.settings_hash = settings_fingerprint(overrides)
+    # Jobs wait for capacity without a deadline; the job queue already bounds how many are waiting
+    async with admission.admit("jobs", queue=False):
+        return await _run_command(job.pr_url, job.command, overrides, head_sha=job.head_sha)
+
+
+async def _submit_job(command: str, pr_url: str) -> str:
+    if work_queue is not None:
+        head_sha = await asyncio.to_thread(get_head_sha, pr_url)
+        item = await _enqueue(pr_url, command, _command_overrides(command), head_sha)
+        return json.dumps(item.to_dict(), indent=2)
+    job_id = uuid.uuid4().hex
+    try:
+        job = job_manager.submit(command, pr_url, partial(_run_job, job_id), job_id=job_id)
+    except JobQueueFullError as e:
+        return json.dumps({"error": str(e)})
+    return json.dumps(job.to_dict(), indent=2)
+
+
+def _restore_jobs() -> None:
+    """Queue the jobs a previous process accepted but did not finish."""
+    if result_store is None:
+        return
+    for row in result_store.pending_jobs():
+        command, pr_url = row["command"], row["pr_url"]
+        try:
+            job_manager.submit(command, pr_url, partial(_run_job, row["id"]),
+                               job_id=row["id"], created_at=row["created_at"])
+            logger.info(f"Resumed job {row['id']} ({command} {pr_url})")
+        except JobQueueFullError:
+            logger.warning(f"Job queue is full, could not resume job {row['id']}")
+            break
+
+
+def _stored_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """A job finished by a previous process, as recorded in the result store."""
+    if result_store is None:
+        return None
+    row = result_store.get_job(job_id)
+    if row is None:
+        return None
+    return {"job_id": row.pop("id"), **row}
+
+
+@mcp.tool()
+@instrumented
+async def submit_review(pr_url: str) -> str:
+    """
+    Start reviewing a pull request in the background.
+
+    Args:
+        pr_url: The URL of the pull request to review
+
+    Returns:
+        A JSON document with the job ID to poll with `get_job_status` / `get_job_result`
+    """
+    return await _submit_job("/review", pr_url)
+
+
+@mcp.tool()
+@instrumented
+async def submit_describe(pr_url: str) -> str:
+    """
+    Start generating a pull request description in the background.
+
+    Args:
+        pr_url: The URL of the pull request to describe
+
+    Returns:
+        A JSON document with the job ID to poll with `get_job_status` / `get_job_result`
+    """
+    return await _submit_job("/describe", pr_url)
+
+
+@mcp.tool()
+@instrumented
+async def get_job_status(job_id: str) -> str:
+    """
+    Get the status of a background job.
+
+    Args:
+        job_id: The ID returned by `submit_review` or `submit_describe`
+
+    Returns:
+        A JSON document with the job status and timestamps
+    """
+    if work_queue is not None:
+        item = await asyncio.to_thread(work_queue.get, job_id)
+        return json.dumps(item.to_dict() if item is not None else {"error": f"Unknown job ID: {job_id}"}, indent=2)
+    try:
+        return json.dumps(job_manager.get(job_id).to_dict(), indent=2)
+    except JobNotFoundError as e:
+        stored = await asyncio.to_thread(_stored_job, job_id)
+        return json.dumps(stored if stored is not None else {"error": str(e)}, indent=2)
+
+
+@mcp.tool()
+@instrumented
+async def get_job_result(job_id: str, wait_seconds: float = 0) -> str:
+    """
+    Get the output of a background job.
+
+    Args:
+        job_id: The ID returned by `submit_review` or `submit_describe`
+        wait_seconds: How long to wait for the job to finish before answering
+
+    Returns:
+        The review or description if the job succeeded, otherwise its status
+    """
+    if work_queue is not None:
+        job = (await work_queue.wait(job_id, wait_seconds) if wait_seconds > 0
+               else await asyncio.to_thread(work_queue.get, job_id))
+        if job is None:
+            return f"Unknown job ID: {job_id}"
+    else:
+        try:
+            job = await job_manager.wait(job_id, wait_seconds) if wait_seconds > 0 else job_manager.get(job_id)
+        except JobNotFoundError as e:
+            stored = await asyncio.to_thread(_stored_job, job_id)
+            if stored is None or stored["status"] != SUCCEEDED:
+                return str(e) if stored is None else f"Job {job_id} was {stored['status']}."
+            output = await _stored_output(stored["pr_url"], stored["command"], stored["head_sha"],
+                                          stored["settings_hash"] or "")
+            return output if output is not None else f"Job {job_id} succeeded, but its result is no longer stored."
+
+    if job.status == SUCCEEDED:
+        return str(job.result or "Job completed, but no results were returned.")
+    if job.status == FAILED:
+        return f"Job {job_id} failed: {job.error}"
+    if job.status in FINISHED_STATES:
+        return f"Job {job_id} was {job.status}."
+    return f"Job {job_id} is still {job.status}."
+
+
+@mcp.tool()
+@instrumented
+async def cancel_job(job_id: str) -> str:
+    """
+    Cancel a queued or running background job.
+
+    Args:
+        job_id: The ID returned by `submit_review` or `submit_describe`
+
+    Returns:
+        A JSON document with the job's status after cancellation
+    """
+    if work_queue is not None:
+        item = await asyncio.to_thread(work_queue.cancel, job_id)
+        return json.dumps(item.to_dict() if item is not None else {"error": f"Unknown job ID: {job_id}"}, indent=2)
+    try:
+        return json.dumps(job_manager.cancel(job_id).to_dict(), indent=2)
+    except JobNotFoundError as e:
+        return json.dumps({"error": str(e)})
+
+
+def _chunked_review_stats() -> Optional[Dict[str, Any]]:
+    if not pr_agent_stack.loaded:
+        return None
+    from map_reduce import chunked_review
+
+    return chunked_review.stats()
+
+
+@mcp.tool()
+@instrumented
+async def get_server_stats() -> str:
+    """
+    Report runtime statistics of the PR-Agent server.
+
+    Returns:
+        A JSON document with agent pool, cache, request coalescing and job counters
+    """
+    shared_queue = None
+    if queue_consumers is not None:
+        shared_queue = {**queue_consumers.stats(), "queue": await asyncio.to_thread(work_queue.stats)}
+    return json.dumps({
+        "admission": admission.stats(),
+        "agent_loops": agent_loops.stats(),
+        "agent_pool": agent_pool.stats(),
+        "chunked_review": _chunked_review_stats(),
+        "event_loop_lag": loop_lag.stats(),
+        "http": http_clients.stats(),
+        "jobs": job_manager.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_limits": ({"workers": await worker_pool.llm_limits()} if worker_pool is not None
+                       else llm_limits.stats()),
+        "pr_cache": pr_data_cache.stats(),
+        "result_store": result_store.stats() if result_store is not None else None,
+        "routing": router.stats() if work_queue is not None else None,
+        "single_flight": inflight.stats(),
+        "stages": stage_stats.stats(),
+        "startup": {**startup.stats(), "pr_agent": pr_agent_stack.stats()},
+        "streaming": stream_stats.stats(),
+        "warm_up": warm_up.stats(),
+        "work_queue": shared_queue,
+        "workers": worker_pool.stats() if worker_pool is not None else None,
+    }, indent=2)
+
+
+@mcp.tool()
+@instrumented
+async def manage_llm_limits(deployment: str = "", limit: float = 0, max_limit: float = 0,
+                            tokens_per_minute: int = 0) -> str:
+    """
+    Show, and optionally adjust, the adaptive LLM concurrency limits and token budgets.
+
+    The server learns how many parallel calls each LLM deployment sustains: the limit grows
+    while calls succeed and is cut on throttling (HTTP 429) responses. Deployments with a
+    tokens-per-minute quota also hold prompts back until the budget has room for them.
+
+    Args:
+        deployment: Deployment (or model) to adjust; leave empty to only read the limits
+        limit: New current concurrency limit for the deployment (0 keeps the learned value)
+        max_limit: New upper bound for the deployment's limit, e.g. after a quota change (0 keeps it)
+        tokens_per_minute: New tokens-per-minute quota for the deployment (0 keeps it)
+
+    Returns:
+        A JSON document with each deployment's current limit, throttle events, retry-after waits
+        and token budget; in worker mode, one such document per worker process
+    """
+    if worker_pool is not None:
+        # The LLM calls, and so the limits that matter, are in the worker processes
+        workers = await worker_pool.llm_limits(deployment, limit, max_limit, tokens_per_minute)
+        return json.dumps({"workers": workers}, indent=2)
+    if deployment:
+        llm_limits.configure(deployment, limit, max_limit, tokens_per_minute)
+    return json.dumps(llm_limits.stats(), indent=2)
+
+
 #
 #
 # @mcp.tool()
@@ -220,21 +854,70 @@ async def describe_pr(pr_url: str, ctx: Context) -> str:
 #     """
 
 
-if __name__ == "__main__":
-    import os
-    from dotenv import load_dotenv
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+async def ready_endpoint(request: Request) -> JSONResponse:
+    return JSONResponse(warm_up.stats(), status_code=200 if warm_up.ready else 503)
+
 
-    load_dotenv()
+def create_app() -> Starlette:
+    """The MCP SSE app, plus the metrics and readiness routes."""
+    app = mcp.sse_app()
+    if METRICS_PATH:
+        app.router.routes.append(Route(METRICS_PATH, endpoint=metrics_endpoint, methods=["GET"]))
+    if READY_PATH:
+        app.router.routes.append(Route(READY_PATH, endpoint=ready_endpoint, methods=["GET"]))
+    return app
 
-    get_settings().set("CONFIG.git_provider", os.getenv("CONFIG_GIT_PROVIDER"))
 
-    get_settings().set("openai.key", os.getenv("OPENAI_API_KEY"))
-    get_settings().set("openai.api_type", os.getenv("OPENAI_API_TYPE"))
-    get_settings().set("openai.api_version", os.getenv("OPENAI_API_VERSION"))
-    get_settings().set("openai.api_base", os.getenv("OPENAI_API_BASE"))
-    get_settings().set("openai.deployment_id", os.getenv("OPENAI_API_DEPLOYMENT"))
+startup.mark("imports")
+
+
+async def _after_startup(server: uvicorn.Server) -> None:
+    """Once the server answers requests: warm up, flip the readiness flag and compact the result store."""
+    while not server.started:
+        await asyncio.sleep(0.01)
+    startup.mark("listening")
+    ready = await warm_up.run()
+    if ready:
+        startup.mark("ready")
+    if queue_consumers is not None:
+        # A replica takes shared work only once it can run it, which a non-strict warm-up does not guarantee
+        runtime = "pr_agent" if worker_pool is None else "workers"
+        if ready and warm_up.succeeded(runtime) and warm_up.succeeded("work_queue"):
+            queue_consumers.start(_run_work_item)
+        else:
+            logger.warning(f"Warm-up of {runtime} or the work queue failed, not taking work from the shared work queue")
+    startup.report()
+    if result_store is not None:
+        await asyncio.to_thread(result_store.compact)
+
+
+if __name__ == "__main__":
+    apply_env_settings()
+    startup.mark("settings")
 
-    get_settings().set("github.user_token", os.getenv("GITHUB_USER_TOKEN"))
+    async def serve() -> None:
+        install_blocking_executor(asyncio.get_running_loop())
+        agent_loops.start()
+        loop_lag.start()
+        job_manager.start()
+        _restore_jobs()
+        config = uvicorn.Config(create_app(), host=mcp.settings.host, port=mcp.settings.port,
+                                log_level=mcp.settings.log_level.lower())
+        server = uvicorn.Server(config)
+        after_startup = asyncio.create_task(_after_startup(server))
+        try:
+            await server.serve()
+        finally:
+            after_startup.cancel()
+            if queue_consumers is not None:
+                await queue_consumers.close()
+            if worker_pool is not None:
+                await worker_pool.close()
+            await http_clients.aclose()
 
     # Run the MCP server
-    mcp.run(transport="sse")
+    asyncio.run(serve())
@@ -0,0 +1,255 @@
+import copy
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Mapping, Optional
+
+from dynaconf.utils.boxing import DynaBox
+from dynaconf.utils.parse_conf import parse_conf_data
+from pr_agent.config_loader import get_settings
+from starlette_context import request_cycle_context
+
+_UNSET = object()
+
+
+def _split_key(key: str):
+    section, _, rest = key.partition(".")
+    return section.upper(), rest
+
+
+class _SectionView:
+    """
+    Live view of one settings section through an overlay.
+
+    Reads go to the overlay's private copy of the section if it has one, otherwise to the
+    base settings. Writes always land in the overlay, copying the section on first write.
+    """
+
+    __slots__ = ("_overlay", "_name")
+
+    def __init__(self, overlay: "SettingsOverlay", name: str):
+        object.__setattr__(self, "_overlay", overlay)
+        object.__setattr__(self, "_name", name)
+
+    def _box(self):
+        return self._overlay._read_section(self._name) or DynaBox()
+
+    def __getattr__(self, item):
+        return getattr(self._box(), item)
+
+    def __setattr__(self, item, value):
+        self._overlay._write_section(self._name)[item] = value
+
+    def __getitem__(self, item):
+        return self._box()[item]
+
+    def __setitem__(self, item, value):
+        self._overlay._write_section(self._name)[item] = value
+
+    def __contains__(self, item) -> bool:
+        return item in self._box()
+
+    def __iter__(self):
+        return iter(self._box())
+
+    def __len__(self) -> int:
+        return len(self._box())
+
+    def __eq__(self, other) -> bool:
+        return self._box() == other
+
+    def __repr__(self) -> str:
+        return repr(self._box())
+
+    def get(self, item, default=None):
+        return self._box().get(item, default)
+
+    def keys(self):
+        return self._box().keys()
+
+    def values(self):
+        return self._box().values()
+
+    def items(self):
+        return self._box().items()
+
+    def to_dict(self) -> dict:
+        return self._box().to_dict()
+
+
+class SettingsOverlay:
+    """
+    Copy-on-write settings layer on top of a Dynaconf settings object.
+
+    Only sections that are written to are copied into the overlay; everything else is read
+    straight from the base object, which is never modified. Install an overlay for the current
+    task with `settings_scope()` so that `pr_agent.config_loader.get_settings()` returns it.
+    """
+
+    def __init__(self, base):
+        object.__setattr__(self, "_base", base)
+        object.__setattr__(self, "_sections", {})
+
+    def _read_section(self, name: str):
+        section = self._sections.get(name)
+        if section is None:
+            return self._base.get(name)
+        if section is _UNSET:
+            return None
+        return section
+
+    def _write_section(self, name: str) -> DynaBox:
+        section = self._sections.get(name)
+        if section is None or section is _UNSET:
+            base_section = self._base.get(name) if section is None else None
+            if isinstance(base_section, Mapping):
+                section = DynaBox(copy.deepcopy(dict(base_section)), box_settings={})
+            else:
+                section = DynaBox(box_settings={})
+            self._sections[name] = section
+        return section
+
+    def overridden_sections(self) -> Dict[str, Any]:
+        """Return the sections this overlay has replaced, `None` marking an unset section."""
+        return {name: (None if section is _UNSET else section.to_dict())
+                for name, section in self._sections.items()}
+
+    def get(self, key: str, default: Any = None, **kwargs) -> Any:
+        section_name, rest = _split_key(key)
+        if section_name not in self._sections:
+            if rest:
+                return self._base.get(key, default, **kwargs)
+            if not isinstance(self._base.get(section_name), Mapping):
+                return self._base.get(key, default, **kwargs)
+            # Callers may mutate a section they fetched whole, so hand out the private copy
+            return self._write_section(section_name)
+
+        value = self._read_section(section_name)
+        if value is None:
+            return default
+        for part in rest.split(".") if rest else ():
+            if not hasattr(value, "get"):
+                return default
+            value = value.get(part, _UNSET)
+            if value is _UNSET:
+                value = default
+                break
+        return value
+
+    def set(self, key: str, value: Any, tomlfy: bool = False, merge: bool = False, **kwargs) -> None:
+        value = parse_conf_data(value, tomlfy=tomlfy, box_settings=self._base)
+        section_name, rest = _split_key(key)
+        if not rest:
+            if merge and isinstance(value, Mapping):
+                self._write_section(section_name).update(value)
+            elif isinstance(value, Mapping):
+                self._sections[section_name] = DynaBox(copy.deepcopy(dict(value)), box_settings={})
+            else:
+                self._sections[section_name] = value
+            return
+
+        target = self._write_section(section_name)
+        *parents, leaf = rest.split(".")
+        for part in parents:
+            if not isinstance(target.get(part), Mapping):
+                target[part] = DynaBox(box_settings={})
+            target = target[part]
+        target[leaf] = value
+
+    def unset(self, key: str, **kwargs) -> None:
+        section_name, rest = _split_key(key)
+        if not rest:
+            self._sections[section_name] = _UNSET
+            return
+        target = self._write_section(section_name)
+        *parents, leaf = rest.split(".")
+        for part in parents:
+            target = target.get(part)
+            if not isinstance(target, Mapping):
+                return
+        target.pop(leaf, None)
+
+    def exists(self, key: str, **kwargs) -> bool:
+        return self.get(key, _UNSET) is not _UNSET
+
+    def as_dict(self, **kwargs) -> dict:
+        data = self._base.as_dict(**kwargs)
+        for name, section in self._sections.items():
+            if section is _UNSET:
+                data.pop(name, None)
+            else:
+                data[name] = section.to_dict() if isinstance(section, DynaBox) else copy.deepcopy(section)
+        return data
+
+    to_dict = as_dict
+
+    def __getattr__(self, item: str) -> Any:
+        if item.startswith("_"):
+            return getattr(self._base, item)
+        name = item.upper()
+        if name in self._sections:
+            section = self._sections[name]
+            if section is _UNSET:
+                raise AttributeError(item)
+            return _SectionView(self, name) if isinstance(section, Mapping) else section
+        value = getattr(self._base, item)
+        if isinstance(value, Mapping):
+            return _SectionView(self, name)
+        return value
+
+    def __setattr__(self, item: str, value: Any) -> None:
+        self.set(item, value)
+
+    def __getitem__(self, item: str) -> Any:
+        value = self.get(item, _UNSET)
+        if value is _UNSET:
+            raise KeyError(item)
+        return value
+
+    def __setitem__(self, item: str, value: Any) -> None:
+        self.set(item, value)
+
+    def __contains__(self, item: str) -> bool:
+        return self.exists(item)
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set()
+        for key in self._base:
+            if self._sections.get(key.upper()) is _UNSET:
+                continue
+            seen.add(key.upper())
+            yield key
+        for name, section in self._sections.items():
+            if name not in seen and section is not _UNSET:
+                yield name
+
+
+@contextmanager
+def settings_scope(overrides: Optional[Mapping[str, Any]] = None) -> Iterator[SettingsOverlay]:
+    """
+    Run a block against a private settings overlay.
+
+    Every `get_settings()` call made by PR-Agent inside the block (including from tasks it
+    spawns) resolves to the overlay, so concurrent tool calls can carry different options
+    without touching the process-wide settings.
+
+    Args:
+        overrides: Dotted setting keys to set on the overlay, e.g. {"config.publish_output": False}
+    """
+    overlay = SettingsOverlay(get_settings())
+    for key, value in (overrides or {}).items():
+        overlay.set(key, value)
+    with request_cycle_context({"settings": overlay}):
+        yield overlay
+
+
+def apply_env_settings() -> None:
+    """Set the process-wide defaults from the environment; tool calls layer their own options on top."""
+    get_settings().set("CONFIG.git_provider", os.getenv("CONFIG_GIT_PROVIDER"))
+
+    get_settings().set("openai.key", os.getenv("OPENAI_API_KEY"))
+    get_settings().set("openai.api_type", os.getenv("OPENAI_API_TYPE"))
+    get_settings().set("openai.api_version", os.getenv("OPENAI_API_VERSION"))
+    get_settings().set("openai.api_base", os.getenv("OPENAI_API_BASE"))
+    get_settings().set("openai.deployment_id", os.getenv("OPENAI_API_DEPLOYMENT"))
+
+    get_settings().set("github.user_token", os.getenv("GITHUB_USER_TOKEN"))
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from pr_agent.log import get_logger
+
+logger = get_logger()
+
+
+def _process_start() -> float:
+    """Monotonic clock reading at which this process started, or now where the OS does not say."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22, clock ticks after boot; the fields after the command name start at field 3
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.monotonic() - max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.monotonic()
+
+
+class StartupTimer:
+    """
+    Timing of the server's startup.
+
+    `mark()` records when a milestone was reached, in seconds since the process started
+    (e.g. "imports", "listening"); `phase()` times a step that may run in the background,
+    such as importing PR-Agent. `report()` logs both on one line.
+    """
+
+    def __init__(self):
+        self.started = _process_start()
+        self._lock = threading.Lock()
+        self._milestones: Dict[str, float] = {}
+        self._phases: Dict[str, float] = {}
+
+    def mark(self, name: str) -> None:
+        with self._lock:
+            self._milestones[name] = time.monotonic() - self.started
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._phases[name] = time.monotonic() - start
+
+    def report(self) -> None:
+        stats = self.stats()
+        milestones = ", ".join(f"{name} at {seconds:.2f}s" for name, seconds in stats["milestones"].items())
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stats["phases"].items())
+        logger.info(f"Startup: {milestones}" + (f" (took: {phases})" if phases else ""))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "milestones": {name: round(seconds, 3) for name, seconds in self._milestones.items()},
+                "phases": {name: round(seconds, 3) for name, seconds in self._phases.items()},
+            }
+
+
+class LazyImport:
+    """
+    Imports a group of heavy modules on first use, off the event loop.
+
+    `load` does the imports and whatever setup depends on them, and runs once. Coroutines
+    `await ready()` before using the modules; the first caller starts `load` on a worker
+    thread and every caller waits for it, so the event loop keeps serving in the meantime.
+    A failed load is raised to the callers waiting for it and retried by the next one.
+    """
+
+    def __init__(self, name: str, load: Callable[[], Any], timer: Optional[StartupTimer] = None):
+        self.name = name
+        self._load = load
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._loading: Optional[asyncio.Future] = None
+        self.loaded = False
+        self.value: Any = None
+
+    def load(self) -> Any:
+        """Run the imports on the calling thread if they have not run yet."""
+        with self._lock:
+            if not self.loaded:
+                start = time.monotonic()
+                with self._timer.phase(self.name) if self._timer is not None else nullcontext():
+                    self.value = self._load()
+                self.loaded = True
+                logger.info(f"Loaded {self.name} in {time.monotonic() - start:.2f}s")
+        return self.value
+
+    async def ready(self) -> Any:
+        if self.loaded:
+            return self.value
+        if self._loading is None or (self._loading.done() and self._loading.exception() is not None):
+            self._loading = asyncio.ensure_future(asyncio.to_thread(self.load))
+        return await asyncio.shield(self._loading)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "loading": self._loading is not None and not self._loading.done(),
+        }
+
+
+startup = StartupTimer()
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from pr_agent.log import get_logger
+
+logger = get_logger()
+
+# Whether model output is forwarded to the client while it is generated
+STREAM_LLM_OUTPUT = os.getenv("STREAM_LLM_OUTPUT", "true").lower() in ("1", "true", "yes")
+
+# Streamed output is sent in whole lines, once at least this many characters or seconds have accumulated
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "200"))
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "1.0"))
+
+StreamWriter = Callable[[str], Awaitable[Any]]
+
+
+class LLMStream:
+    """
+    Destination of the model output generated for one tool call, e.g. `ctx.info`.
+
+    Sends happen on the event loop that opened the stream. A failed send (the client went
+    away) turns the stream off for the rest of the call; the model response is still
+    collected in full and returned as usual.
+    """
+
+    def __init__(self, send: StreamWriter):
+        self._send = send
+        self._loop = asyncio.get_running_loop()
+        self.closed = False
+
+    async def write(self, text: str) -> None:
+        if self.closed or not text.strip():
+            return
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                await self._send(text)
+            else:
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._send(text), self._loop))
+            stream_stats.sent()
+        except Exception as e:
+            logger.debug(f"Stopped streaming model output: {e}")
+            self.closed = True
+
+
+_current_stream: ContextVar[Optional[LLMStream]] = ContextVar("llm_stream", default=None)
+
+
+@contextmanager
+def stream_scope(send: Optional[StreamWriter]) -> Iterator[Optional[LLMStream]]:
+    """Stream the model output of everything run inside the block to `send`."""
+    if send is None or not STREAM_LLM_OUTPUT:
+        yield None
+        return
+    stream = LLMStream(send)
+    token = _current_stream.set(stream)
+    try:
+        yield stream
+    finally:
+        _current_stream.reset(token)
+
+
+class StreamStats:
+    """How soon streamed completions produced their first output, and how much was sent."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.completions = 0
+        self.messages_sent = 0
+        self.first_token_seconds_total = 0.0
+        self.first_token_seconds_max = 0.0
+        self.completion_seconds_total = 0.0
+
+    def sent(self) -> None:
+        with self._lock:
+            self.messages_sent += 1
+
+    def record(self, first_token: float, total: float) -> None:
+        with self._lock:
+            self.completions += 1
+            self.first_token_seconds_total += first_token
+            self.first_token_seconds_max = max(self.first_token_seconds_max, first_token)
+            self.completion_seconds_total += total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completions = self.completions
+            return {
+                "enabled": STREAM_LLM_OUTPUT,
+                "completions": completions,
+                "messages_sent": self.messages_sent,
+                "first_token_seconds_avg": round(self.first_token_seconds_total / completions, 3)
+                if completions else 0.0,
+                "first_token_seconds_max": round(self.first_token_seconds_max, 3),
+                "completion_seconds_avg": round(self.completion_seconds_total / completions, 3)
+                if completions else 0.0,
+            }
+
+
+stream_stats = StreamStats()
+
+
+async def _streamed_completion(stream: LLMStream, acompletion: Callable, **kwargs: Any):
+    start = time.monotonic()
+    first_token = None
+    chunks = []
+    pending = ""
+    flushed_at = start
+    response = await acompletion(**kwargs, stream=True)
+    async for chunk in response:
+        chunks.append(chunk)
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            continue
+        now = time.monotonic()
+        if first_token is None:
+            first_token = now - start
+        pending += delta
+        if "\n" in pending and (len(pending) >= STREAM_FLUSH_CHARS or now - flushed_at >= STREAM_FLUSH_INTERVAL):
+            cut = pending.rfind("\n") + 1
+            await stream.write(pending[:cut])
+            pending = pending[cut:]
+            flushed_at = now
+    await stream.write(pending)
+    stream_stats.record(first_token if first_token is not None else time.monotonic() - start,
+                        time.monotonic() - start)
+    # Same response object a non-streamed call returns, so PR-Agent's handler is unaffected
+    import litellm
+
+    return litellm.stream_chunk_builder(chunks, messages=kwargs.get("messages"))
+
+
+def install_streaming_hook() -> None:
+    """Make PR-Agent's LiteLLM calls stream their output when a `stream_scope()` is active."""
+    from pr_agent.algo.ai_handlers import litellm_ai_handler
+
+    if getattr(litellm_ai_handler, "_streaming_hook_installed", False):
+        return
+    acompletion = litellm_ai_handler.acompletion
+
+    async def streaming_acompletion(**kwargs: Any):
+        stream = _current_stream.get()
+        if stream is None or stream.closed:
+            return await acompletion(**kwargs)
+        return await _streamed_completion(stream, acompletion, **kwargs)
+
+    litellm_ai_handler.acompletion = streaming_acompletion
+    litellm_ai_handler._streaming_hook_installed = True
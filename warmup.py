@@ -0,0 +1,162 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+from http_clients import http_clients
+
+logger = get_logger()
+
+# Timeout of the requests that check the GitHub and LLM credentials, in seconds
+CHECK_TIMEOUT = 10
+
+Step = Callable[[], Union[Any, Awaitable[Any]]]
+
+
+class WarmUpError(Exception):
+    """Raised by a warm-up step that found the server cannot work, e.g. rejected credentials."""
+
+
+class WarmUp:
+    """
+    Steps that prepare the server for its first tool call, and the readiness flag they gate.
+
+    `run()` executes the steps in the order they were added, each bounded by
+    `step_timeout`; coroutine functions run on the event loop, others on a worker thread.
+    A failing step is logged and the next one runs. `ready` turns true once every step has
+    run, or, with `strict`, only if every step succeeded, so a server with bad credentials
+    is never marked ready. Without warm-up the server is ready as soon as it listens.
+    """
+
+    def __init__(self, enabled: bool = True, step_timeout: float = 120, strict: bool = False):
+        self.enabled = enabled
+        self.step_timeout = step_timeout
+        self.strict = strict
+        self._steps: List[Tuple[str, Step]] = []
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self.ready = False
+        self.running = False
+
+    @classmethod
+    def from_env(cls) -> "WarmUp":
+        return cls(
+            enabled=os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes"),
+            step_timeout=float(os.getenv("WARMUP_STEP_TIMEOUT", "120")),
+            strict=os.getenv("WARMUP_STRICT", "false").lower() in ("1", "true", "yes"),
+        )
+
+    def add(self, name: str, step: Step) -> None:
+        self._steps.append((name, step))
+
+    async def _run_step(self, step: Step) -> Any:
+        if asyncio.iscoroutinefunction(step):
+            return await step()
+        return await asyncio.to_thread(step)
+
+    async def run(self) -> bool:
+        """Run the steps and set the readiness flag; returns whether the server is ready."""
+        if not self.enabled:
+            self.ready = True
+            return True
+        self.running = True
+        failed = 0
+        try:
+            for name, step in self._steps:
+                start = time.monotonic()
+                try:
+                    detail = await asyncio.wait_for(self._run_step(step), self.step_timeout)
+                    self._results[name] = {"ok": True, "seconds": round(time.monotonic() - start, 3),
+                                           "detail": str(detail) if detail is not None else ""}
+                except Exception as e:
+                    failed += 1
+                    error = str(e) or type(e).__name__
+                    self._results[name] = {"ok": False, "seconds": round(time.monotonic() - start, 3),
+                                           "detail": error}
+                    logger.error(f"Warm-up step {name} failed: {error}")
+        finally:
+            self.running = False
+        self.ready = not (self.strict and failed)
+        steps = ", ".join(f"{name} {result['seconds']:.2f}s{'' if result['ok'] else ' (failed)'}"
+                          for name, result in self._results.items())
+        logger.info(f"Warm-up finished: {steps}; server is {'ready' if self.ready else 'not ready'}")
+        return self.ready
+
+    def succeeded(self, name: str) -> bool:
+        """Whether the step ran without error; every step counts as succeeded when warm-up is disabled."""
+        if not self.enabled:
+            return True
+        result = self._results.get(name)
+        return result is not None and result["ok"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "running": self.running,
+            "steps": {name: dict(result) for name, result in self._results.items()},
+        }
+
+
+def load_tokenizer() -> str:
+    """Load the tokenizer of the configured model, which tiktoken may download on first use."""
+    from pr_agent.algo.token_handler import TokenEncoder
+
+    TokenEncoder.get_token_encoder()
+    return get_settings().config.model
+
+
+def load_prompts() -> str:
+    """Read the review and describe prompt templates and check that they parse."""
+    from jinja2 import Environment, StrictUndefined
+
+    environment = Environment(undefined=StrictUndefined)
+    for section in ("pr_review_prompt", "pr_description_prompt"):
+        for part in ("system", "user"):
+            environment.parse(get_settings().get(f"{section}.{part}"))
+    return "pr_review_prompt, pr_description_prompt"
+
+
+def check_github() -> Optional[str]:
+    """Open a pooled connection to the GitHub API and check that it accepts the token."""
+    if get_settings().get("CONFIG.GIT_PROVIDER", "github") != "github":
+        return "skipped, the git provider is not GitHub"
+    base_url = get_settings().get("GITHUB.BASE_URL", "https://api.github.com").rstrip("/")
+    headers = {"Accept": "application/vnd.github+json"}
+    token = get_settings().get("GITHUB.USER_TOKEN", None)
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    # /rate_limit does not count against the rate limit
+    response = http_clients.session.get(f"{base_url}/rate_limit", headers=headers, timeout=CHECK_TIMEOUT)
+    if response.status_code in (401, 403):
+        raise WarmUpError(f"GitHub rejected the token (HTTP {response.status_code})")
+    response.raise_for_status()
+    remaining = response.json().get("resources", {}).get("core", {}).get("remaining")
+    return f"{remaining} requests left" if remaining is not None else None
+
+
+async def check_llm() -> Optional[str]:
+    """Open a pooled connection to the OpenAI or Azure OpenAI endpoint and check that it accepts the key."""
+    settings = get_settings()
+    key = settings.get("OPENAI.KEY", None)
+    if not key:
+        return "skipped, no OpenAI key configured"
+    api_base = (settings.get("OPENAI.API_BASE", None) or "").rstrip("/")
+    if settings.get("OPENAI.API_TYPE", None) == "azure":
+        if not api_base:
+            raise WarmUpError("OPENAI_API_BASE is required for Azure OpenAI")
+        url = f"{api_base}/openai/models"
+        params = {"api-version": settings.get("OPENAI.API_VERSION", None) or "2024-02-01"}
+        headers = {"api-key": key}
+    else:
+        url = f"{api_base or 'https://api.openai.com/v1'}/models"
+        params = {}
+        headers = {"Authorization": f"Bearer {key}"}
+    # Listing models costs no tokens
+    response = await http_clients.async_client.get(url, params=params, headers=headers, timeout=CHECK_TIMEOUT)
+    if response.status_code in (401, 403):
+        raise WarmUpError(f"The LLM endpoint rejected the key (HTTP {response.status_code})")
+    response.raise_for_status()
+    return response.http_version
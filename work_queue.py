@@ -0,0 +1,874 @@
+"""
+A work queue shared by several replicas of the server.
+
+With `WORK_QUEUE_URL` set, the tool handlers put PR-Agent commands into the queue instead of
+running them, and every replica's consumers take work from it when they have a free slot, so
+load spreads evenly whichever replica an MCP session is connected to. Work is keyed by PR,
+command, head commit and settings: a command that is already queued or running anywhere is
+joined instead of being queued again. With a `Router`, each command is routed to the replica
+that owns its repository, which takes it first; other replicas take it only once it has
+waited `steal_after` seconds or its owner has left.
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type
+
+from pr_agent.log import get_logger
+
+from jobs import CANCELLED, FAILED, FINISHED_STATES, QUEUED, RUNNING, SUCCEEDED
+from routing import Router
+
+logger = get_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    command TEXT NOT NULL,
+    pr_url TEXT NOT NULL,
+    overrides TEXT,
+    head_sha TEXT,
+    route TEXT,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_work_items_claim ON work_items (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_work_items_key ON work_items (key, status);
+
+CREATE TABLE IF NOT EXISTS replicas (
+    name TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+"""
+
+
+class WorkItemError(Exception):
+    """Raised to the callers waiting for a work item that failed or was cancelled."""
+
+
+@dataclass
+class WorkItem:
+    id: str
+    key: str
+    command: str
+    pr_url: str
+    overrides: Optional[Dict[str, Any]] = None
+    head_sha: Optional[str] = None
+    route: Optional[str] = None
+    status: str = QUEUED
+    result: Optional[str] = None
+    error: Optional[str] = None
+    owner: Optional[str] = None
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "WorkItem":
+        """Build an item from a database row or Redis hash, where every value may be a string or missing."""
+
+        def number(name: str) -> Optional[float]:
+            value = row.get(name)
+            return float(value) if value not in (None, "") else None
+
+        return cls(
+            id=row["id"],
+            key=row["key"],
+            command=row["command"],
+            pr_url=row["pr_url"],
+            overrides=json.loads(row["overrides"]) if row.get("overrides") else None,
+            head_sha=row.get("head_sha") or None,
+            route=row.get("route") or None,
+            status=row["status"],
+            result=row.get("result") or None,
+            error=row.get("error") or None,
+            owner=row.get("owner") or None,
+            attempts=int(row.get("attempts") or 0),
+            created_at=float(row["created_at"]),
+            started_at=number("started_at"),
+            finished_at=number("finished_at"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "command": self.command,
+            "pr_url": self.pr_url,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "replica": self.owner,
+            "routed_to": self.route,
+        }
+
+    def value(self) -> Optional[str]:
+        """The command's output once the item has succeeded; raises if it failed or was cancelled."""
+        if self.status == FAILED:
+            raise WorkItemError(self.error or f"{self.command} failed for {self.pr_url}")
+        if self.status == CANCELLED:
+            raise WorkItemError(f"{self.command} for {self.pr_url} was cancelled")
+        return self.result
+
+
+def default_replica() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    A queue of PR-Agent commands that several server processes share.
+
+    Consumers `claim()` the oldest queued item they may take and hold it under a lease of
+    `lease_seconds`, which they renew with `heartbeat()` while the command runs. Consumers
+    `register()` their replica at least every `lease_seconds`; `replicas()` lists those that
+    did, which is the membership of the routing ring. `maintain()` puts items whose
+    lease ran out, because their replica stopped, back in the queue, and fails them after
+    `max_attempts`. Finished items stay readable for `retention_seconds`.
+
+    The methods block; the server calls them through `asyncio.to_thread`.
+    """
+
+    def __init__(self, poll_interval: float = 0.5, lease_seconds: float = 60, max_attempts: int = 3,
+                 retention_seconds: float = 86400):
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+
+    @classmethod
+    def from_env(cls) -> Optional["WorkQueue"]:
+        url = os.getenv("WORK_QUEUE_URL", "")
+        if not url:
+            return None
+        options = dict(
+            poll_interval=float(os.getenv("WORK_QUEUE_POLL_INTERVAL", "0.5")),
+            lease_seconds=float(os.getenv("WORK_QUEUE_LEASE_SECONDS", "60")),
+            max_attempts=int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "3")),
+            retention_seconds=float(os.getenv("WORK_QUEUE_RETENTION_HOURS", "24")) * 3600,
+        )
+        if url.startswith(("redis://", "rediss://", "unix://")):
+            return RedisWorkQueue(url, prefix=os.getenv("WORK_QUEUE_PREFIX", "pr_agent:work:"), **options)
+        return SQLiteWorkQueue(url[len("sqlite:///"):] if url.startswith("sqlite:///") else url, **options)
+
+    def enqueue(self, key: str, command: str, pr_url: str, overrides: Optional[Dict[str, Any]] = None,
+                head_sha: Optional[str] = None, route: Optional[str] = None) -> Tuple[WorkItem, bool]:
+        """
+        Queue a command for the replica `route` (any replica if None), unless an item with the
+        same key is queued or running.
+
+        Returns:
+            The new or existing item, and whether it was queued by this call
+        """
+        raise NotImplementedError
+
+    def claim(self, owner: str, replicas: Sequence[str] = (), steal_after: float = 0) -> Optional[WorkItem]:
+        """
+        Take the oldest queued item for `owner`, or return None if there is none it may take.
+
+        Items routed to `owner` come first. Items routed to another of the live `replicas`
+        are taken only once they have waited `steal_after` seconds; unrouted items and items
+        routed to replicas that left are taken straight away.
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, item_id: str, owner: str) -> bool:
+        """Renew the lease; False if `owner` no longer holds the item, e.g. because it was cancelled."""
+        raise NotImplementedError
+
+    def finish(self, item_id: str, owner: str, status: str, result: Optional[str] = None,
+               error: Optional[str] = None) -> bool:
+        raise NotImplementedError
+
+    def release(self, item_id: str, owner: str, retry: bool = False) -> bool:
+        """
+        Put a claimed item back at the front of the queue without counting the attempt.
+
+        With `retry` the attempt counts and the item loses its route, for a command that
+        failed because of the replica running it rather than the command itself.
+        """
+        raise NotImplementedError
+
+    def cancel(self, item_id: str) -> Optional[WorkItem]:
+        """Cancel a queued or running item; the replica running it stops at its next heartbeat."""
+        raise NotImplementedError
+
+    def get(self, item_id: str) -> Optional[WorkItem]:
+        raise NotImplementedError
+
+    def maintain(self) -> Dict[str, int]:
+        """Requeue or fail items with an expired lease, drop old finished items, and return the queue depth."""
+        raise NotImplementedError
+
+    def register(self, replica: str) -> None:
+        raise NotImplementedError
+
+    def unregister(self, replica: str) -> None:
+        raise NotImplementedError
+
+    def replicas(self) -> List[str]:
+        """Replicas that registered within the last `lease_seconds`."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    async def wait(self, item_id: str, timeout: Optional[float] = None) -> Optional[WorkItem]:
+        """Poll an item until it has finished or `timeout` seconds have passed, and return it either way."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            item = await asyncio.to_thread(self.get, item_id)
+            if item is None or item.status in FINISHED_STATES:
+                return item
+            if deadline is not None and time.monotonic() >= deadline:
+                return item
+            delay = self.poll_interval
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            await asyncio.sleep(delay)
+
+    def _abandoned_error(self, owner: Optional[str]) -> str:
+        return f"Gave up after {self.max_attempts} attempts; replica {owner} stopped while running the command"
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    Work queue in a SQLite (WAL) file, for replicas on one host or sharing a local volume.
+
+    Claims and deduplication run in `BEGIN IMMEDIATE` transactions, which hold the file's
+    write lock, so they are atomic across processes. SQLite locking is not reliable on
+    network filesystems; use Redis for replicas on different hosts.
+    """
+
+    def __init__(self, path: str, **options: Any):
+        super().__init__(**options)
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Other replicas hold the write lock only briefly; wait for it rather than failing
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(work_items)")}
+            if "route" not in columns:
+                self._conn.execute("ALTER TABLE work_items ADD COLUMN route TEXT")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _get(self, conn: sqlite3.Connection, item_id: str) -> Optional[WorkItem]:
+        row = conn.execute("SELECT * FROM work_items WHERE id = ?", (item_id,)).fetchone()
+        return WorkItem.from_row(dict(row)) if row is not None else None
+
+    def enqueue(self, key: str, command: str, pr_url: str, overrides: Optional[Dict[str, Any]] = None,
+                head_sha: Optional[str] = None, route: Optional[str] = None) -> Tuple[WorkItem, bool]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM work_items WHERE key = ? AND status IN ('queued', 'running') ORDER BY created_at LIMIT 1",
+                (key,),
+            ).fetchone()
+            if row is not None:
+                return WorkItem.from_row(dict(row)), False
+            item = WorkItem(id=uuid.uuid4().hex, key=key, command=command, pr_url=pr_url, overrides=overrides,
+                            head_sha=head_sha, route=route)
+            conn.execute(
+                "INSERT INTO work_items (id, key, command, pr_url, overrides, head_sha, route, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (item.id, key, command, pr_url, json.dumps(overrides) if overrides else None, head_sha, route,
+                 QUEUED, item.created_at),
+            )
+        return item, True
+
+    def claim(self, owner: str, replicas: Sequence[str] = (), steal_after: float = 0) -> Optional[WorkItem]:
+        now = time.time()
+        others = [replica for replica in replicas if replica != owner]
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM work_items WHERE status = 'queued' AND (route IS NULL OR route = ? OR created_at < ? "
+                f"OR route NOT IN ({', '.join('?' * len(others))})) ORDER BY route IS ? DESC, created_at LIMIT 1",
+                (owner, now - steal_after, *others, owner),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE work_items SET status = 'running', owner = ?, lease_until = ?, started_at = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (owner, now + self.lease_seconds, now, row["id"]),
+            )
+            return self._get(conn, row["id"])
+
+    def heartbeat(self, item_id: str, owner: str) -> bool:
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE work_items SET lease_until = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, item_id, owner),
+            ).rowcount
+        return updated == 1
+
+    def finish(self, item_id: str, owner: str, status: str, result: Optional[str] = None,
+               error: Optional[str] = None) -> bool:
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE work_items SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (status, result, error, time.time(), item_id, owner),
+            ).rowcount
+        return updated == 1
+
+    def release(self, item_id: str, owner: str, retry: bool = False) -> bool:
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE work_items SET status = 'queued', owner = NULL, lease_until = NULL, started_at = NULL, "
+                + ("route = NULL" if retry else "attempts = attempts - 1")
+                + " WHERE id = ? AND owner = ? AND status = 'running'",
+                (item_id, owner),
+            ).rowcount
+        return updated == 1
+
+    def cancel(self, item_id: str) -> Optional[WorkItem]:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE work_items SET status = 'cancelled', finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), item_id),
+            )
+            return self._get(conn, item_id)
+
+    def get(self, item_id: str) -> Optional[WorkItem]:
+        with self._lock:
+            return self._get(self._conn, item_id)
+
+    def maintain(self) -> Dict[str, int]:
+        now = time.time()
+        with self._transaction() as conn:
+            expired = conn.execute(
+                "SELECT id, owner, attempts FROM work_items WHERE status = 'running' AND lease_until < ?", (now,)
+            ).fetchall()
+            for row in expired:
+                if row["attempts"] >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE work_items SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL "
+                        "WHERE id = ?",
+                        (self._abandoned_error(row["owner"]), now, row["id"]),
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE work_items SET status = 'queued', owner = NULL, lease_until = NULL WHERE id = ?",
+                        (row["id"],),
+                    )
+                logger.warning(f"Lease of work item {row['id']} held by {row['owner']} expired")
+            conn.execute(
+                "DELETE FROM work_items WHERE status NOT IN ('queued', 'running') AND finished_at < ?",
+                (now - self.retention_seconds,),
+            )
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM work_items WHERE status IN ('queued', 'running') GROUP BY status"
+            ).fetchall())
+        return {QUEUED: counts.get(QUEUED, 0), RUNNING: counts.get(RUNNING, 0)}
+
+    def register(self, replica: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO replicas (name, seen_at) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET seen_at = excluded.seen_at",
+                (replica, time.time()),
+            )
+
+    def unregister(self, replica: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM replicas WHERE name = ?", (replica,))
+
+    def replicas(self) -> List[str]:
+        cutoff = time.time() - self.lease_seconds
+        with self._lock:
+            self._conn.execute("DELETE FROM replicas WHERE seen_at < ?", (cutoff,))
+            rows = self._conn.execute("SELECT name FROM replicas ORDER BY name").fetchall()
+        return [row["name"] for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM work_items GROUP BY status").fetchall())
+        return {"backend": "sqlite", "path": self.path, "items_by_status": counts}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Redis scripts, so each state change is atomic; `prefix` namespaces the keys
+_ENQUEUE = """
+local prefix, key, id, route = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local existing = redis.call('GET', prefix .. 'key:' .. key)
+if existing then
+  local status = redis.call('HGET', prefix .. 'item:' .. existing, 'status')
+  if status == 'queued' or status == 'running' then
+    return {existing, 0}
+  end
+end
+redis.call('HSET', prefix .. 'item:' .. id, unpack(ARGV, 5))
+redis.call('SET', prefix .. 'key:' .. key, id)
+redis.call('LPUSH', prefix .. 'queue:' .. route, id)
+redis.call('SADD', prefix .. 'routes', route)
+return {id, 1}
+"""
+
+_CLAIM = """
+local prefix, owner, now, lease_until, steal_before = ARGV[1], ARGV[2], ARGV[3], ARGV[4], tonumber(ARGV[5])
+local live = {}
+for i = 6, #ARGV do
+  live[ARGV[i]] = true
+end
+
+-- Pops the oldest item of a route's list if it is queued and, unless `any_age`, has waited long
+-- enough; cancelled items stay in the lists until they are dropped here
+local function pop(route, any_age)
+  local list = prefix .. 'queue:' .. route
+  while true do
+    local id = redis.call('LINDEX', list, -1)
+    if not id then
+      redis.call('SREM', prefix .. 'routes', route)
+      return nil
+    end
+    local item = prefix .. 'item:' .. id
+    if redis.call('HGET', item, 'status') ~= 'queued' then
+      redis.call('RPOP', list)
+    elseif any_age or tonumber(redis.call('HGET', item, 'created_at')) < steal_before then
+      redis.call('RPOP', list)
+      return id
+    else
+      return nil
+    end
+  end
+end
+
+local id = pop(owner, true)
+if not id then
+  for _, route in ipairs(redis.call('SMEMBERS', prefix .. 'routes')) do
+    if route ~= owner then
+      id = pop(route, not live[route])
+      if id then
+        break
+      end
+    end
+  end
+end
+if not id then
+  return false
+end
+local item = prefix .. 'item:' .. id
+redis.call('HSET', item, 'status', 'running', 'owner', owner, 'started_at', now, 'lease_until', lease_until)
+redis.call('HINCRBY', item, 'attempts', 1)
+redis.call('ZADD', prefix .. 'running', lease_until, id)
+return id
+"""
+
+_HEARTBEAT = """
+local prefix, id, owner, lease_until = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local item = prefix .. 'item:' .. id
+if redis.call('HGET', item, 'status') ~= 'running' or redis.call('HGET', item, 'owner') ~= owner then
+  return 0
+end
+redis.call('HSET', item, 'lease_until', lease_until)
+redis.call('ZADD', prefix .. 'running', lease_until, id)
+return 1
+"""
+
+# Moves a running item held by ARGV[3] (or any item in ARGV[4]'s states if ARGV[3] is empty) to a
+# finished state with the fields in ARGV[6:], and keeps it for ARGV[5] seconds
+_FINISH = """
+local prefix, id, owner, states, ttl = ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5]
+local item = prefix .. 'item:' .. id
+local status = redis.call('HGET', item, 'status')
+if not status or not string.find(',' .. states .. ',', ',' .. status .. ',', 1, true) then
+  return 0
+end
+if owner ~= '' and redis.call('HGET', item, 'owner') ~= owner then
+  return 0
+end
+redis.call('HSET', item, unpack(ARGV, 6))
+redis.call('HDEL', item, 'lease_until')
+redis.call('ZREM', prefix .. 'running', id)
+local key = prefix .. 'key:' .. redis.call('HGET', item, 'key')
+if redis.call('GET', key) == id then
+  redis.call('DEL', key)
+end
+redis.call('EXPIRE', item, ttl)
+return 1
+"""
+
+# Requeues an item held by ARGV[3]; with ARGV[4] set the attempt counts and the item loses its route
+_RELEASE = """
+local prefix, id, owner, retry = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local item = prefix .. 'item:' .. id
+if redis.call('HGET', item, 'status') ~= 'running' or redis.call('HGET', item, 'owner') ~= owner then
+  return 0
+end
+redis.call('HSET', item, 'status', 'queued')
+redis.call('HDEL', item, 'owner', 'lease_until', 'started_at')
+redis.call('ZREM', prefix .. 'running', id)
+local route = ''
+if retry == '1' then
+  redis.call('HSET', item, 'route', '')
+else
+  redis.call('HINCRBY', item, 'attempts', -1)
+  route = redis.call('HGET', item, 'route') or ''
+end
+redis.call('RPUSH', prefix .. 'queue:' .. route, id)
+redis.call('SADD', prefix .. 'routes', route)
+return 1
+"""
+
+_REQUEUE_EXPIRED = """
+local prefix, now, max_attempts, ttl = ARGV[1], ARGV[2], tonumber(ARGV[3]), ARGV[4]
+local expired = {}
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', prefix .. 'running', '-inf', now)) do
+  local item = prefix .. 'item:' .. id
+  redis.call('ZREM', prefix .. 'running', id)
+  if redis.call('HGET', item, 'status') == 'running' then
+    local owner = redis.call('HGET', item, 'owner') or ''
+    if tonumber(redis.call('HGET', item, 'attempts') or '0') >= max_attempts then
+      redis.call('HSET', item, 'status', 'failed', 'finished_at', now, 'error', ARGV[5] .. owner .. ARGV[6])
+      redis.call('HDEL', item, 'lease_until')
+      local key = prefix .. 'key:' .. redis.call('HGET', item, 'key')
+      if redis.call('GET', key) == id then
+        redis.call('DEL', key)
+      end
+      redis.call('EXPIRE', item, ttl)
+    else
+      redis.call('HSET', item, 'status', 'queued')
+      redis.call('HDEL', item, 'owner', 'lease_until')
+      local route = redis.call('HGET', item, 'route') or ''
+      redis.call('RPUSH', prefix .. 'queue:' .. route, id)
+      redis.call('SADD', prefix .. 'routes', route)
+    end
+    table.insert(expired, id)
+    table.insert(expired, owner)
+  end
+end
+return expired
+"""
+
+
+class RedisWorkQueue(WorkQueue):
+    """
+    Work queue in Redis, or a server speaking its protocol, for replicas on several hosts.
+
+    Each item is a hash; queued item IDs are a list per route (the empty route for unrouted
+    items), running ones a sorted set scored by lease expiry, and a key per PR command points
+    at its unfinished item. Replicas are a sorted set scored by when they last registered. State changes
+    are Lua scripts, so they are atomic. Needs the `redis` package.
+    """
+
+    def __init__(self, url: str, prefix: str = "pr_agent:work:", **options: Any):
+        super().__init__(**options)
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("WORK_QUEUE_URL points to Redis, which needs the redis package "
+                               "(pip install redis)") from e
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._scripts = {
+            name: self._redis.register_script(source)
+            for name, source in (("enqueue", _ENQUEUE), ("claim", _CLAIM), ("heartbeat", _HEARTBEAT),
+                                 ("finish", _FINISH), ("release", _RELEASE), ("requeue_expired", _REQUEUE_EXPIRED))
+        }
+
+    def _call(self, script: str, *args: Any) -> Any:
+        return self._scripts[script](args=[self.prefix, *args])
+
+    def enqueue(self, key: str, command: str, pr_url: str, overrides: Optional[Dict[str, Any]] = None,
+                head_sha: Optional[str] = None, route: Optional[str] = None) -> Tuple[WorkItem, bool]:
+        item = WorkItem(id=uuid.uuid4().hex, key=key, command=command, pr_url=pr_url, overrides=overrides,
+                        head_sha=head_sha, route=route)
+        fields = {"id": item.id, "key": key, "command": command, "pr_url": pr_url,
+                  "overrides": json.dumps(overrides) if overrides else "", "head_sha": head_sha or "",
+                  "route": route or "", "status": QUEUED, "attempts": 0, "created_at": item.created_at}
+        item_id, created = self._call("enqueue", key, item.id, route or "",
+                                      *(part for pair in fields.items() for part in pair))
+        if created:
+            return item, True
+        existing = self.get(item_id)
+        # The existing item may have finished in the meantime; it is still the answer to this call
+        return existing if existing is not None else item, False
+
+    def claim(self, owner: str, replicas: Sequence[str] = (), steal_after: float = 0) -> Optional[WorkItem]:
+        now = time.time()
+        item_id = self._call("claim", owner, now, now + self.lease_seconds, now - steal_after, *replicas)
+        return self.get(item_id) if item_id else None
+
+    def heartbeat(self, item_id: str, owner: str) -> bool:
+        return bool(self._call("heartbeat", item_id, owner, time.time() + self.lease_seconds))
+
+    def finish(self, item_id: str, owner: str, status: str, result: Optional[str] = None,
+               error: Optional[str] = None) -> bool:
+        fields = ["status", status, "finished_at", time.time()]
+        if result is not None:
+            fields += ["result", result]
+        if error is not None:
+            fields += ["error", error]
+        return bool(self._call("finish", item_id, owner, RUNNING, int(self.retention_seconds), *fields))
+
+    def release(self, item_id: str, owner: str, retry: bool = False) -> bool:
+        return bool(self._call("release", item_id, owner, "1" if retry else ""))
+
+    def cancel(self, item_id: str) -> Optional[WorkItem]:
+        self._call("finish", item_id, "", f"{QUEUED},{RUNNING}", int(self.retention_seconds),
+                   "status", CANCELLED, "finished_at", time.time())
+        return self.get(item_id)
+
+    def get(self, item_id: str) -> Optional[WorkItem]:
+        row = self._redis.hgetall(f"{self.prefix}item:{item_id}")
+        return WorkItem.from_row(row) if row else None
+
+    def maintain(self) -> Dict[str, int]:
+        # The failure message is split around the owner, which only the script knows
+        before, after = self._abandoned_error("\0").split("\0")
+        expired = self._call("requeue_expired", time.time(), self.max_attempts, int(self.retention_seconds),
+                             before, after)
+        for item_id, owner in zip(expired[::2], expired[1::2]):
+            logger.warning(f"Lease of work item {item_id} held by {owner} expired")
+        return self._depth()
+
+    def _depth(self) -> Dict[str, int]:
+        routes = self._redis.smembers(f"{self.prefix}routes")
+        pipeline = self._redis.pipeline(transaction=False)
+        for route in routes:
+            pipeline.llen(f"{self.prefix}queue:{route}")
+        # Counts cancelled items that have not been popped yet
+        return {QUEUED: sum(pipeline.execute()) if routes else 0, RUNNING: self._redis.zcard(f"{self.prefix}running")}
+
+    def register(self, replica: str) -> None:
+        self._redis.zadd(f"{self.prefix}replicas", {replica: time.time()})
+
+    def unregister(self, replica: str) -> None:
+        self._redis.zrem(f"{self.prefix}replicas", replica)
+
+    def replicas(self) -> List[str]:
+        key = f"{self.prefix}replicas"
+        self._redis.zremrangebyscore(key, "-inf", time.time() - self.lease_seconds)
+        return sorted(self._redis.zrange(key, 0, -1))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "prefix": self.prefix, "items_by_status": self._depth()}
+
+    def close(self) -> None:
+        self._redis.close()
+
+
+class QueueConsumers:
+    """
+    Takes work items from the shared queue and runs them in this replica.
+
+    `consumers` tasks each claim an item when the previous one has finished, so a busy
+    replica leaves work to idle ones. While an item runs its lease is renewed every third
+    of the lease time; if the renewal fails, because the item was cancelled or another
+    replica took it over, the run is stopped. A renewal that cannot reach the queue is
+    retried until the lease has run out. On shutdown running items are released back
+    to the queue for other replicas. Items that fail with one of the `retry_on` errors,
+    which mean this replica could not run them, go back to the queue for any replica until
+    they have used up their attempts.
+
+    Every half lease the replica registers itself in the queue and refreshes `router`'s
+    ring from the replicas registered there, so claims prefer the items routed to it.
+    """
+
+    def __init__(self, queue: WorkQueue, consumers: int = 4, replica: Optional[str] = None,
+                 router: Optional[Router] = None, retry_on: Tuple[Type[BaseException], ...] = ()):
+        self.queue = queue
+        self.router = router
+        self.retry_on = retry_on
+        self._run: Optional[Callable[[WorkItem], Awaitable[Any]]] = None
+        self.consumers = consumers
+        self.replica = replica or default_replica()
+        self._tasks: List[asyncio.Task] = []
+        self._last_maintenance = 0.0
+        self.depth: Dict[str, int] = {QUEUED: 0, RUNNING: 0}
+        self.replicas: List[str] = []
+
+        self.running = 0
+        self.claimed = 0
+        self.claimed_routed_here = 0
+        self.claimed_from_others = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.released = 0
+        self.retried = 0
+
+    @classmethod
+    def from_env(cls, queue: WorkQueue, router: Optional[Router] = None,
+                 retry_on: Tuple[Type[BaseException], ...] = ()) -> "QueueConsumers":
+        return cls(
+            queue,
+            consumers=int(os.getenv("WORK_QUEUE_CONSUMERS", "4")),
+            replica=os.getenv("WORK_QUEUE_REPLICA") or None,
+            router=router,
+            retry_on=retry_on,
+        )
+
+    def start(self, run: Callable[[WorkItem], Awaitable[Any]]) -> None:
+        """Start taking work; `run` executes an item's command and returns its output."""
+        self._run = run
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._consume(i)) for i in range(self.consumers)]
+            logger.info(f"Taking work from the shared queue as {self.replica} with {self.consumers} consumers")
+
+    async def _maintain_if_due(self) -> None:
+        if time.monotonic() - self._last_maintenance < self.queue.lease_seconds / 2:
+            return
+        self._last_maintenance = time.monotonic()
+        await asyncio.to_thread(self.queue.register, self.replica)
+        self.replicas = await asyncio.to_thread(self.queue.replicas)
+        if self.router is not None:
+            self.router.refresh(self.replicas)
+        self.depth = await asyncio.to_thread(self.queue.maintain)
+
+    def _steal_after(self) -> float:
+        return self.router.steal_after if self.router is not None and self.router.enabled else 0
+
+    async def _consume(self, index: int) -> None:
+        while True:
+            try:
+                await self._maintain_if_due()
+                item = await asyncio.to_thread(self.queue.claim, self.replica, self.replicas, self._steal_after())
+            except Exception as e:
+                logger.error(f"Queue consumer {index} could not reach the work queue: {e}")
+                item = None
+            if item is None:
+                await asyncio.sleep(self.queue.poll_interval)
+                continue
+            self.claimed += 1
+            if item.route == self.replica:
+                self.claimed_routed_here += 1
+            elif item.route is not None:
+                self.claimed_from_others += 1
+            try:
+                await self._execute(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Queue consumer {index} failed on work item {item.id}: {e}")
+
+    async def _execute(self, item: WorkItem) -> None:
+        logger.info(f"Running work item {item.id} ({item.command} {item.pr_url}), attempt {item.attempts}")
+        self.running += 1
+        task = asyncio.create_task(self._run(item))
+        renewed = time.monotonic()
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=self.queue.lease_seconds / 3)
+                if task.done():
+                    break
+                try:
+                    held = await asyncio.to_thread(self.queue.heartbeat, item.id, self.replica)
+                except Exception as e:
+                    # The lease is still ours until it runs out; the next heartbeat may get through
+                    if time.monotonic() - renewed < self.queue.lease_seconds:
+                        logger.warning(f"Could not renew the lease of work item {item.id}, retrying: {e}")
+                        continue
+                    logger.error(f"Lost the lease of work item {item.id}, stopping it: {e}")
+                else:
+                    if held:
+                        renewed = time.monotonic()
+                        continue
+                    logger.info(f"Work item {item.id} was cancelled or taken over, stopping it")
+                task.cancel()
+                await asyncio.wait({task})
+        except asyncio.CancelledError:
+            # This replica is shutting down; another one picks the item up straight away
+            task.cancel()
+            try:
+                if self.queue.release(item.id, self.replica):
+                    self.released += 1
+            except Exception as e:
+                logger.warning(f"Could not release work item {item.id}, it is queued again once its lease expires: {e}")
+            raise
+        finally:
+            # Never leave the command running once this consumer moves on
+            if not task.done():
+                task.cancel()
+                await asyncio.wait({task})
+            self.running -= 1
+
+        if task.cancelled():
+            self.cancelled += 1
+            return
+        error = task.exception()
+        if error is None:
+            result = task.result()
+            self.completed += 1
+            await asyncio.to_thread(self.queue.finish, item.id, self.replica, SUCCEEDED,
+                                    str(result) if result else None)
+        elif isinstance(error, self.retry_on) and item.attempts < self.queue.max_attempts:
+            logger.warning(f"Work item {item.id} ({item.command} {item.pr_url}) could not run on this replica, "
+                           f"queueing it for another one: {error}")
+            self.retried += 1
+            await asyncio.to_thread(self.queue.release, item.id, self.replica, True)
+            # Give the other replicas the first chance to claim it
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+        else:
+            logger.error(f"Work item {item.id} ({item.command} {item.pr_url}) failed: {error}")
+            self.failed += 1
+            await asyncio.to_thread(self.queue.finish, item.id, self.replica, FAILED, None,
+                                    str(error) or type(error).__name__)
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Let the other replicas take over this one's share of the ring straight away
+        try:
+            await asyncio.to_thread(self.queue.unregister, self.replica)
+        except Exception as e:
+            logger.warning(f"Could not remove {self.replica} from the work queue's replicas: {e}")
+        await asyncio.to_thread(self.queue.close)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "replica": self.replica,
+            "consumers": self.consumers,
+            "running": self.running,
+            "claimed": self.claimed,
+            "claimed_routed_here": self.claimed_routed_here,
+            "claimed_from_others": self.claimed_from_others,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "released": self.released,
+            "retried": self.retried,
+            "queue_depth": dict(self.depth),
+        }
@@ -0,0 +1,449 @@
+"""
+Worker processes that run PR-Agent commands for the server.
+
+In worker mode the server process only speaks MCP; `/review` and `/describe` runs go to
+worker processes started as `python workers.py`, each with its own event loop, agent pool
+and agent threads, so diff processing, token counting and rendering use all cores.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pr_agent.log import get_logger
+
+from metrics import worker_recycles
+from runner import CommandRun, load, run_commands
+
+logger = get_logger()
+
+# Seconds a retiring worker gets to exit after its last job before it is killed
+STOP_TIMEOUT = 10
+
+# Seconds to wait for a worker to answer a request for its LLM limits
+CONTROL_TIMEOUT = 10
+
+
+class WorkerError(Exception):
+    """Raised when a worker process dies or fails to start while it holds a job."""
+
+
+def _rss_bytes() -> int:
+    """Resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        import resource
+
+        # Peak rather than current size, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _Worker:
+    """The server's handle on one worker process."""
+
+    def __init__(self, index: int, process: subprocess.Popen, conn: Connection):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.pending: Dict[int, asyncio.Future] = {}
+        # Answers awaited to requests other than jobs, e.g. for the LLM limits
+        self.requests: Dict[int, asyncio.Future] = {}
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.send_lock = threading.Lock()
+        self.jobs = 0
+        self.rss = 0
+        self.retiring = False
+        self.started_at = time.monotonic()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.pending)
+
+    def send(self, message: Any) -> None:
+        with self.send_lock:
+            self.conn.send(message)
+
+
+class WorkerPool:
+    """
+    Runs PR-Agent commands in a fixed number of worker processes.
+
+    `run()` sends a job to the ready worker with the fewest jobs in flight; each worker takes
+    up to `jobs_per_process` at once and further jobs wait in a FIFO queue for a slot. A
+    worker is retired after `max_jobs` jobs, or once its resident memory exceeds
+    `max_rss_mb`: it gets no new jobs, a replacement is started, and it exits when its jobs
+    have finished. A worker that dies fails the jobs it held and is replaced. Cancelling
+    `run()` cancels the job in its worker too.
+
+    Worker processes read the same environment as the server. Each gets an equal share of
+    the LLM token budgets; progress stages and streamed model output are not forwarded.
+    `llm_limits()` changes the LLM limits of every worker, including workers started later,
+    and returns each worker's limits.
+    """
+
+    def __init__(self, processes: int, jobs_per_process: int = 4, max_jobs: int = 0, max_rss_mb: float = 0,
+                 start_timeout: float = 300):
+        if processes < 1:
+            raise ValueError(f"Worker mode needs at least 1 process, got {processes}")
+        self.processes = processes
+        self.jobs_per_process = jobs_per_process
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.start_timeout = start_timeout
+        self._workers: List[_Worker] = []
+        self._job_ids = itertools.count(1)
+        self._slot_free: Optional[asyncio.Condition] = None
+        self._started = False
+        self._closing = False
+        # Changes made with `llm_limits()`, replayed on workers that start later
+        self._limit_changes: List[Tuple[str, float, float, int]] = []
+
+        self.waiting = 0
+        self.dispatched = 0
+        self.cancelled = 0
+        self.recycled: Dict[str, int] = {"max_jobs": 0, "rss": 0, "crashed": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["WorkerPool"]:
+        """The pool configured by `WORKER_PROCESSES` (`auto` for one per core), or None for in-process runs."""
+        value = os.getenv("WORKER_PROCESSES", "0").strip().lower()
+        processes = (os.cpu_count() or 1) if value == "auto" else int(value or 0)
+        if processes <= 0:
+            return None
+        return cls(
+            processes=processes,
+            jobs_per_process=int(os.getenv("WORKER_JOBS_PER_PROCESS", "4")),
+            max_jobs=int(os.getenv("WORKER_MAX_JOBS", "200")),
+            max_rss_mb=float(os.getenv("WORKER_MAX_RSS_MB", "2048")),
+            start_timeout=float(os.getenv("WORKER_START_TIMEOUT", "300")),
+        )
+
+    def _condition(self) -> asyncio.Condition:
+        if self._slot_free is None:
+            self._slot_free = asyncio.Condition()
+        return self._slot_free
+
+    def _spawn(self, index: int) -> _Worker:
+        parent, child = socket.socketpair()
+        try:
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--fd", str(child.fileno()),
+                 "--share", str(self.processes)],
+                pass_fds=[child.fileno()],
+            )
+        finally:
+            child.close()
+        worker = _Worker(index, process, Connection(parent.detach()))
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=self._read, args=(worker, loop), name=f"worker-reader-{index}", daemon=True).start()
+        logger.info(f"Started worker {index} (pid {process.pid})")
+        return worker
+
+    def _read(self, worker: _Worker, loop: asyncio.AbstractEventLoop) -> None:
+        """Hand the worker's messages to the event loop until its connection closes."""
+        while True:
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                loop.call_soon_threadsafe(self._on_exit, worker)
+                return
+            loop.call_soon_threadsafe(self._on_message, worker, message)
+
+    def _on_message(self, worker: _Worker, message: Any) -> None:
+        kind = message[0]
+        if kind == "ready":
+            if not worker.ready.done():
+                worker.ready.set_result(time.monotonic() - worker.started_at)
+            for change in self._limit_changes:
+                self._send_limits(worker, next(self._job_ids), change)
+            asyncio.ensure_future(self._notify())
+            return
+        if kind == "answer":
+            _, request_id, payload = message
+            future = worker.requests.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_result(payload)
+            return
+        _, job_id, payload, rss = message
+        worker.rss = rss
+        future = worker.pending.pop(job_id, None)
+        if future is not None and not future.done():
+            if kind == "done":
+                future.set_result(payload)
+            else:
+                future.set_exception(WorkerError(payload))
+        if self.max_rss_mb and rss > self.max_rss_mb * 1024 * 1024 and not worker.retiring:
+            logger.info(f"Worker {worker.index} uses {rss / 2 ** 20:.0f} MiB, replacing it")
+            self._retire(worker, "rss")
+        elif worker.retiring and not worker.pending:
+            asyncio.ensure_future(self._stop(worker))
+        asyncio.ensure_future(self._notify())
+
+    def _on_exit(self, worker: _Worker) -> None:
+        code = worker.process.poll()
+        error = WorkerError(f"Worker process {worker.process.pid} exited" + (f" with code {code}" if code else ""))
+        for future in [*worker.pending.values(), *worker.requests.values()]:
+            if not future.done():
+                future.set_exception(error)
+        worker.pending.clear()
+        worker.requests.clear()
+        if not worker.ready.done():
+            worker.ready.set_exception(error)
+        if worker in self._workers and not self._closing:
+            self.recycled["crashed"] += 1
+            worker_recycles.inc(reason="crashed")
+            if worker.ready.exception() is None:
+                logger.error(f"Worker {worker.index} exited unexpectedly, starting a new one")
+                self._workers[self._workers.index(worker)] = self._spawn(worker.index)
+            else:
+                # Replacing a worker that cannot start would only fail the same way again
+                logger.error(f"Worker {worker.index} exited during startup, not replacing it")
+                self._workers.remove(worker)
+        asyncio.ensure_future(self._notify())
+
+    def _retire(self, worker: _Worker, reason: str) -> None:
+        """Stop giving `worker` jobs, start its replacement and stop it once its jobs are done."""
+        worker.retiring = True
+        self.recycled[reason] += 1
+        worker_recycles.inc(reason=reason)
+        self._workers[self._workers.index(worker)] = self._spawn(worker.index)
+        if not worker.pending:
+            asyncio.ensure_future(self._stop(worker))
+
+    async def _stop(self, worker: _Worker) -> None:
+        try:
+            worker.send(("stop",))
+        except OSError:
+            pass
+        try:
+            await asyncio.to_thread(worker.process.wait, STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Worker process {worker.process.pid} did not stop, killing it")
+            worker.process.kill()
+            await asyncio.to_thread(worker.process.wait)
+        worker.conn.close()
+
+    async def _notify(self) -> None:
+        async with self._condition():
+            self._condition().notify_all()
+
+    async def start(self) -> None:
+        """Start the worker processes and wait until each has loaded PR-Agent."""
+        if not self._started:
+            self._started = True
+            self._workers = [self._spawn(index) for index in range(self.processes)]
+        # Shielded so that a caller giving up does not cancel the workers' readiness
+        results = await asyncio.wait_for(asyncio.gather(*(asyncio.shield(worker.ready) for worker in self._workers),
+                                                        return_exceptions=True), self.start_timeout)
+        failed = [result for result in results if isinstance(result, BaseException)]
+        if failed or not results:
+            raise WorkerError(f"{len(failed) or self.processes} of {self.processes} workers failed to start"
+                              + (f": {failed[0]}" if failed else ""))
+        logger.info(f"{self.processes} workers ready, slowest after {max(results):.1f}s")
+
+    def _pick(self) -> Optional[_Worker]:
+        candidates = [worker for worker in self._workers
+                      if worker.ready.done() and not worker.ready.exception() and not worker.retiring
+                      and worker.in_flight < self.jobs_per_process]
+        return min(candidates, key=lambda worker: worker.in_flight, default=None)
+
+    async def run(self, pr_url: str, commands: Sequence[str], overrides: Optional[Dict[str, Any]] = None,
+                  head_sha: Optional[str] = None, since_sha: Optional[str] = None) -> List[CommandRun]:
+        """Run the commands on a worker; same arguments and result as `runner.run_commands`."""
+        if not self._started:
+            await self.start()
+        condition = self._condition()
+        self.waiting += 1
+        try:
+            async with condition:
+                await condition.wait_for(lambda: self._pick() is not None or not self._workers)
+                worker = self._pick()
+                if worker is None:
+                    raise WorkerError("No worker process is running")
+                job_id = next(self._job_ids)
+                future = asyncio.get_running_loop().create_future()
+                worker.pending[job_id] = future
+                worker.jobs += 1
+        finally:
+            self.waiting -= 1
+        self.dispatched += 1
+        try:
+            await asyncio.to_thread(worker.send, ("run", job_id, pr_url, list(commands), dict(overrides or {}),
+                                                  head_sha, since_sha))
+        except OSError as e:
+            worker.pending.pop(job_id, None)
+            raise WorkerError(f"Could not send the job to worker {worker.index}: {e}")
+        if self.max_jobs and worker.jobs >= self.max_jobs and not worker.retiring:
+            logger.info(f"Worker {worker.index} ran {worker.jobs} jobs, replacing it")
+            self._retire(worker, "max_jobs")
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Stop the job in the worker too; its "cancelled" answer then finds no pending future
+            if worker.pending.pop(job_id, None) is not None:
+                self.cancelled += 1
+                try:
+                    worker.send(("cancel", job_id))
+                except OSError:
+                    pass
+            raise
+
+    def _send_limits(self, worker: _Worker, request_id: int, change: Tuple[str, float, float, int]) -> bool:
+        try:
+            worker.send(("limits", request_id, *change))
+            return True
+        except OSError as e:
+            logger.warning(f"Could not send the LLM limits to worker {worker.index}: {e}")
+            return False
+
+    async def llm_limits(self, deployment: str = "", limit: float = 0, max_limit: float = 0,
+                         tokens_per_minute: int = 0) -> List[Dict[str, Any]]:
+        """
+        Apply a `manage_llm_limits` change in every worker and return each worker's LLM limits.
+
+        An empty `deployment` only reads the limits. Concurrency limits apply per worker, like
+        `LLM_CONCURRENCY_*`; a `tokens_per_minute` quota is split between the workers, like
+        `LLM_TPM_LIMIT(S)`.
+        """
+        change = (deployment, limit, max_limit, tokens_per_minute)
+        if deployment and (limit > 0 or max_limit > 0 or tokens_per_minute > 0):
+            self._limit_changes.append(change)
+        loop = asyncio.get_running_loop()
+        requests = []
+        for worker in self._workers:
+            if not worker.ready.done() or worker.ready.exception() is not None:
+                continue
+            request_id = next(self._job_ids)
+            future = loop.create_future()
+            worker.requests[request_id] = future
+            if not self._send_limits(worker, request_id, change):
+                worker.requests.pop(request_id, None)
+                future.set_exception(WorkerError(f"Worker {worker.index} is not reachable"))
+            requests.append((worker, future))
+        answers = []
+        for worker, future in requests:
+            try:
+                limits = await asyncio.wait_for(future, CONTROL_TIMEOUT)
+                answers.append({"index": worker.index, "pid": worker.process.pid, "limits": limits})
+            except (asyncio.TimeoutError, WorkerError) as e:
+                answers.append({"index": worker.index, "pid": worker.process.pid,
+                                "error": str(e) or "no answer"})
+        return answers
+
+    async def close(self) -> None:
+        self._closing = True
+        await asyncio.gather(*(self._stop(worker) for worker in self._workers), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processes": self.processes,
+            "jobs_per_process": self.jobs_per_process,
+            "waiting": self.waiting,
+            "dispatched": self.dispatched,
+            "cancelled": self.cancelled,
+            "recycled": dict(self.recycled),
+            "workers": [{
+                "index": worker.index,
+                "pid": worker.process.pid,
+                "ready": worker.ready.done() and not worker.ready.exception(),
+                "jobs": worker.jobs,
+                "in_flight": worker.in_flight,
+                "rss_mb": round(worker.rss / 2 ** 20, 1),
+            } for worker in self._workers],
+        }
+
+
+async def _serve_jobs(conn: Connection, share: int) -> None:
+    """Worker side: load PR-Agent, then run jobs from `conn` until told to stop."""
+    from agent_pool import AgentPool
+    from executors import agent_loops, install_blocking_executor
+    from http_clients import http_clients
+    from llm_limits import llm_limits
+    from warmup import load_tokenizer
+
+    install_blocking_executor(asyncio.get_running_loop())
+    agent_loops.start()
+    llm_limits.split_budget(share)
+    await asyncio.to_thread(load)
+    pool = AgentPool()
+    await pool.fill()
+    try:
+        await asyncio.to_thread(load_tokenizer)
+    except Exception as e:
+        logger.warning(f"Could not load the tokenizer in worker {os.getpid()}: {e}")
+
+    send_lock = threading.Lock()
+
+    def send(message: Any) -> None:
+        with send_lock:
+            conn.send(message)
+
+    async def run_job(job_id: int, pr_url: str, commands: List[str], overrides: Dict[str, Any],
+                      head_sha: Optional[str], since_sha: Optional[str]) -> None:
+        try:
+            runs = await run_commands(pool, pr_url, commands, overrides, head_sha, since_sha)
+            message = ("done", job_id, runs, _rss_bytes())
+        except asyncio.CancelledError:
+            message = ("cancelled", job_id, None, _rss_bytes())
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed in worker {os.getpid()}")
+            message = ("failed", job_id, str(e) or type(e).__name__, _rss_bytes())
+        await asyncio.to_thread(send, message)
+
+    await asyncio.to_thread(send, ("ready", os.getpid()))
+    tasks: Dict[int, asyncio.Task] = {}
+    try:
+        while True:
+            try:
+                message = await asyncio.to_thread(conn.recv)
+            except (EOFError, OSError):
+                break  # The server went away
+            if message[0] == "stop":
+                break
+            if message[0] == "cancel":
+                task = tasks.get(message[1])
+                if task is not None:
+                    task.cancel()
+                continue
+            if message[0] == "limits":
+                _, request_id, deployment, limit, max_limit, tokens_per_minute = message
+                if deployment:
+                    llm_limits.configure(deployment, limit, max_limit,
+                                         max(1, tokens_per_minute // share) if tokens_per_minute else 0)
+                await asyncio.to_thread(send, ("answer", request_id, llm_limits.stats()))
+                continue
+            job_id = message[1]
+            task = asyncio.create_task(run_job(*message[1:]))
+            tasks[job_id] = task
+            task.add_done_callback(lambda _, job_id=job_id: tasks.pop(job_id, None))
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+    finally:
+        await http_clients.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PR-Agent worker process, started by the server")
+    parser.add_argument("--fd", type=int, required=True, help="File descriptor of the connection to the server")
+    parser.add_argument("--share", type=int, default=1, help="Number of workers sharing the LLM token budgets")
+    args = parser.parse_args()
+
+    from pr_agent.log import setup_logger
+
+    from settings_overlay import apply_env_settings
+
+    setup_logger()
+    apply_env_settings()
+    asyncio.run(_serve_jobs(Connection(args.fd), args.share))
+
+
+if __name__ == "__main__":
+    main()